@@ -5,8 +5,8 @@ from core.config import config as app_config
 from core.database import Base
 from apps.auth.models import User
 from apps.news.models import News
-from apps.recipes.models import Recipe, RecipeIngredient, Ingredient
-from apps.meal_planner.models import MealPlan, ExcludedIngredient
+from apps.recipes.models import Recipe, RecipeIngredient, Ingredient, IngredientCategory, IngredientCategoryClosure
+from apps.meal_planner.models import MealPlan, MealPlanEntry, ExcludedIngredient
 
 # Целевые метаданные
 target_metadata = Base.metadata
@@ -0,0 +1,34 @@
+"""news created_at id index
+
+Revision ID: 0a6d3e8f9c21
+Revises: f1c7a92e6b30
+Create Date: 2026-10-17 19:02:13.551902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a6d3e8f9c21'
+down_revision: Union[str, None] = 'f1c7a92e6b30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Строки с NULL в created_at выпадали бы из выборки по курсору (created_at, id) < (...):
+    # заполняем их и запрещаем NULL
+    op.execute("UPDATE news SET created_at = COALESCE(updated_at, now()) WHERE created_at IS NULL")
+    op.alter_column('news', 'created_at', existing_type=sa.DateTime(), nullable=False, server_default=sa.func.now())
+    # Индекс мог быть уже создан через Base.metadata.create_all при старте приложения
+    op.execute("CREATE INDEX IF NOT EXISTS ix_news_created_at_id ON news (created_at, id)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_news_created_at_id', table_name='news')
+    op.alter_column('news', 'created_at', existing_type=sa.DateTime(), nullable=True, server_default=None)
@@ -0,0 +1,38 @@
+"""meal planner candidate indexes
+
+Revision ID: 4c2f9a1d7e3b
+Revises: 
+Create Date: 2026-10-17 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c2f9a1d7e3b'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_recipe_ingredients_recipe_id_ingredient_id', 'recipe_ingredients',
+                    ['recipe_id', 'ingredient_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_recipe_meal_types_meal_type_id_recipe_id', 'recipe_meal_types',
+                    ['meal_type_id', 'recipe_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_excluded_ingredients_user_id_ingredient_id', 'excluded_ingredients',
+                    ['user_id', 'ingredient_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_recipes_user_id_id', 'recipes', ['user_id', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_recipes_is_public_id', 'recipes', ['is_public', 'id'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recipes_is_public_id', table_name='recipes', if_exists=True)
+    op.drop_index('ix_recipes_user_id_id', table_name='recipes', if_exists=True)
+    op.drop_index('ix_excluded_ingredients_user_id_ingredient_id', table_name='excluded_ingredients', if_exists=True)
+    op.drop_index('ix_recipe_meal_types_meal_type_id_recipe_id', table_name='recipe_meal_types', if_exists=True)
+    op.drop_index('ix_recipe_ingredients_recipe_id_ingredient_id', table_name='recipe_ingredients', if_exists=True)
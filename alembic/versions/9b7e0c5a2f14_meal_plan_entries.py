@@ -0,0 +1,80 @@
+"""meal plan entries
+
+Revision ID: 9b7e0c5a2f14
+Revises: 4c2f9a1d7e3b
+Create Date: 2026-10-17 12:40:05.902117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b7e0c5a2f14'
+down_revision: Union[str, None] = '4c2f9a1d7e3b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    # Таблица могла быть уже создана через Base.metadata.create_all при старте приложения
+    if not inspector.has_table('meal_plan_entries'):
+        op.create_table(
+            'meal_plan_entries',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('date', sa.Date(), nullable=False),
+            sa.Column('meal_type_id', sa.Integer(), nullable=False),
+            sa.Column('recipe_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.ForeignKeyConstraint(['meal_type_id'], ['meal_types.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['recipe_id'], ['recipes.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(op.f('ix_meal_plan_entries_id'), 'meal_plan_entries', ['id'], unique=False)
+        op.create_index('ux_meal_plan_entries_user_id_date_meal_type_id', 'meal_plan_entries',
+                        ['user_id', 'date', 'meal_type_id'], unique=True, postgresql_include=['recipe_id'])
+
+    # В базе, созданной через create_all по новым моделям, колонки plan уже нет — переносить нечего
+    if 'plan' in {column['name'] for column in inspector.get_columns('meal_plans')}:
+        # Переносим ячейки из JSON вида {"YYYY-MM-DD": {"meal_type_id": recipe_id}}.
+        # Ячейки с удаленными рецептами или типами блюд пропускаются.
+        op.execute("""
+            INSERT INTO meal_plan_entries (user_id, date, meal_type_id, recipe_id)
+            SELECT mp.user_id, day.key::date, cell.key::integer, (cell.value #>> '{}')::integer
+            FROM meal_plans mp
+            CROSS JOIN LATERAL json_each(mp.plan) AS day
+            CROSS JOIN LATERAL json_each(day.value) AS cell
+            JOIN recipes r ON r.id = (cell.value #>> '{}')::integer
+            JOIN meal_types mt ON mt.id = cell.key::integer
+            WHERE json_typeof(mp.plan) = 'object'
+              AND json_typeof(day.value) = 'object'
+              AND json_typeof(cell.value) = 'number'
+            ON CONFLICT (user_id, date, meal_type_id) DO UPDATE SET recipe_id = EXCLUDED.recipe_id
+        """)
+        op.drop_column('meal_plans', 'plan')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('meal_plans', sa.Column('plan', sa.JSON(), nullable=True))
+    op.execute("""
+        UPDATE meal_plans mp SET plan = COALESCE((
+            SELECT json_object_agg(day.date_key, day.cells)
+            FROM (
+                SELECT to_char(e.date, 'YYYY-MM-DD') AS date_key,
+                       json_object_agg(e.meal_type_id::text, e.recipe_id) AS cells
+                FROM meal_plan_entries e
+                WHERE e.user_id = mp.user_id
+                GROUP BY e.date
+            ) AS day
+        ), '{}'::json)
+    """)
+    op.alter_column('meal_plans', 'plan', nullable=False)
+    op.drop_index('ux_meal_plan_entries_user_id_date_meal_type_id', table_name='meal_plan_entries')
+    op.drop_index(op.f('ix_meal_plan_entries_id'), table_name='meal_plan_entries')
+    op.drop_table('meal_plan_entries')
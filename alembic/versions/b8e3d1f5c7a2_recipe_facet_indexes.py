@@ -0,0 +1,37 @@
+"""recipe facet indexes
+
+Revision ID: b8e3d1f5c7a2
+Revises: 0a6d3e8f9c21
+Create Date: 2026-10-17 20:41:37.208415
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e3d1f5c7a2'
+down_revision: Union[str, None] = '0a6d3e8f9c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_recipe_dish_categories_dish_category_id_recipe_id', 'recipe_dish_categories',
+                    ['dish_category_id', 'recipe_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_recipe_dish_categories_recipe_id', 'recipe_dish_categories',
+                    ['recipe_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_recipe_tags_tag_id_recipe_id', 'recipe_tags',
+                    ['tag_id', 'recipe_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_recipe_tags_recipe_id', 'recipe_tags', ['recipe_id'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recipe_tags_recipe_id', table_name='recipe_tags', if_exists=True)
+    op.drop_index('ix_recipe_tags_tag_id_recipe_id', table_name='recipe_tags', if_exists=True)
+    op.drop_index('ix_recipe_dish_categories_recipe_id', table_name='recipe_dish_categories', if_exists=True)
+    op.drop_index('ix_recipe_dish_categories_dish_category_id_recipe_id', table_name='recipe_dish_categories',
+                  if_exists=True)
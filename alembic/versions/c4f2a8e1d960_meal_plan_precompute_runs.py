@@ -0,0 +1,47 @@
+"""meal plan precompute runs
+
+Revision ID: c4f2a8e1d960
+Revises: b8e3d1f5c7a2
+Create Date: 2026-10-17 23:12:48.514903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f2a8e1d960'
+down_revision: Union[str, None] = 'b8e3d1f5c7a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица могла быть уже создана через Base.metadata.create_all при старте приложения
+    if not sa.inspect(op.get_bind()).has_table('meal_plan_precompute_runs'):
+        op.create_table(
+            'meal_plan_precompute_runs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('run_date', sa.Date(), nullable=False),
+            sa.Column('nightly', sa.Boolean(), nullable=False),
+            sa.Column('week_start', sa.Date(), nullable=False),
+            sa.Column('started_at', sa.DateTime(), nullable=False),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.Column('pending', sa.Integer(), nullable=False),
+            sa.Column('prepared', sa.Integer(), nullable=False),
+            sa.Column('failed', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(op.f('ix_meal_plan_precompute_runs_id'), 'meal_plan_precompute_runs', ['id'], unique=False)
+        op.create_index(op.f('ix_meal_plan_precompute_runs_run_date'), 'meal_plan_precompute_runs', ['run_date'],
+                        unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_meal_plan_precompute_runs_run_date'), table_name='meal_plan_precompute_runs')
+    op.drop_index(op.f('ix_meal_plan_precompute_runs_id'), table_name='meal_plan_precompute_runs')
+    op.drop_table('meal_plan_precompute_runs')
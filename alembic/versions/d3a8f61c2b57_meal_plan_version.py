@@ -0,0 +1,31 @@
+"""meal plan version
+
+Revision ID: d3a8f61c2b57
+Revises: 9b7e0c5a2f14
+Create Date: 2026-10-17 15:12:43.118604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a8f61c2b57'
+down_revision: Union[str, None] = '9b7e0c5a2f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Колонка могла быть уже создана через Base.metadata.create_all при старте приложения
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('meal_plans')}
+    if 'version' not in columns:
+        op.add_column('meal_plans', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('meal_plans', 'version')
@@ -0,0 +1,80 @@
+"""ingredient categories
+
+Revision ID: e5b19c7d4a08
+Revises: d3a8f61c2b57
+Create Date: 2026-10-17 17:05:21.530917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b19c7d4a08'
+down_revision: Union[str, None] = 'd3a8f61c2b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    # Таблицы могли быть уже созданы через Base.metadata.create_all при старте приложения
+    if not inspector.has_table('ingredient_categories'):
+        op.create_table(
+            'ingredient_categories',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('parent_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['parent_id'], ['ingredient_categories.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name'),
+        )
+        op.create_index(op.f('ix_ingredient_categories_id'), 'ingredient_categories', ['id'], unique=False)
+    if not inspector.has_table('ingredient_category_closure'):
+        op.create_table(
+            'ingredient_category_closure',
+            sa.Column('ancestor_id', sa.Integer(), nullable=False),
+            sa.Column('descendant_id', sa.Integer(), nullable=False),
+            sa.Column('depth', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['ancestor_id'], ['ingredient_categories.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['descendant_id'], ['ingredient_categories.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id'),
+        )
+        op.create_index('ix_ingredient_category_closure_descendant_id', 'ingredient_category_closure',
+                        ['descendant_id', 'ancestor_id'], unique=False)
+
+    if 'category_id' not in {column['name'] for column in inspector.get_columns('ingredients')}:
+        op.add_column('ingredients', sa.Column('category_id', sa.Integer(), nullable=True))
+        op.create_foreign_key('ingredients_category_id_fkey', 'ingredients', 'ingredient_categories',
+                              ['category_id'], ['id'], ondelete='SET NULL')
+        op.create_index(op.f('ix_ingredients_category_id'), 'ingredients', ['category_id'], unique=False)
+
+    if 'category_id' not in {column['name'] for column in inspector.get_columns('excluded_ingredients')}:
+        op.add_column('excluded_ingredients', sa.Column('category_id', sa.Integer(), nullable=True))
+        op.create_foreign_key('excluded_ingredients_category_id_fkey', 'excluded_ingredients',
+                              'ingredient_categories', ['category_id'], ['id'], ondelete='CASCADE')
+        op.alter_column('excluded_ingredients', 'ingredient_id', existing_type=sa.Integer(), nullable=True)
+        op.create_index('ix_excluded_ingredients_user_id_category_id', 'excluded_ingredients',
+                        ['user_id', 'category_id'], unique=False)
+        op.create_check_constraint('ck_excluded_ingredients_ingredient_or_category', 'excluded_ingredients',
+                                   '(ingredient_id IS NULL) <> (category_id IS NULL)')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM excluded_ingredients WHERE ingredient_id IS NULL")
+    op.drop_constraint('ck_excluded_ingredients_ingredient_or_category', 'excluded_ingredients', type_='check')
+    op.drop_index('ix_excluded_ingredients_user_id_category_id', table_name='excluded_ingredients')
+    op.alter_column('excluded_ingredients', 'ingredient_id', existing_type=sa.Integer(), nullable=False)
+    op.drop_constraint('excluded_ingredients_category_id_fkey', 'excluded_ingredients', type_='foreignkey')
+    op.drop_column('excluded_ingredients', 'category_id')
+    op.drop_index(op.f('ix_ingredients_category_id'), table_name='ingredients')
+    op.drop_constraint('ingredients_category_id_fkey', 'ingredients', type_='foreignkey')
+    op.drop_column('ingredients', 'category_id')
+    op.drop_index('ix_ingredient_category_closure_descendant_id', table_name='ingredient_category_closure')
+    op.drop_table('ingredient_category_closure')
+    op.drop_index(op.f('ix_ingredient_categories_id'), table_name='ingredient_categories')
+    op.drop_table('ingredient_categories')
@@ -0,0 +1,121 @@
+"""recipe search vector
+
+Revision ID: f1c7a92e6b30
+Revises: e5b19c7d4a08
+Create Date: 2026-10-17 18:20:47.204113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c7a92e6b30'
+down_revision: Union[str, None] = 'e5b19c7d4a08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGGERS = (
+    ('recipes_search_vector', 'recipes'),
+    ('recipe_ingredients_search_insert', 'recipe_ingredients'),
+    ('recipe_ingredients_search_update', 'recipe_ingredients'),
+    ('recipe_ingredients_search_delete', 'recipe_ingredients'),
+    ('ingredients_search_refresh', 'ingredients'),
+)
+FUNCTIONS = ('recipes_search_vector_update', 'recipe_ingredients_search_refresh', 'ingredients_search_refresh')
+
+# SQL зафиксирован на момент ревизии: миграция не должна меняться вместе с apps.recipes.search
+CREATE_SEARCH_FUNCTIONS = [
+    """
+CREATE OR REPLACE FUNCTION recipes_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(i.ingredient_name, ' ')
+            FROM recipe_ingredients ri JOIN ingredients i ON i.id = ri.ingredient_id
+            WHERE ri.recipe_id = NEW.id
+        ), '')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'C') ||
+        setweight(to_tsvector('russian', coalesce(CASE WHEN json_typeof(NEW.steps) = 'array' THEN (
+            SELECT string_agg(step ->> 'description', ' ') FROM json_array_elements(NEW.steps) AS step
+        ) END, '')), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+""",
+    """
+CREATE OR REPLACE FUNCTION recipe_ingredients_search_refresh() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE recipes SET title = title WHERE id IN (SELECT recipe_id FROM new_rows);
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE recipes SET title = title WHERE id IN (SELECT recipe_id FROM old_rows);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""",
+    """
+CREATE OR REPLACE FUNCTION ingredients_search_refresh() RETURNS trigger AS $$
+BEGIN
+    UPDATE recipes SET title = title
+    WHERE id IN (SELECT recipe_id FROM recipe_ingredients WHERE ingredient_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""",
+]
+CREATE_SEARCH_TRIGGERS = [
+    """CREATE TRIGGER recipes_search_vector
+    BEFORE INSERT OR UPDATE OF title, description, steps ON recipes
+    FOR EACH ROW EXECUTE FUNCTION recipes_search_vector_update()""",
+    """CREATE TRIGGER recipe_ingredients_search_insert
+    AFTER INSERT ON recipe_ingredients REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredients_search_refresh()""",
+    """CREATE TRIGGER recipe_ingredients_search_update
+    AFTER UPDATE ON recipe_ingredients REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredients_search_refresh()""",
+    """CREATE TRIGGER recipe_ingredients_search_delete
+    AFTER DELETE ON recipe_ingredients REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredients_search_refresh()""",
+    """CREATE TRIGGER ingredients_search_refresh
+    AFTER UPDATE OF ingredient_name ON ingredients
+    FOR EACH ROW WHEN (OLD.ingredient_name IS DISTINCT FROM NEW.ingredient_name)
+    EXECUTE FUNCTION ingredients_search_refresh()""",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Колонка могла быть уже создана через Base.metadata.create_all при старте приложения
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('recipes')}
+    if 'search_vector' not in columns:
+        op.add_column('recipes', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute("CREATE INDEX IF NOT EXISTS ix_recipes_search_vector ON recipes USING gin (search_vector)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_recipes_title_trgm ON recipes USING gin (title gin_trgm_ops)")
+
+    for statement in CREATE_SEARCH_FUNCTIONS:
+        op.execute(statement)
+    for name, table in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+    for statement in CREATE_SEARCH_TRIGGERS:
+        op.execute(statement)
+    # Заполняем вектор для существующих рецептов через триггер
+    op.execute("UPDATE recipes SET title = title")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+    for name in FUNCTIONS:
+        op.execute(f"DROP FUNCTION IF EXISTS {name}()")
+    op.drop_index('ix_recipes_title_trgm', table_name='recipes')
+    op.drop_index('ix_recipes_search_vector', table_name='recipes')
+    op.drop_column('recipes', 'search_vector')
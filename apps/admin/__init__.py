@@ -6,6 +6,7 @@ from apps.admin.views.users import UserAdmin
 from apps.admin.views.news import NewsAdmin
 from apps.admin.views.recipes import RecipeAdmin, upload_recipe_image
 from apps.admin.views.ingredients import IngredientAdmin
+from apps.admin.views.ingredient_categories import IngredientCategoryAdmin
 from apps.admin.views.meal_types import MealTypeAdmin
 from apps.admin.views.dish_categories import DishCategoryAdmin
 from apps.admin.views.tags import TagAdmin
@@ -37,6 +38,7 @@ def init_admin(app: FastAPI):
     admin.add_view(NewsAdmin)
     admin.add_view(RecipeAdmin)
     admin.add_view(IngredientAdmin)
+    admin.add_view(IngredientCategoryAdmin)
     admin.add_view(MealTypeAdmin)
     admin.add_view(DishCategoryAdmin)
     admin.add_view(TagAdmin)
@@ -1,7 +1,8 @@
 from sqladmin import ModelView
+from apps.admin.views.reference import ReferenceSnapshotMixin
 from apps.recipes.models import DishCategory
 
-class DishCategoryAdmin(ModelView, model=DishCategory):
+class DishCategoryAdmin(ReferenceSnapshotMixin, ModelView, model=DishCategory):
     column_list = [DishCategory.id, DishCategory.name, DishCategory.description, DishCategory.is_active]
     column_searchable_list = [DishCategory.name]
     column_sortable_list = [DishCategory.id, DishCategory.name]
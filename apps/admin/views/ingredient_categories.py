@@ -0,0 +1,39 @@
+from sqladmin import ModelView
+from sqlalchemy import select
+from starlette.requests import Request
+from apps.recipes.crud import category_closure_rows, rebuild_category_closure
+from apps.recipes.models import IngredientCategory
+
+class IngredientCategoryAdmin(ModelView, model=IngredientCategory):
+    column_list = [IngredientCategory.id, IngredientCategory.name, IngredientCategory.parent]
+    column_searchable_list = [IngredientCategory.name]
+    column_sortable_list = [IngredientCategory.id, IngredientCategory.name]
+    page_size = 20
+    name = "Категория ингредиентов"
+    name_plural = "Категории ингредиентов"
+    icon = "fa fa-sitemap"
+    form_include = ["name", "parent"]
+
+    async def on_model_change(self, data: dict, model: IngredientCategory, is_created: bool, request: Request) -> None:
+        # Новая категория не может замкнуть цикл: на нее еще никто не ссылается
+        if is_created:
+            return
+        parent_id = int(data["parent"]) if data.get("parent") else None
+        async with self.session_maker() as session:
+            result = await session.execute(select(IngredientCategory.id, IngredientCategory.parent_id))
+            parents = dict(result.all())
+        parents[model.id] = parent_id
+        try:
+            category_closure_rows(parents)
+        except ValueError:
+            # Ошибка до commit: sqladmin покажет ее в форме, а дерево останется прежним
+            raise ValueError("Категорию нельзя перенести в нее саму или в ее подкатегорию")
+
+    async def after_model_change(self, data: dict, model: IngredientCategory, is_created: bool, request: Request) -> None:
+        # Категорию могли перенести в другую ветку, поэтому замыкание пересчитывается целиком
+        async with self.session_maker() as session:
+            await rebuild_category_closure(session)
+
+    async def after_model_delete(self, model: IngredientCategory, request: Request) -> None:
+        async with self.session_maker() as session:
+            await rebuild_category_closure(session)
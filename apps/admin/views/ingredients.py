@@ -1,11 +1,12 @@
 from sqladmin import ModelView
+from apps.admin.views.reference import ReferenceSnapshotMixin
 from apps.recipes.models import Ingredient
 
-class IngredientAdmin(ModelView, model=Ingredient):
-    column_list = [Ingredient.id, Ingredient.ingredient_name, Ingredient.unit, Ingredient.is_public]
+class IngredientAdmin(ReferenceSnapshotMixin, ModelView, model=Ingredient):
+    column_list = [Ingredient.id, Ingredient.ingredient_name, Ingredient.unit, Ingredient.is_public, Ingredient.category]
     column_searchable_list = [Ingredient.ingredient_name]
     page_size = 20
     name = "Ингредиент"
     name_plural = "Ингредиенты"
     icon = "fa fa-carrot"
-    form_include = ["ingredient_name", "unit", "is_public"]
\ No newline at end of file
+    form_include = ["ingredient_name", "unit", "is_public", "category"]
\ No newline at end of file
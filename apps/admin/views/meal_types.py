@@ -1,7 +1,8 @@
 from sqladmin import ModelView
+from apps.admin.views.reference import ReferenceSnapshotMixin
 from apps.recipes.models import MealType
 
-class MealTypeAdmin(ModelView, model=MealType):
+class MealTypeAdmin(ReferenceSnapshotMixin, ModelView, model=MealType):
     column_list = [MealType.id, MealType.order, MealType.name, MealType.description, MealType.is_active]
     column_searchable_list = [MealType.name]
     column_sortable_list = [MealType.id, MealType.name, MealType.order]
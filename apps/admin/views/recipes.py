@@ -1,6 +1,10 @@
 from datetime import datetime
 from sqladmin import ModelView
-from apps.recipes.models import Recipe, RecipeIngredient, Ingredient, MealType, RecipeMealType, DishCategory, RecipeDishCategory, Tag, RecipeTag
+from apps.meal_planner.index import candidate_index
+from apps.recipes.cache import recipe_cache
+from apps.recipes.crud import sync_recipe_links
+from apps.recipes.reference import reference_snapshot
+from apps.recipes.models import Recipe, RecipeIngredient, RecipeMealType, RecipeDishCategory, RecipeTag
 from fastapi import Request, UploadFile, File, HTTPException
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
@@ -139,27 +143,20 @@ class RecipeAdmin(ModelView, model=Recipe):
 
     async def scaffold_form(self) -> type[wtforms.Form]:
         logger.info("Scaffolding form for RecipeAdmin")
+        # Варианты выбора берутся из снимка справочников, а не из четырех таблиц на каждую страницу
         async with self.session_maker() as session:
-            result = await session.execute(select(Ingredient))
-            ingredients = result.scalars().all()
-            ingredient_choices = [(ing.id, f"{ing.ingredient_name} ({ing.unit})") for ing in ingredients]
-
-            result = await session.execute(select(MealType))
-            meal_types = result.scalars().all()
-            meal_type_choices = [(mt.id, mt.name) for mt in meal_types]
-
-            result = await session.execute(select(DishCategory))
-            dish_categories = result.scalars().all()
-            dish_category_choices = [(dc.id, dc.name) for dc in dish_categories]
-
-            result = await session.execute(select(Tag))
-            tags = result.scalars().all()
-            tag_choices = [(t.id, t.name) for t in tags]
-
-            logger.info(f"Loaded ingredient choices: {ingredient_choices}")
-            logger.info(f"Loaded meal type choices: {meal_type_choices}")
-            logger.info(f"Loaded dish category choices: {dish_category_choices}")
-            logger.info(f"Loaded tag choices: {tag_choices}")
+            await reference_snapshot.ensure_fresh(session)
+        ingredient_choices = [
+            (ing["id"], f"{ing['ingredient_name']} ({ing['unit']})") for ing in reference_snapshot.rows("ingredients")
+        ]
+        meal_type_choices = [(mt["id"], mt["name"]) for mt in reference_snapshot.rows("meal_types")]
+        dish_category_choices = [(dc["id"], dc["name"]) for dc in reference_snapshot.rows("dish_categories")]
+        tag_choices = [(t["id"], t["name"]) for t in reference_snapshot.rows("tags")]
+        logger.info(
+            f"Loaded form choices from reference snapshot v{reference_snapshot.version}: "
+            f"{len(ingredient_choices)} ingredients, {len(meal_type_choices)} meal types, "
+            f"{len(dish_category_choices)} dish categories, {len(tag_choices)} tags"
+        )
 
         class DynamicRecipeForm(RecipeForm):
             def __init__(self, *args, **kwargs):
@@ -290,6 +287,8 @@ class RecipeAdmin(ModelView, model=Recipe):
 
             await session.commit()
             await session.refresh(db_recipe, attribute_names=["ingredients", "meal_types", "dish_categories", "tags", "steps"])
+            await recipe_cache.invalidate(db_recipe.id)
+            await candidate_index.refresh_recipe(session, db_recipe.id)
             return db_recipe
 
     async def edit(self, request: Request) -> "Response":
@@ -436,7 +435,6 @@ class RecipeAdmin(ModelView, model=Recipe):
                     logger.error(f"Failed to upload image to MinIO: {str(e)}")
                     raise HTTPException(status_code=500, detail=f"Ошибка загрузки в MinIO: {str(e)}")
 
-            await session.execute(RecipeIngredient.__table__.delete().where(RecipeIngredient.recipe_id == int(pk)))
             ingredients_data = []
             i = 0
             while f"ingredients-{i}-ingredient_id" in form_data:
@@ -448,15 +446,7 @@ class RecipeAdmin(ModelView, model=Recipe):
                         "amount": float(amount)
                     })
                 i += 1
-            for ingredient_data in ingredients_data:
-                db_ingredient = RecipeIngredient(
-                    recipe_id=db_recipe.id,
-                    ingredient_id=ingredient_data["ingredient_id"],
-                    amount=ingredient_data["amount"]
-                )
-                session.add(db_ingredient)
 
-            await session.execute(RecipeMealType.__table__.delete().where(RecipeMealType.recipe_id == int(pk)))
             meal_types_data = []
             i = 0
             while f"meal_types-{i}-meal_type_id" in form_data:
@@ -464,14 +454,7 @@ class RecipeAdmin(ModelView, model=Recipe):
                 if meal_type_id:
                     meal_types_data.append({"meal_type_id": int(meal_type_id)})
                 i += 1
-            for meal_type_data in meal_types_data:
-                db_meal_type = RecipeMealType(
-                    recipe_id=db_recipe.id,
-                    meal_type_id=meal_type_data["meal_type_id"]
-                )
-                session.add(db_meal_type)
 
-            await session.execute(RecipeDishCategory.__table__.delete().where(RecipeDishCategory.recipe_id == int(pk)))
             dish_categories_data = []
             i = 0
             while f"dish_categories-{i}-dish_category_id" in form_data:
@@ -479,14 +462,7 @@ class RecipeAdmin(ModelView, model=Recipe):
                 if dish_category_id:
                     dish_categories_data.append({"dish_category_id": int(dish_category_id)})
                 i += 1
-            for dish_category_data in dish_categories_data:
-                db_dish_category = RecipeDishCategory(
-                    recipe_id=db_recipe.id,
-                    dish_category_id=dish_category_data["dish_category_id"]
-                )
-                session.add(db_dish_category)
 
-            await session.execute(RecipeTag.__table__.delete().where(RecipeTag.recipe_id == int(pk)))
             tags_data = []
             i = 0
             while f"tags-{i}-tag_id" in form_data:
@@ -494,15 +470,20 @@ class RecipeAdmin(ModelView, model=Recipe):
                 if tag_id:
                     tags_data.append({"tag_id": int(tag_id)})
                 i += 1
-            for tag_data in tags_data:
-                db_tag = RecipeTag(
-                    recipe_id=db_recipe.id,
-                    tag_id=tag_data["tag_id"]
-                )
-                session.add(db_tag)
+
+            # Меняются только отличающиеся строки связей, id остальных сохраняются
+            changes = await sync_recipe_links(session, db_recipe.id, {
+                RecipeIngredient: ingredients_data,
+                RecipeMealType: meal_types_data,
+                RecipeDishCategory: dish_categories_data,
+                RecipeTag: tags_data,
+            })
+            logger.info(f"Recipe {db_recipe.id} links synced: {changes}")
 
             await session.commit()
             await session.refresh(db_recipe, attribute_names=["ingredients", "meal_types", "dish_categories", "tags", "steps"])
+            await recipe_cache.invalidate(db_recipe.id)
+            await candidate_index.refresh_recipe(session, db_recipe.id)
             return db_recipe
 
     async def on_model_delete(self, obj: Recipe, request: Request) -> None:
@@ -514,6 +495,10 @@ class RecipeAdmin(ModelView, model=Recipe):
             except S3Error as e:
                 logger.error(f"Ошибка удаления изображения из MinIO: {str(e)}")
 
+    async def after_model_delete(self, model: Recipe, request: Request) -> None:
+        await recipe_cache.invalidate(model.id)
+        candidate_index.discard(model.id)
+
 async def upload_recipe_image(request: Request, recipe_id: int, image: UploadFile = File(...)):
     user_id = request.session.get("user_id")
     if not user_id:
@@ -556,6 +541,7 @@ async def upload_recipe_image(request: Request, recipe_id: int, image: UploadFil
                     raise HTTPException(status_code=500, detail=f"Ошибка загрузки в MinIO: {str(e)}")
 
                 await session.commit()
+                await recipe_cache.invalidate(recipe_id)
                 await session.refresh(recipe)
 
             return JSONResponse(content={
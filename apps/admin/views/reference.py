@@ -0,0 +1,13 @@
+from starlette.requests import Request
+from apps.recipes.reference import reference_snapshot
+
+class ReferenceSnapshotMixin:
+    """Пересобирает снимок справочников после изменения записи в админ-панели."""
+
+    async def after_model_change(self, data: dict, model, is_created: bool, request: Request) -> None:
+        async with self.session_maker() as session:
+            await reference_snapshot.invalidate(session)
+
+    async def after_model_delete(self, model, request: Request) -> None:
+        async with self.session_maker() as session:
+            await reference_snapshot.invalidate(session)
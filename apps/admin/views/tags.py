@@ -1,7 +1,8 @@
 from sqladmin import ModelView
+from apps.admin.views.reference import ReferenceSnapshotMixin
 from apps.recipes.models import Tag
 
-class TagAdmin(ModelView, model=Tag):
+class TagAdmin(ReferenceSnapshotMixin, ModelView, model=Tag):
     column_list = [Tag.id, Tag.name, Tag.is_active]
     column_searchable_list = [Tag.name]
     column_sortable_list = [Tag.id, Tag.name]
@@ -0,0 +1,245 @@
+"""Массовая генерация меню для группы пользователей.
+
+Каталог кандидатов загружается один раз, подбор рецептов выполняется в пуле
+процессов, результаты записываются пакетными upsert-запросами.
+
+Запуск из командной строки:
+    python -m apps.meal_planner.batch --users 1 2 3 --start-date 2026-10-19 --days 7 --persons 2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from apps.auth.models import User
+from apps.meal_planner.crud import excluded_ingredients_query, get_active_meal_types, upsert_entries_statement
+from apps.meal_planner.index import CandidateIndex, candidate_index
+from apps.meal_planner.models import MealPlan, MealPlanEntry
+from apps.recipes.models import FavoriteRecipe
+from apps.meal_planner.sampler import recipe_weights
+from apps.meal_planner.schemas import MealPlanParams, PLAN_HISTORY_DAYS
+from apps.meal_planner.solver import choose_plan
+from core.database import async_session
+
+logger = logging.getLogger(__name__)
+
+# Ограничение на число строк в одном INSERT: 4 параметра на строку при лимите
+# asyncpg в 32767 параметров
+UPSERT_CHUNK_ROWS = 5000
+
+_worker_index: Optional[CandidateIndex] = None
+_worker_meal_type_ids: List[int] = []
+
+
+def _init_worker(snapshot: dict, meal_type_ids: List[int]):
+    global _worker_index, _worker_meal_type_ids
+    _worker_index = CandidateIndex.from_snapshot(snapshot)
+    _worker_meal_type_ids = meal_type_ids
+
+
+def _plan_for_user(job: dict) -> Dict[date, Dict[int, int]]:
+    """Подбор рецептов для одного пользователя внутри процесса пула."""
+    pools = _worker_index.candidates(job["user_id"], job["recipe_source"], job["excluded_ingredients"])
+    mt_recipes = {mt_id: sorted(pools.get(mt_id, ())) for mt_id in _worker_meal_type_ids}
+    if not any(mt_recipes.values()):
+        raise ValueError("Нет доступных рецептов")
+    nutrition = None
+    if job["targets"] or job["max_total_time"]:
+        nutrition = _worker_index.nutrition({r for recipe_ids in mt_recipes.values() for r in recipe_ids})
+    return choose_plan(job["dates"], mt_recipes, nutrition, job["targets"], job["max_total_time"],
+                       job["weights"], job["no_repeat_days"], job["seed"])
+
+
+async def _write_plans(db: AsyncSession, plans: Dict[int, Dict[date, Dict[int, int]]], params: MealPlanParams,
+                       dates: List[date]):
+    user_ids = list(plans)
+    cutoff_date = datetime.utcnow().date() - timedelta(days=PLAN_HISTORY_DAYS)
+    await db.execute(
+        MealPlanEntry.__table__.delete().where(
+            MealPlanEntry.user_id.in_(user_ids),
+            (MealPlanEntry.date < cutoff_date) | MealPlanEntry.date.between(dates[0], dates[-1])
+        )
+    )
+    rows = [
+        {"user_id": user_id, "date": entry_date, "meal_type_id": meal_type_id, "recipe_id": recipe_id}
+        for user_id, plan in plans.items()
+        for entry_date, cells in plan.items()
+        for meal_type_id, recipe_id in cells.items()
+    ]
+    for offset in range(0, len(rows), UPSERT_CHUNK_ROWS):
+        await db.execute(upsert_entries_statement(rows[offset:offset + UPSERT_CHUNK_ROWS]))
+
+    header = {
+        "start_date": datetime.combine(dates[0], datetime.min.time()),
+        "days": len(dates),
+        "persons": params.persons,
+        "recipe_source": params.recipe_source,
+    }
+    result = await db.execute(select(MealPlan.user_id).filter(MealPlan.user_id.in_(user_ids)))
+    existing = list(set(result.scalars().all()))
+    if existing:
+        await db.execute(
+            MealPlan.__table__.update().where(MealPlan.user_id.in_(existing))
+            .values(**header, version=MealPlan.version + 1)
+        )
+    missing = [user_id for user_id in user_ids if user_id not in set(existing)]
+    if missing:
+        await db.execute(MealPlan.__table__.insert(), [{"user_id": user_id, **header} for user_id in missing])
+    await db.commit()
+    return len(rows)
+
+
+async def generate_plans_batch(db: AsyncSession, user_ids: List[int], params: MealPlanParams,
+                               workers: Optional[int] = None,
+                               on_progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """Генерирует меню для пользователей user_ids с общими параметрами params.
+
+    Исключенные ингредиенты каждого пользователя (с раскрытыми категориями)
+    берутся из excluded_ingredients и дополняются params.excluded_ingredients. on_progress вызывается по мере
+    готовности каждого плана и при ошибках.
+    """
+    started = time.perf_counter()
+    notify = on_progress or (lambda event: None)
+    user_ids = list(dict.fromkeys(user_ids))
+    failed = []
+
+    result = await db.execute(select(User.id).filter(User.id.in_(user_ids)))
+    known_users = set(result.scalars().all())
+    for user_id in user_ids:
+        if user_id not in known_users:
+            failed.append({"user_id": user_id, "error": "Пользователь не найден"})
+            notify({"event": "failed", **failed[-1]})
+
+    await candidate_index.ensure_loaded(db)
+    meal_types = await get_active_meal_types(db)
+    result = await db.execute(excluded_ingredients_query(list(known_users)))
+    excluded = {}
+    for user_id, ingredient_id in result.all():
+        excluded.setdefault(user_id, set()).add(ingredient_id)
+    result = await db.execute(
+        select(FavoriteRecipe.user_id, FavoriteRecipe.recipe_id)
+        .filter(FavoriteRecipe.user_id.in_(list(known_users)))
+    )
+    favorites = {}
+    for user_id, recipe_id in result.all():
+        favorites.setdefault(user_id, []).append(recipe_id)
+
+    start_date = params.start_date.date()
+    dates = [start_date + timedelta(days=day) for day in range(params.days)]
+    targets = params.nutrition_targets if any(v is not None for v in params.nutrition_targets.values()) else None
+    jobs = [
+        {
+            "user_id": user_id,
+            "recipe_source": params.recipe_source,
+            "excluded_ingredients": excluded.get(user_id, set()) | set(params.excluded_ingredients or []),
+            "dates": dates,
+            "targets": targets,
+            "max_total_time": params.max_total_time,
+            "weights": recipe_weights(favorites.get(user_id, []), {}),
+            "no_repeat_days": params.no_repeat_days,
+            # Свое зерно для каждого пользователя, чтобы меню не совпадали
+            "seed": None if params.seed is None else params.seed + user_id,
+        }
+        for user_id in user_ids if user_id in known_users
+    ]
+
+    plans = {}
+    loop = asyncio.get_running_loop()
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(candidate_index.snapshot(), [mt["id"] for mt in meal_types])
+    )
+    try:
+        async def run(job):
+            try:
+                return job["user_id"], await loop.run_in_executor(pool, _plan_for_user, job), None
+            except Exception as e:
+                return job["user_id"], None, e
+
+        for finished in asyncio.as_completed([run(job) for job in jobs]):
+            user_id, plan, error = await finished
+            if error is not None:
+                failed.append({"user_id": user_id, "error": str(error)})
+                notify({"event": "failed", **failed[-1]})
+                logger.warning(f"Batch meal plan failed for user_id={user_id}: {str(error)}")
+            else:
+                plans[user_id] = plan
+                notify({"event": "planned", "user_id": user_id, "done": len(plans) + len(failed), "total": len(user_ids)})
+    finally:
+        # shutdown ждет завершения процессов пула — в отдельном потоке, чтобы не блокировать цикл событий
+        await asyncio.to_thread(pool.shutdown)
+
+    rows = await _write_plans(db, plans, params, dates) if plans else 0
+    elapsed = time.perf_counter() - started
+    summary = {
+        "total": len(user_ids),
+        "succeeded": len(plans),
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 3),
+        "plans_per_second": round(len(plans) / elapsed, 2) if elapsed else 0.0,
+    }
+    logger.info(
+        f"Batch meal plans: {len(plans)}/{len(user_ids)} users, {rows} entries "
+        f"in {elapsed:.2f}s ({summary['plans_per_second']} plans/s)"
+    )
+    return summary
+
+
+async def _main(args):
+    params = MealPlanParams(
+        start_date=datetime.strptime(args.start_date, "%Y-%m-%d"),
+        days=args.days,
+        persons=args.persons,
+        excluded_ingredients=args.exclude,
+        recipe_source=args.recipe_source,
+        target_calories=args.target_calories,
+        target_proteins=args.target_proteins,
+        target_fats=args.target_fats,
+        target_carbohydrates=args.target_carbohydrates,
+        max_total_time=args.max_total_time,
+        no_repeat_days=args.no_repeat_days,
+        seed=args.seed,
+    )
+    user_ids = list(args.users or [])
+    if args.users_file:
+        with open(args.users_file) as f:
+            user_ids += [int(line) for line in f if line.strip()]
+    if not user_ids:
+        raise SystemExit("Не указаны пользователи: --users или --users-file")
+
+    def report(event):
+        print(json.dumps(event, ensure_ascii=False), file=sys.stderr, flush=True)
+
+    async with async_session() as session:
+        summary = await generate_plans_batch(session, user_ids, params, args.workers, report)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовая генерация меню")
+    parser.add_argument("--users", type=int, nargs="*", help="ID пользователей")
+    parser.add_argument("--users-file", help="Файл с ID пользователей, по одному в строке")
+    parser.add_argument("--start-date", default=datetime.utcnow().strftime("%Y-%m-%d"))
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--persons", type=int, default=1)
+    parser.add_argument("--recipe-source", default="both", choices=["mine", "mealflow", "both"])
+    parser.add_argument("--exclude", type=int, nargs="*", default=[], help="ID исключаемых ингредиентов")
+    parser.add_argument("--target-calories", type=float)
+    parser.add_argument("--target-proteins", type=float)
+    parser.add_argument("--target-fats", type=float)
+    parser.add_argument("--target-carbohydrates", type=float)
+    parser.add_argument("--max-total-time", type=int)
+    parser.add_argument("--no-repeat-days", type=int, default=1)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    asyncio.run(_main(parser.parse_args()))
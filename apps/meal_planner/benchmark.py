@@ -0,0 +1,61 @@
+"""Замер времени подбора меню солвером в зависимости от размера каталога.
+
+Запуск: python -m apps.meal_planner.benchmark [--sizes 1000 10000 50000] [--days 7]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from apps.meal_planner.solver import solve_plan
+
+MEAL_TYPES = 3
+REPEATS = 20
+
+
+def synthetic_catalog(size: int, rng: np.random.Generator):
+    """Случайный каталог: size рецептов, равномерно распределённых по типам блюд."""
+    pools, matrices = [], []
+    ids = np.arange(1, size + 1)
+    for meal_type in range(MEAL_TYPES):
+        pool = ids[meal_type::MEAL_TYPES]
+        matrix = np.column_stack([
+            rng.uniform(150, 900, len(pool)),   # calories
+            rng.uniform(5, 60, len(pool)),      # proteins
+            rng.uniform(5, 50, len(pool)),      # fats
+            rng.uniform(10, 120, len(pool)),    # carbohydrates
+            rng.integers(10, 120, len(pool)),   # total_time
+        ])
+        pools.append(pool)
+        matrices.append(matrix)
+    return pools, matrices
+
+
+def run(sizes, days: int):
+    rng = np.random.default_rng(0)
+    targets = {"calories": 2000, "proteins": 100, "fats": 70, "carbohydrates": 250}
+    print(f"{'recipes':>10} {'days':>5} {'median ms':>10} {'p95 ms':>10} {'kcal error %':>13}")
+    for size in sizes:
+        pools, matrices = synthetic_catalog(size, rng)
+        lookup = {
+            int(recipe_id): row
+            for pool, matrix in zip(pools, matrices)
+            for recipe_id, row in zip(pool, matrix)
+        }
+        timings, errors = [], []
+        for _ in range(REPEATS):
+            started = time.perf_counter()
+            plan = solve_plan(pools, matrices, days, targets, max_total_time=150, rng=rng)
+            timings.append((time.perf_counter() - started) * 1000)
+            calories = np.array([[lookup[int(r)][0] for r in day] for day in plan]).sum(axis=1)
+            errors.append(np.abs(calories - targets["calories"]).mean() / targets["calories"] * 100)
+        print(f"{size:>10} {days:>5} {np.median(timings):>10.2f} "
+              f"{np.percentile(timings, 95):>10.2f} {np.mean(errors):>13.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000, 20000, 50000])
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+    run(args.sizes, args.days)
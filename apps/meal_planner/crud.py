@@ -1,157 +1,513 @@
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import func, union, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
-from sqlalchemy.orm.attributes import flag_modified
 
-from apps.meal_planner.models import MealPlan, ExcludedIngredient
-from apps.recipes.models import Recipe, RecipeIngredient, Ingredient, MealType, RecipeMealType
+from apps.meal_planner.index import candidate_index, ingredient_ids_from_mask, ingredient_mask, NUTRITION_COLUMNS
+from apps.meal_planner.sampler import NO_REPEAT_DAYS, RECENCY_DAYS, PlanSampler, recipe_weights
+from apps.meal_planner.substitutions import substitution_index
+from apps.meal_planner.solver import choose_plan, has_targets, NUTRITION_FIELDS, TIME_COLUMN
+from apps.meal_planner.models import MealPlan, MealPlanEntry, ExcludedIngredient
+from apps.meal_planner.schemas import MAX_START_OFFSET_DAYS, MAX_PLAN_DAYS, PLAN_HISTORY_DAYS
+from apps.recipes.crud import get_recipe_summaries
+from apps.recipes.models import Recipe, RecipeIngredient, Ingredient, IngredientCategoryClosure, RecipeMealType, FavoriteRecipe
+from apps.recipes.reference import reference_snapshot
 from fastapi import HTTPException
-import random
 from datetime import datetime, timedelta, date
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def create_meal_plan(db: AsyncSession, user_id: int, start_date: datetime, days: int, persons: int,
-                           excluded_ingredients: List[int], recipe_source: str = "both"):
-    today = datetime.utcnow().date()
-    max_date = today + timedelta(days=14)
-    start_date_date = start_date.date()
-    end_date = start_date_date + timedelta(days=days - 1)
-
-    if start_date_date < today:
-        raise HTTPException(status_code=400, detail="Нельзя генерировать меню на прошлые даты")
-    if start_date_date > max_date:
-        raise HTTPException(status_code=400, detail="Дата начала не может быть позже чем +14 дней от текущей")
-    if end_date > max_date:
-        raise HTTPException(status_code=400, detail="План не может заканчиваться позже чем +14 дней от текущей")
-
-    existing_plan = await get_meal_plan(db, user_id)
+def excluded_ingredients_query(user_ids: List[int]):
+    """Пары (user_id, ingredient_id) исключенных ингредиентов с раскрытыми категориями.
 
-    if existing_plan:
-        db_plan = existing_plan
-    else:
-        db_plan = MealPlan(
-            user_id=user_id,
-            start_date=start_date,
-            days=days,
-            persons=persons,
-            plan={},
-            recipe_source=recipe_source
+    Категория раскрывается одним соединением по таблице замыкания: исключение
+    категории -> все ее подкатегории -> ингредиенты этих подкатегорий.
+    """
+    direct = select(ExcludedIngredient.user_id, ExcludedIngredient.ingredient_id.label("ingredient_id")).filter(
+        ExcludedIngredient.user_id.in_(user_ids),
+        ExcludedIngredient.ingredient_id.is_not(None)
+    )
+    by_category = (
+        select(ExcludedIngredient.user_id, Ingredient.id.label("ingredient_id"))
+        .join(IngredientCategoryClosure, IngredientCategoryClosure.ancestor_id == ExcludedIngredient.category_id)
+        .join(Ingredient, Ingredient.category_id == IngredientCategoryClosure.descendant_id)
+        .filter(ExcludedIngredient.user_id.in_(user_ids))
+    )
+    return union(direct, by_category)
+
+def candidate_rows_query(user_id: int, recipe_source: str = "both", meal_type_id: Optional[int] = None):
+    """Запрос пар (recipe_id, meal_type_id), доступных пользователю с учетом исключенных ингредиентов.
+
+    Исключения берутся из таблицы excluded_ingredients (с раскрытыми категориями),
+    поэтому фильтрация целиком выполняется в БД через anti-join, а объекты Recipe
+    не создаются.
+    """
+    excluded_ids = excluded_ingredients_query([user_id]).subquery()
+    excluded = (
+        select(RecipeIngredient.recipe_id)
+        .filter(
+            RecipeIngredient.ingredient_id.in_(select(excluded_ids.c.ingredient_id)),
+            RecipeIngredient.recipe_id == RecipeMealType.recipe_id
         )
-
-    await db.execute(ExcludedIngredient.__table__.delete().where(ExcludedIngredient.user_id == user_id))
-    for ing_id in excluded_ingredients:
-        db_excluded = ExcludedIngredient(user_id=user_id, ingredient_id=ing_id)
-        db.add(db_excluded)
-
+    )
     query = (
-        select(Recipe)
-        .options(
-            selectinload(Recipe.ingredients).selectinload(RecipeIngredient.ingredient),
-            selectinload(Recipe.meal_types).selectinload(RecipeMealType.meal_type)
-        )
+        select(RecipeMealType.recipe_id, RecipeMealType.meal_type_id)
+        .join(Recipe, Recipe.id == RecipeMealType.recipe_id)
+        .filter(~excluded.exists())
     )
+    if meal_type_id is not None:
+        query = query.filter(RecipeMealType.meal_type_id == meal_type_id)
     if recipe_source == "mine":
         query = query.filter(Recipe.user_id == user_id)
     elif recipe_source == "mealflow":
         query = query.filter(Recipe.is_public == True)
     else:
         query = query.filter((Recipe.user_id == user_id) | (Recipe.is_public == True))
-
+    return query
+
+async def load_candidate_pools(db: AsyncSession, user_id: int, recipe_source: str = "both",
+                               excluded_ingredients: Optional[List[int]] = None,
+                               meal_type_id: Optional[int] = None) -> Dict[int, Set[int]]:
+    """Возвращает доступные рецепты по типам блюд.
+
+    Пока индекс кандидатов воркера не построен, выборка делается запросом
+    candidate_rows_query, а индекс строится в фоне.
+    """
+    if not candidate_index.is_ready:
+        candidate_index.schedule_rebuild()
+        result = await db.execute(candidate_rows_query(user_id, recipe_source, meal_type_id))
+        pools = {}
+        for recipe_id, row_meal_type_id in result.all():
+            pools.setdefault(row_meal_type_id, set()).add(recipe_id)
+        return pools
+
+    await candidate_index.ensure_loaded(db)
+    if excluded_ingredients is None:
+        excluded_ingredients = await get_excluded_ids(db, user_id)
+    pools = candidate_index.candidates(user_id, recipe_source, excluded_ingredients)
+    if meal_type_id is not None:
+        return {meal_type_id: pools.get(meal_type_id, set())}
+    return pools
+
+async def get_excluded_ids(db: AsyncSession, user_id: int) -> List[int]:
+    """Все исключенные пользователем ингредиенты, включая входящие в исключенные категории."""
+    excluded = excluded_ingredients_query([user_id]).subquery()
+    result = await db.execute(select(excluded.c.ingredient_id))
+    return result.scalars().all()
+
+async def add_substitutable_candidates(db: AsyncSession, user_id: int, recipe_source: str,
+                                       excluded_ingredients: List[int], candidate_pools: Dict[int, Set[int]],
+                                       meal_type_ids: List[int]) -> Dict[int, Set[int]]:
+    """Заполняет пустые пулы типов блюд рецептами, в которых каждый исключенный ингредиент можно заменить.
+
+    Работает только по индексу кандидатов; до его готовности пулы не меняются.
+    """
+    empty = [mt_id for mt_id in meal_type_ids if not candidate_pools.get(mt_id)]
+    if not empty or not excluded_ingredients or not candidate_index.is_ready:
+        return candidate_pools
+    await substitution_index.ensure_fresh()
+    excluded = set(excluded_ingredients)
+    excluded_mask = ingredient_mask(excluded)
+    masks = candidate_index.ingredient_masks()
+    relaxed = candidate_index.candidates(user_id, recipe_source, ())
+    pools = dict(candidate_pools)
+    for mt_id in empty:
+        pools[mt_id] = {
+            recipe_id for recipe_id in relaxed.get(mt_id, ())
+            if substitution_index.swaps(ingredient_ids_from_mask(masks.get(recipe_id, 0) & excluded_mask), excluded)
+            is not None
+        }
+        if pools[mt_id]:
+            logger.info(f"Meal type {mt_id}: {len(pools[mt_id])} recipes available with substitutions for user_id={user_id}")
+    return pools
+
+async def plan_substitutions(db: AsyncSession, user_id: int, recipe_ids: Set[int]) -> Dict[int, Dict[int, int]]:
+    """Замены исключенных ингредиентов в рецептах плана: recipe_id -> {ингредиент: замена}."""
+    if not candidate_index.is_ready:
+        return {}
+    excluded = set(await get_excluded_ids(db, user_id))
+    if not excluded:
+        return {}
+    excluded_mask = ingredient_mask(excluded)
+    masks = candidate_index.ingredient_masks()
+    affected = {recipe_id: masks.get(recipe_id, 0) & excluded_mask for recipe_id in recipe_ids}
+    affected = {recipe_id: mask for recipe_id, mask in affected.items() if mask}
+    if not affected:
+        return {}
+    await substitution_index.ensure_fresh()
+    substitutions = {}
+    for recipe_id, mask in affected.items():
+        swaps = substitution_index.swaps(ingredient_ids_from_mask(mask), excluded)
+        if swaps:
+            substitutions[recipe_id] = swaps
+    return substitutions
+
+async def load_nutrition(db: AsyncSession, recipe_ids: Set[int]) -> Dict[int, tuple]:
+    """КБЖУ и время рецептов: из индекса кандидатов, а до его готовности — одним запросом по колонкам."""
+    if candidate_index.is_ready:
+        return candidate_index.nutrition(recipe_ids)
+    result = await db.execute(select(Recipe.id, *NUTRITION_COLUMNS).filter(Recipe.id.in_(recipe_ids)))
+    return {recipe_id: tuple(values) for recipe_id, *values in result.all()}
+
+async def load_recipe_weights(db: AsyncSession, user_id: int, before: date) -> Dict[int, float]:
+    """Веса рецептов для выборки: избранное пользователя и рецепты его плана за RECENCY_DAYS дней до before."""
+    result = await db.execute(select(FavoriteRecipe.recipe_id).filter(FavoriteRecipe.user_id == user_id))
+    favorites = result.scalars().all()
+    result = await db.execute(
+        select(MealPlanEntry.recipe_id, func.count())
+        .filter(
+            MealPlanEntry.user_id == user_id,
+            MealPlanEntry.date >= before - timedelta(days=RECENCY_DAYS),
+            MealPlanEntry.date < before
+        )
+        .group_by(MealPlanEntry.recipe_id)
+    )
+    return recipe_weights(favorites, dict(result.all()))
+
+async def pick_plan_recipes(db: AsyncSession, user_id: int, dates: List[date], mt_recipes: Dict[int, List[int]],
+                            targets: Optional[Dict[str, Optional[float]]] = None,
+                            max_total_time: Optional[int] = None, no_repeat_days: int = NO_REPEAT_DAYS,
+                            seed: Optional[int] = None) -> Dict[date, Dict[int, int]]:
+    """Заполняет дни плана рецептами из mt_recipes (тип блюда -> кандидаты).
+
+    Веса избранного и недавних рецептов и окно без повторов учитываются и при подборе по КБЖУ.
+    """
+    nutrition = None
+    if has_targets(targets, max_total_time):
+        nutrition = await load_nutrition(db, {r for recipe_ids in mt_recipes.values() for r in recipe_ids})
+    weights = await load_recipe_weights(db, user_id, dates[0])
+    window = timedelta(days=no_repeat_days)
+    history = await get_plan_entries(db, user_id, dates[0] - window, dates[-1] + window)
+    return choose_plan(dates, mt_recipes, nutrition, targets, max_total_time, weights, no_repeat_days, seed, history)
+
+def is_day_valid(cells: Optional[Dict[int, int]], mt_recipes: Dict[int, List[int]],
+                 candidate_pools: Dict[int, Set[int]]) -> bool:
+    """День заполнен по всем типам блюд, и каждый его рецепт по-прежнему доступен пользователю."""
+    if not cells:
+        return False
+    for mt_id, recipe_ids in mt_recipes.items():
+        if recipe_ids and cells.get(mt_id) not in candidate_pools.get(mt_id, ()):
+            return False
+    return True
+
+def format_plan_date(value: date) -> str:
+    return value.strftime('%Y-%m-%d')
+
+async def get_active_meal_types(db: AsyncSession) -> List[dict]:
+    """Активные типы блюд по порядку отображения. Берутся из снимка справочников, без запроса к БД."""
+    await reference_snapshot.ensure_fresh(db)
+    meal_types = [mt for mt in reference_snapshot.rows("meal_types") if mt["is_active"]]
+    meal_types.sort(key=lambda mt: (mt["order"] is None, mt["order"] or 0))
+    return [{"id": mt["id"], "name": mt["name"], "order": mt["order"]} for mt in meal_types]
+
+async def get_plan_entries(db: AsyncSession, user_id: int, date_from: Optional[date] = None,
+                           date_to: Optional[date] = None) -> Dict[date, Dict[int, int]]:
+    """Ячейки плана пользователя за период: дата -> {meal_type_id: recipe_id}."""
+    query = (
+        select(MealPlanEntry.date, MealPlanEntry.meal_type_id, MealPlanEntry.recipe_id)
+        .filter(MealPlanEntry.user_id == user_id)
+        .order_by(MealPlanEntry.date)
+    )
+    if date_from is not None:
+        query = query.filter(MealPlanEntry.date >= date_from)
+    if date_to is not None:
+        query = query.filter(MealPlanEntry.date <= date_to)
     result = await db.execute(query)
-    all_recipes = result.unique().scalars().all()
-
-    filtered_recipes = [
-        r for r in all_recipes
-        if not any(ri.ingredient_id in excluded_ingredients for ri in r.ingredients)
-    ]
-    if not filtered_recipes:
-        raise HTTPException(status_code=400, detail="Нет доступных рецептов")
+    plan = {}
+    for entry_date, meal_type_id, recipe_id in result.all():
+        plan.setdefault(entry_date, {})[meal_type_id] = recipe_id
+    return plan
+
+def empty_totals() -> Dict[str, float]:
+    return dict.fromkeys(NUTRITION_FIELDS, 0.0)
+
+def add_to_totals(totals: Dict[str, float], values: Optional[tuple], persons: int):
+    """Прибавляет к суммам характеристики рецепта: КБЖУ на всех персон, время — один раз."""
+    if not values:
+        return
+    for column, (field, value) in enumerate(zip(NUTRITION_FIELDS, values)):
+        if value is not None:
+            totals[field] += value * (1 if column == TIME_COLUMN else persons)
+
+def plan_totals(plan: Dict[date, Dict[int, int]], nutrition: Dict[int, tuple],
+                persons: int) -> Tuple[Dict[date, Dict[str, float]], Dict[str, float]]:
+    """Суммы КБЖУ и времени по дням и за весь план из числовых векторов рецептов."""
+    daily = {}
+    overall = empty_totals()
+    for entry_date, cells in plan.items():
+        day = daily[entry_date] = empty_totals()
+        for recipe_id in cells.values():
+            add_to_totals(day, nutrition.get(recipe_id), persons)
+        for field, value in day.items():
+            overall[field] += value
+    return daily, overall
+
+def round_totals(totals: Dict[str, float]) -> Dict[str, float]:
+    return {field: round(value, 1) for field, value in totals.items()}
+
+async def plan_view(db: AsyncSession, meal_plan: MealPlan, plan: Dict[date, Dict[int, int]], meal_types: List[dict],
+                    generated_dates: Optional[List[date]] = None) -> dict:
+    """build_plan_view с суммами по дням; векторы рецептов берутся из индекса кандидатов."""
+    recipe_ids = {r for cells in plan.values() for r in cells.values()}
+    nutrition = await load_nutrition(db, recipe_ids)
+    daily, overall = plan_totals(plan, nutrition, meal_plan.persons)
+    view = build_plan_view(meal_plan, plan, meal_types, generated_dates, daily, overall)
+    view["substitutions"] = await plan_substitutions(db, meal_plan.user_id, recipe_ids)
+    return view
+
+def build_plan_view(meal_plan: MealPlan, plan: Dict[date, Dict[int, int]], meal_types: List[dict],
+                    generated_dates: Optional[List[date]] = None,
+                    daily_totals: Optional[Dict[date, Dict[str, float]]] = None,
+                    totals: Optional[Dict[str, float]] = None) -> dict:
+    """Ответ в формате схемы MealPlan: ячейки плана сериализуются в прежний JSON-вид."""
+    if plan:
+        first_date, last_date = min(plan), max(plan)
+        start_date = datetime.combine(first_date, datetime.min.time())
+        days = (last_date - first_date).days + 1
+    else:
+        start_date = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        days = 0
+    return {
+        "id": meal_plan.id,
+        "user_id": meal_plan.user_id,
+        "start_date": start_date,
+        "days": days,
+        "persons": meal_plan.persons,
+        "plan": {
+            format_plan_date(entry_date): {str(meal_type_id): recipe_id for meal_type_id, recipe_id in cells.items()}
+            for entry_date, cells in plan.items()
+        },
+        "meal_types": meal_types,
+        "recipe_source": meal_plan.recipe_source,
+        "version": meal_plan.version,
+        "generated_dates": generated_dates or [],
+        "daily_totals": {
+            format_plan_date(entry_date): round_totals(day) for entry_date, day in (daily_totals or {}).items()
+        },
+        "totals": round_totals(totals) if totals is not None else None,
+    }
 
-    meal_types_result = await db.execute(
-        select(MealType).filter(MealType.is_active == True).order_by(MealType.order)
+async def expand_plan_recipes(db: AsyncSession, view: Optional[dict]) -> Optional[dict]:
+    """Добавляет к ответу build_plan_view краткие данные всех рецептов плана."""
+    if view is None:
+        return None
+    recipe_ids = {recipe_id for cells in view["plan"].values() for recipe_id in cells.values()}
+    view["recipes"] = await get_recipe_summaries(db, recipe_ids)
+    return view
+
+def upsert_entries_statement(rows: List[dict]):
+    """INSERT ... ON CONFLICT для ячеек плана: блокируется только изменяемая строка."""
+    statement = insert(MealPlanEntry).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=[MealPlanEntry.user_id, MealPlanEntry.date, MealPlanEntry.meal_type_id],
+        set_={"recipe_id": statement.excluded.recipe_id}
     )
-    meal_types = meal_types_result.scalars().all()
 
-    new_plan = {}
-    for day in range(days):
-        date_key = (start_date_date + timedelta(days=day)).strftime('%Y-%m-%d')
-        day_plan = {}
-        for mt in meal_types:
-            mt_recipes = [r for r in filtered_recipes if any(rmt.meal_type_id == mt.id for rmt in r.meal_types)]
-            if mt_recipes:
-                selected_recipe = random.choice(mt_recipes)
-                day_plan[str(mt.id)] = selected_recipe.id
-        new_plan[date_key] = day_plan
-
-    existing_plan_dict = db_plan.plan.copy() if db_plan.plan else {}
-
-    for date_key in list(existing_plan_dict.keys()):
-        existing_date = datetime.strptime(date_key, '%Y-%m-%d').date()
-        if start_date_date <= existing_date <= end_date:
-            del existing_plan_dict[date_key]
+async def create_meal_plan(db: AsyncSession, user_id: int, start_date: datetime, days: int, persons: int,
+                           excluded_ingredients: Optional[List[int]], recipe_source: str = "both",
+                           targets: Optional[Dict[str, Optional[float]]] = None, max_total_time: Optional[int] = None,
+                           no_repeat_days: int = NO_REPEAT_DAYS, seed: Optional[int] = None, mode: str = "replace",
+                           allow_substitutions: bool = True, excluded_categories: Optional[List[int]] = None):
+    """Создает или дополняет меню на период start_date .. start_date + days - 1.
+
+    В режиме replace рецепты подбираются заново для всех дней периода, в режиме
+    fill — только для дней без рецептов или с рецептами, которые больше не
+    проходят ограничения. Возвращается только запрошенный период.
+
+    Исключенные ингредиенты и категории сохраняются заново, только если переданы
+    excluded_ingredients и excluded_categories соответственно (None оставляет прежние).
+    Версия плана не увеличивается, если проход fill ничего не изменил; если меню
+    параллельно изменил другой запрос, изменения откатываются и возвращается 409.
+
+    Если исключенные ингредиенты не оставили рецептов для какого-то типа блюда
+    и allow_substitutions включен, используются рецепты, в которых эти
+    ингредиенты можно заменить; замены возвращаются в поле substitutions.
+    """
+    today = datetime.utcnow().date()
+    max_date = today + timedelta(days=MAX_START_OFFSET_DAYS)
+    start_date_date = start_date.date()
+    end_date = start_date_date + timedelta(days=days - 1)
 
-    existing_plan_dict.update(new_plan)
-    db_plan.plan = existing_plan_dict
+    if start_date_date < today:
+        raise HTTPException(status_code=400, detail="Нельзя генерировать меню на прошлые даты")
+    if start_date_date > max_date:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Дата начала не может быть позже чем +{MAX_START_OFFSET_DAYS} дней от текущей"
+        )
+    if days > MAX_PLAN_DAYS:
+        raise HTTPException(status_code=400, detail=f"Максимальный период — {MAX_PLAN_DAYS} дней")
 
-    cutoff_date = datetime.utcnow().date() - timedelta(days=14)
-    db_plan.plan = {
-        k: v for k, v in db_plan.plan.items()
-        if datetime.strptime(k, '%Y-%m-%d').date() >= cutoff_date
-    }
+    result = await db.execute(select(MealPlan).filter(MealPlan.user_id == user_id))
+    db_plan = result.scalars().first()
+    if not db_plan:
+        db_plan = MealPlan(user_id=user_id)
+
+    stale = ExcludedIngredient.__table__.delete().where(ExcludedIngredient.user_id == user_id)
+    if excluded_ingredients is None:
+        stale = stale.where(ExcludedIngredient.ingredient_id.is_(None))
+    if excluded_categories is None:
+        stale = stale.where(ExcludedIngredient.category_id.is_(None))
+    exclusions_changed = excluded_ingredients is not None or excluded_categories is not None
+    if exclusions_changed:
+        await db.execute(stale)
+    for ing_id in excluded_ingredients or []:
+        db_excluded = ExcludedIngredient(user_id=user_id, ingredient_id=ing_id)
+        db.add(db_excluded)
+    for category_id in excluded_categories or []:
+        db.add(ExcludedIngredient(user_id=user_id, category_id=category_id))
+    await db.flush()
+    excluded_ingredients = await get_excluded_ids(db, user_id)
+
+    meal_types = await get_active_meal_types(db)
+    candidate_pools = await load_candidate_pools(db, user_id, recipe_source, excluded_ingredients)
+    if allow_substitutions:
+        candidate_pools = await add_substitutable_candidates(
+            db, user_id, recipe_source, excluded_ingredients, candidate_pools, [mt["id"] for mt in meal_types]
+        )
+    if not any(candidate_pools.values()):
+        raise HTTPException(status_code=400, detail="Нет доступных рецептов")
 
-    if db_plan.plan:
-        plan_dates = [datetime.strptime(k, '%Y-%m-%d').date() for k in db_plan.plan.keys()]
-        db_plan.start_date = min(plan_dates)
-        db_plan.days = (max(plan_dates) - min(plan_dates)).days + 1
+    mt_recipes = {mt["id"]: sorted(candidate_pools.get(mt["id"], ())) for mt in meal_types}
+    dates = [start_date_date + timedelta(days=day) for day in range(days)]
+    if mode == "fill":
+        existing = await get_plan_entries(db, user_id, start_date_date, end_date)
+        dates = [day for day in dates if not is_day_valid(existing.get(day), mt_recipes, candidate_pools)]
+
+    cutoff_date = today - timedelta(days=PLAN_HISTORY_DAYS)
+    if dates:
+        new_plan = await pick_plan_recipes(db, user_id, dates, mt_recipes, targets, max_total_time, no_repeat_days, seed)
+        await db.execute(
+            MealPlanEntry.__table__.delete().where(
+                MealPlanEntry.user_id == user_id,
+                (MealPlanEntry.date < cutoff_date) | MealPlanEntry.date.in_(dates)
+            )
+        )
+        rows = [
+            {"user_id": user_id, "date": entry_date, "meal_type_id": meal_type_id, "recipe_id": recipe_id}
+            for entry_date, cells in new_plan.items()
+            for meal_type_id, recipe_id in cells.items()
+        ]
+        if rows:
+            await db.execute(upsert_entries_statement(rows))
+
+    header = {"start_date": start_date_date, "days": days, "persons": persons, "recipe_source": recipe_source}
+    if db_plan.id is None:
+        for field, value in header.items():
+            setattr(db_plan, field, value)
+        db.add(db_plan)
     else:
-        db_plan.start_date = start_date_date
-        db_plan.days = days
-
-    db_plan.persons = persons
-    db_plan.recipe_source = recipe_source
-
-    db.add(db_plan)
+        statement = update(MealPlan).where(MealPlan.id == db_plan.id).values(**header)
+        # Проход fill, который не дозаполнил ни одного дня, версию не меняет. Иначе версия
+        # проверяется и увеличивается тем же UPDATE, как в replace_recipes: если меню за это
+        # время изменил другой запрос (правка ячеек или планировщик), строка не найдется
+        expected_version = db_plan.version
+        if mode != "fill" or dates or exclusions_changed:
+            statement = statement.where(MealPlan.version == expected_version).values(version=MealPlan.version + 1)
+        result = await db.execute(statement)
+        if result.rowcount == 0:
+            await db.rollback()
+            logger.warning(f"Meal plan version conflict for user_id={user_id}: {expected_version} is no longer current")
+            raise HTTPException(status_code=409, detail="Меню было изменено на другом устройстве, обновите его")
     await db.commit()
-    await db.refresh(db_plan)
 
-    db_plan.meal_types = [{"id": mt.id, "name": mt.name, "order": mt.order} for mt in meal_types]
-    logger.info(f"Meal plan created/updated for user_id={user_id}, start_date={start_date_date}, days={days}")
-    return db_plan
+    plan = await get_plan_entries(db, user_id, start_date_date, end_date)
+    logger.info(
+        f"Meal plan created/updated for user_id={user_id}, start_date={start_date_date}, days={days}, "
+        f"mode={mode}, generated_days={len(dates)}"
+    )
+    return await plan_view(db, db_plan, plan, meal_types, dates)
 
-async def get_meal_plan(db: AsyncSession, user_id: int):
+async def get_meal_plan(db: AsyncSession, user_id: int, date_from: Optional[date] = None,
+                        date_to: Optional[date] = None):
+    """Меню пользователя; date_from/date_to ограничивают возвращаемые дни."""
     result = await db.execute(
         select(MealPlan).filter(MealPlan.user_id == user_id)
     )
     meal_plan = result.scalars().first()
-    if meal_plan:
-        cutoff_date = datetime.utcnow().date() - timedelta(days=14)
-        meal_plan.plan = {
-            k: v for k, v in meal_plan.plan.items()
-            if datetime.strptime(k, '%Y-%m-%d').date() >= cutoff_date
-        }
-
-        if meal_plan.plan:
-            plan_dates = [datetime.strptime(k, '%Y-%m-%d').date() for k in meal_plan.plan.keys()]
-            meal_plan.start_date = min(plan_dates)
-            meal_plan.days = (max(plan_dates) - min(plan_dates)).days + 1
-        else:
-            meal_plan.start_date = datetime.utcnow().date()
-            meal_plan.days = 0
-
-        meal_types_result = await db.execute(
-            select(MealType).filter(MealType.is_active == True).order_by(MealType.order)
+    if not meal_plan:
+        return None
+    cutoff_date = datetime.utcnow().date() - timedelta(days=PLAN_HISTORY_DAYS)
+    plan = await get_plan_entries(db, user_id, max(date_from or cutoff_date, cutoff_date), date_to)
+    meal_types = await get_active_meal_types(db)
+    logger.info(f"Meal plan retrieved for user_id={user_id}")
+    return await plan_view(db, meal_plan, plan, meal_types)
+
+def shopping_list_query(user_id: int, date_from: date, date_to: date):
+    """Суммарное количество ингредиентов по блюдам плана за период.
+
+    Количество из рецепта пересчитывается на число персон плана:
+    amount * persons / servings. Агрегация выполняется одним GROUP BY в БД.
+    Рецепт с servings = 0 (старые записи до проверки ge=1) считается на одну порцию.
+    """
+    persons = (
+        select(MealPlan.persons)
+        .filter(MealPlan.user_id == user_id)
+        .order_by(MealPlan.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            Ingredient.id.label("ingredient_id"),
+            Ingredient.ingredient_name,
+            Ingredient.unit,
+            func.sum(
+                RecipeIngredient.amount * persons / func.coalesce(func.nullif(Recipe.servings, 0), 1)
+            ).label("amount"),
+            func.count(MealPlanEntry.id).label("recipes"),
+        )
+        .select_from(MealPlanEntry)
+        .join(Recipe, Recipe.id == MealPlanEntry.recipe_id)
+        .join(RecipeIngredient, RecipeIngredient.recipe_id == Recipe.id)
+        .join(Ingredient, Ingredient.id == RecipeIngredient.ingredient_id)
+        .filter(
+            MealPlanEntry.user_id == user_id,
+            MealPlanEntry.date.between(date_from, date_to)
         )
-        meal_types = meal_types_result.scalars().all()
-        meal_plan.meal_types = [{"id": mt.id, "name": mt.name, "order": mt.order} for mt in meal_types]
+        .group_by(Ingredient.id, Ingredient.ingredient_name, Ingredient.unit)
+        .order_by(Ingredient.ingredient_name, Ingredient.unit)
+    )
 
-        db.add(meal_plan)
-        await db.commit()
-        await db.refresh(meal_plan)
-        logger.info(f"Meal plan retrieved for user_id={user_id}")
-    return meal_plan
+async def has_meal_plan(db: AsyncSession, user_id: int) -> bool:
+    result = await db.execute(select(MealPlan.id).filter(MealPlan.user_id == user_id).limit(1))
+    return result.scalar() is not None
+
+async def get_shopping_list(db: AsyncSession, user_id: int, date_from: date, date_to: date) -> Optional[dict]:
+    result = await db.execute(select(MealPlan.persons).filter(MealPlan.user_id == user_id))
+    persons = result.scalars().first()
+    if persons is None:
+        return None
+    result = await db.execute(shopping_list_query(user_id, date_from, date_to))
+    items = [
+        {**row._mapping, "amount": round(row.amount or 0, 2)}
+        for row in result.all()
+    ]
+    logger.info(f"Shopping list for user_id={user_id}, {date_from}..{date_to}: {len(items)} items")
+    return {"date_from": date_from, "date_to": date_to, "persons": persons, "items": items}
+
+async def stream_shopping_list(db: AsyncSession, user_id: int, date_from: date, date_to: date):
+    """Строки списка покупок через серверный курсор, без загрузки результата целиком."""
+    result = await db.stream(shopping_list_query(user_id, date_from, date_to))
+    async for row in result:
+        yield row
+
+async def get_substitutes(db: AsyncSession, user_id: int, ingredient_id: int, limit: int = 5) -> List[dict]:
+    """Замены ингредиента, кроме тех, что пользователь сам исключил."""
+    await candidate_index.ensure_loaded(db)
+    await substitution_index.ensure_fresh()
+    excluded = set(await get_excluded_ids(db, user_id))
+    suggestions = substitution_index.suggest(ingredient_id, limit, excluded)
+    if not suggestions:
+        return []
+    result = await db.execute(select(Ingredient).filter(Ingredient.id.in_([i for i, _ in suggestions])))
+    ingredients = {ingredient.id: ingredient for ingredient in result.scalars().all()}
+    return [
+        {"ingredient": ingredients[i], "score": score}
+        for i, score in suggestions if i in ingredients
+    ]
 
 async def get_excluded_ingredients(db: AsyncSession, user_id: int):
     result = await db.execute(
@@ -161,92 +517,111 @@ async def get_excluded_ingredients(db: AsyncSession, user_id: int):
     logger.info(f"Retrieved {len(excluded)} excluded ingredients for user_id={user_id}")
     return excluded
 
-async def replace_recipe(db: AsyncSession, user_id: int, date_str: str, meal_type_id: int, new_recipe_id: int | None):
-    logger.info(f"Attempting to replace recipe for user_id={user_id}, date={date_str}, meal_type_id={meal_type_id}, new_recipe_id={new_recipe_id}")
-
-    meal_plan = await get_meal_plan(db, user_id)
-    if not meal_plan or not meal_plan.plan:
-        logger.error("Meal plan not found or empty")
-        raise ValueError("Меню не найдено или пустое")
+async def replace_recipes(db: AsyncSession, user_id: int, edits: List[dict], version: Optional[int] = None):
+    """Применяет изменения ячеек плана одной транзакцией.
 
-    if date_str not in meal_plan.plan:
-        logger.error(f"Date {date_str} not found in meal plan")
-        raise ValueError("Указанная дата не входит в план меню")
+    edits — словари с ключами date, meal_type_id и new_recipe_id; если
+    new_recipe_id не указан, рецепт подбирается PlanSampler. Если передана
+    version и она не совпадает с текущей версией меню, изменения не
+    применяются и возвращается 409.
 
-    day_plan = meal_plan.plan[date_str]
-    if str(meal_type_id) not in day_plan:
-        logger.error(f"Meal type {meal_type_id} not found for date {date_str}")
-        raise ValueError("Указанный тип блюда не найден для этой даты")
+    Строка меню не блокируется: изменения готовятся без блокировок, а в конце
+    версия увеличивается условным UPDATE. Если за это время меню изменил
+    другой запрос, UPDATE не находит строку, и возвращается 409.
 
-    excluded_ingredients = [ei.ingredient_id for ei in await get_excluded_ingredients(db, user_id)]
-    logger.debug(f"Excluded ingredients: {excluded_ingredients}")
+    Возвращаются только измененные дни (они же в generated_dates) с суммами
+    КБЖУ по ним; totals считается по этим дням, а не по всему меню.
+    """
+    logger.info(f"Applying {len(edits)} meal plan edits for user_id={user_id}, version={version}")
 
-    existing_plan = await db.execute(
+    result = await db.execute(
         select(MealPlan).filter(MealPlan.user_id == user_id)
+        .execution_options(populate_existing=True)
     )
-    db_plan = existing_plan.scalars().first()
-    if not db_plan:
-        logger.error("Meal plan not found in database")
-        raise ValueError("Меню не найдено")
-
-    query = (
-        select(Recipe)
-        .options(
-            selectinload(Recipe.ingredients).selectinload(RecipeIngredient.ingredient),
-            selectinload(Recipe.meal_types).selectinload(RecipeMealType.meal_type)
-        )
+    meal_plan = result.scalars().first()
+    if not meal_plan:
+        logger.error("Meal plan not found or empty")
+        raise ValueError("Меню не найдено или пустое")
+    if version is not None and meal_plan.version != version:
+        logger.warning(f"Meal plan version conflict for user_id={user_id}: {version} != {meal_plan.version}")
+        raise HTTPException(status_code=409, detail="Меню было изменено на другом устройстве, обновите его")
+    expected_version = meal_plan.version
+
+    cutoff_date = datetime.utcnow().date() - timedelta(days=PLAN_HISTORY_DAYS)
+    dates = [edit["date"] for edit in edits]
+    window = timedelta(days=NO_REPEAT_DAYS)
+    plan = await get_plan_entries(db, user_id, min(dates) - window, max(dates) + window)
+    for edit in edits:
+        day_plan = plan.get(edit["date"])
+        if edit["date"] < cutoff_date or not day_plan:
+            logger.error(f"Date {edit['date']} not found in meal plan")
+            raise ValueError("Указанная дата не входит в план меню")
+        if edit["meal_type_id"] not in day_plan:
+            logger.error(f"Meal type {edit['meal_type_id']} not found for date {edit['date']}")
+            raise ValueError("Указанный тип блюда не найден для этой даты")
+
+    excluded_ingredients = await get_excluded_ids(db, user_id)
+    candidate_pools = await load_candidate_pools(db, user_id, meal_plan.recipe_source, excluded_ingredients)
+    candidate_pools = await add_substitutable_candidates(
+        db, user_id, meal_plan.recipe_source, excluded_ingredients, candidate_pools,
+        list({edit["meal_type_id"] for edit in edits})
     )
-    if db_plan.recipe_source == "mine":
-        query = query.filter(Recipe.user_id == user_id)
-    elif db_plan.recipe_source == "mealflow":
-        query = query.filter(Recipe.is_public == True)
-    else:
-        query = query.filter((Recipe.user_id == user_id) | (Recipe.is_public == True))
-
-    result = await db.execute(query)
-    all_recipes = result.unique().scalars().all()
-
-    filtered_recipes = [
-        r for r in all_recipes
-        if (
-            not any(ri.ingredient_id in excluded_ingredients for ri in r.ingredients) and
-            any(rmt.meal_type_id == meal_type_id for rmt in r.meal_types)
-        )
-    ]
-    if not filtered_recipes:
-        logger.error("No available recipes for replacement")
-        raise ValueError("Нет доступных рецептов для замены с учетом ограничений")
-
-    if new_recipe_id:
-        selected_recipe = next((r for r in filtered_recipes if r.id == new_recipe_id), None)
-        if not selected_recipe:
-            logger.error(f"Recipe {new_recipe_id} not available or does not meet constraints")
-            raise ValueError("Указанный рецепт недоступен или не соответствует ограничениям")
-    else:
-        selected_recipe = random.choice(filtered_recipes)
-
-    logger.info(f"Selected recipe for replacement: {selected_recipe.id} ({selected_recipe.title})")
-
-    # Обновляем план
-    meal_plan.plan[date_str][str(meal_type_id)] = selected_recipe.id
-    db_plan.plan = meal_plan.plan  # Избыточное присваивание, но оставлено для совместимости
-    flag_modified(db_plan, "plan")  # Помечаем поле plan как измененное
-
-    # Обновляем даты и количество дней
-    if db_plan.plan:
-        plan_dates = [datetime.strptime(k, '%Y-%m-%d').date() for k in db_plan.plan.keys()]
-        db_plan.start_date = min(plan_dates)
-        db_plan.days = (max(plan_dates) - min(plan_dates)).days + 1
+    sampler = None
+    rows = {}
+    for edit in edits:
+        entry_date, meal_type_id, new_recipe_id = edit["date"], edit["meal_type_id"], edit.get("new_recipe_id")
+        filtered_recipes = candidate_pools.get(meal_type_id, set())
+        if not filtered_recipes:
+            logger.error("No available recipes for replacement")
+            raise ValueError("Нет доступных рецептов для замены с учетом ограничений")
+
+        if new_recipe_id:
+            if new_recipe_id not in filtered_recipes:
+                logger.error(f"Recipe {new_recipe_id} not available or does not meet constraints")
+                raise ValueError("Указанный рецепт недоступен или не соответствует ограничениям")
+            selected_recipe_id = new_recipe_id
+        else:
+            if sampler is None:
+                weights = await load_recipe_weights(db, user_id, min(dates))
+                sampler = PlanSampler({
+                    mt_id: sorted(candidate_pools[mt_id])
+                    for mt_id in {e["meal_type_id"] for e in edits} if candidate_pools.get(mt_id)
+                }, weights)
+            # Новый рецепт не должен совпадать с текущим и повторять соседние дни,
+            # в том числе уже измененные этим запросом
+            selected_recipe_id = sampler.draw(meal_type_id, sampler.blocked(plan, entry_date))
+
+        plan[entry_date][meal_type_id] = selected_recipe_id
+        rows[entry_date, meal_type_id] = {
+            "user_id": user_id, "date": entry_date, "meal_type_id": meal_type_id, "recipe_id": selected_recipe_id
+        }
 
-    db.add(db_plan)
+    # Версия проверяется и увеличивается одним UPDATE в той же транзакции, что и запись ячеек
+    result = await db.execute(
+        update(MealPlan)
+        .where(MealPlan.user_id == user_id, MealPlan.version == expected_version)
+        .values(version=MealPlan.version + 1)
+    )
+    if result.rowcount == 0:
+        await db.rollback()
+        logger.warning(f"Meal plan version conflict for user_id={user_id}: {expected_version} is no longer current")
+        raise HTTPException(status_code=409, detail="Меню было изменено на другом устройстве, обновите его")
+    await db.execute(upsert_entries_statement(list(rows.values())))
     await db.commit()
-    await db.refresh(db_plan)
 
-    meal_types_result = await db.execute(
-        select(MealType).filter(MealType.is_active == True).order_by(MealType.order)
-    )
-    meal_types = meal_types_result.scalars().all()
-    db_plan.meal_types = [{"id": mt.id, "name": mt.name, "order": mt.order} for mt in meal_types]
+    logger.info(f"Applied {len(rows)} meal plan edits for user_id={user_id}")
+    # Остальные дни не изменились: возвращаются и пересчитываются только измененные даты
+    edited_dates = sorted(set(dates))
+    edited = {entry_date: plan[entry_date] for entry_date in edited_dates}
+    return await plan_view(db, meal_plan, edited, await get_active_meal_types(db), edited_dates)
 
-    logger.info(f"Recipe replaced successfully for date={date_str}, meal_type_id={meal_type_id}, new_recipe_id={selected_recipe.id}")
-    return db_plan
+async def replace_recipe(db: AsyncSession, user_id: int, date_str: str, meal_type_id: int, new_recipe_id: int | None):
+    logger.info(f"Attempting to replace recipe for user_id={user_id}, date={date_str}, meal_type_id={meal_type_id}, new_recipe_id={new_recipe_id}")
+    try:
+        entry_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        logger.error(f"Invalid date {date_str}")
+        raise ValueError("Указанная дата не входит в план меню")
+    return await replace_recipes(
+        db, user_id, [{"date": entry_date, "meal_type_id": meal_type_id, "new_recipe_id": new_recipe_id}]
+    )
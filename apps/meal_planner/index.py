@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from apps.recipes.models import Recipe, RecipeIngredient, RecipeMealType
+from core.database import async_session
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд индекс перестраивается целиком в фоне. Изменения, сделанные
+# в других воркерах gunicorn, попадают в индекс не позже этого интервала.
+INDEX_MAX_AGE_SECONDS = 300
+
+# Числовые характеристики рецепта, которые индекс хранит для подбора меню по КБЖУ.
+# Порядок совпадает с apps.meal_planner.solver.NUTRITION_FIELDS.
+NUTRITION_COLUMNS = (Recipe.calories, Recipe.proteins, Recipe.fats, Recipe.carbohydrates, Recipe.total_time)
+
+
+def ingredient_mask(ingredient_ids: Iterable[int]) -> int:
+    """Битовая маска набора ингредиентов: бит с номером ingredient_id."""
+    mask = 0
+    for ingredient_id in ingredient_ids:
+        mask |= 1 << ingredient_id
+    return mask
+
+
+def ingredient_ids_from_mask(mask: int) -> List[int]:
+    """Идентификаторы ингредиентов, биты которых установлены в маске."""
+    ids = []
+    while mask:
+        low = mask & -mask
+        ids.append(low.bit_length() - 1)
+        mask ^= low
+    return ids
+
+
+class CandidateIndex:
+    """Индекс рецептов-кандидатов для планировщика меню.
+
+    Хранится в памяти воркера и содержит только идентификаторы: пулы рецептов по
+    типам блюд, битовые маски ингредиентов каждого рецепта, обратный индекс
+    ингредиент -> рецепты и разбиение рецептов на общедоступные и пользовательские. Строится один раз и затем обновляется
+    точечно при изменении рецепта.
+    """
+
+    def __init__(self):
+        self._owners: Dict[int, int] = {}
+        self._public: Set[int] = set()
+        self._by_user: Dict[int, Set[int]] = {}
+        self._meal_type_pools: Dict[int, Set[int]] = {}
+        self._recipe_meal_types: Dict[int, Set[int]] = {}
+        self._ingredient_bits: Dict[int, int] = {}
+        self._ingredient_recipes: Dict[int, Set[int]] = {}
+        self._nutrition: Dict[int, Tuple] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._touched_during_rebuild: Optional[Set[int]] = None
+        self.generation = 0
+
+    # Поля, которые переносятся в snapshot для передачи в другие процессы
+    SNAPSHOT_FIELDS = (
+        "owners", "public", "by_user", "meal_type_pools", "recipe_meal_types", "ingredient_bits", "nutrition"
+    )
+
+    def snapshot(self) -> dict:
+        """Данные индекса в виде обычных словарей и множеств, пригодных для pickle."""
+        return {field: getattr(self, f"_{field}") for field in self.SNAPSHOT_FIELDS}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "CandidateIndex":
+        index = cls()
+        for field in cls.SNAPSHOT_FIELDS:
+            setattr(index, f"_{field}", snapshot[field])
+        # Обратный индекс в snapshot не передается, он восстанавливается из масок
+        for recipe_id, mask in index._ingredient_bits.items():
+            for ingredient_id in ingredient_ids_from_mask(mask):
+                index._ingredient_recipes.setdefault(ingredient_id, set()).add(recipe_id)
+        index._loaded_at = time.monotonic()
+        return index
+
+    @property
+    def is_ready(self) -> bool:
+        return self._loaded_at is not None
+
+    async def ensure_loaded(self, db: AsyncSession):
+        """Строит индекс при первом обращении и обновляет его в фоне, если он устарел."""
+        if not self.is_ready:
+            async with self._lock:
+                if not self.is_ready:
+                    await self.rebuild(db)
+            return
+        if time.monotonic() - self._loaded_at > INDEX_MAX_AGE_SECONDS:
+            self.schedule_rebuild()
+
+    def schedule_rebuild(self):
+        if self._rebuild_task and not self._rebuild_task.done():
+            return
+        self._rebuild_task = asyncio.create_task(self._rebuild_in_background())
+
+    async def _rebuild_in_background(self):
+        try:
+            async with self._lock:
+                async with async_session() as session:
+                    await self.rebuild(session)
+        except Exception as e:
+            logger.error(f"Candidate index rebuild failed: {str(e)}", exc_info=True)
+
+    async def rebuild(self, db: AsyncSession):
+        started = time.monotonic()
+        self._touched_during_rebuild = set()
+        try:
+            recipes = (await db.execute(
+                select(Recipe.id, Recipe.user_id, Recipe.is_public, *NUTRITION_COLUMNS)
+            )).all()
+            ingredient_rows = (await db.execute(
+                select(RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id)
+            )).all()
+            meal_type_rows = (await db.execute(
+                select(RecipeMealType.recipe_id, RecipeMealType.meal_type_id)
+            )).all()
+        except Exception:
+            self._touched_during_rebuild = None
+            raise
+
+        owners, public, by_user, nutrition = {}, set(), {}, {}
+        for recipe_id, user_id, is_public, *values in recipes:
+            owners[recipe_id] = user_id
+            nutrition[recipe_id] = tuple(values)
+            by_user.setdefault(user_id, set()).add(recipe_id)
+            if is_public:
+                public.add(recipe_id)
+
+        ingredient_bits = dict.fromkeys(owners, 0)
+        ingredient_recipes = {}
+        for recipe_id, ingredient_id in ingredient_rows:
+            if recipe_id in ingredient_bits:
+                ingredient_bits[recipe_id] |= 1 << ingredient_id
+                ingredient_recipes.setdefault(ingredient_id, set()).add(recipe_id)
+
+        meal_type_pools, recipe_meal_types = {}, {}
+        for recipe_id, meal_type_id in meal_type_rows:
+            if recipe_id in owners:
+                meal_type_pools.setdefault(meal_type_id, set()).add(recipe_id)
+                recipe_meal_types.setdefault(recipe_id, set()).add(meal_type_id)
+
+        self._owners = owners
+        self._public = public
+        self._by_user = by_user
+        self._ingredient_bits = ingredient_bits
+        self._ingredient_recipes = ingredient_recipes
+        self._nutrition = nutrition
+        self._meal_type_pools = meal_type_pools
+        self._recipe_meal_types = recipe_meal_types
+        self._loaded_at = time.monotonic()
+        self.generation += 1
+
+        # Рецепты, изменённые во время перестройки, могли не попасть в выборку.
+        touched, self._touched_during_rebuild = self._touched_during_rebuild, None
+        for recipe_id in touched:
+            await self.refresh_recipe(db, recipe_id)
+        logger.info(
+            f"Candidate index rebuilt: {len(owners)} recipes, {len(meal_type_pools)} meal types "
+            f"in {(time.monotonic() - started) * 1000:.1f} ms"
+        )
+
+    async def refresh_recipe(self, db: AsyncSession, recipe_id: int):
+        """Перечитывает из БД один рецепт и обновляет его записи в индексе."""
+        if self._touched_during_rebuild is not None:
+            self._touched_during_rebuild.add(recipe_id)
+        if not self.is_ready:
+            return
+        recipe = (await db.execute(
+            select(Recipe.id, Recipe.user_id, Recipe.is_public, *NUTRITION_COLUMNS).filter(Recipe.id == recipe_id)
+        )).first()
+        if not recipe:
+            self.discard(recipe_id)
+            return
+        ingredient_ids = (await db.execute(
+            select(RecipeIngredient.ingredient_id).filter(RecipeIngredient.recipe_id == recipe_id)
+        )).scalars().all()
+        meal_type_ids = (await db.execute(
+            select(RecipeMealType.meal_type_id).filter(RecipeMealType.recipe_id == recipe_id)
+        )).scalars().all()
+
+        self._remove(recipe_id)
+        self._owners[recipe_id] = recipe.user_id
+        self._by_user.setdefault(recipe.user_id, set()).add(recipe_id)
+        if recipe.is_public:
+            self._public.add(recipe_id)
+        self._ingredient_bits[recipe_id] = ingredient_mask(ingredient_ids)
+        for ingredient_id in ingredient_ids:
+            self._ingredient_recipes.setdefault(ingredient_id, set()).add(recipe_id)
+        self._nutrition[recipe_id] = tuple(recipe[3:])
+        self._recipe_meal_types[recipe_id] = set(meal_type_ids)
+        for meal_type_id in meal_type_ids:
+            self._meal_type_pools.setdefault(meal_type_id, set()).add(recipe_id)
+        self.generation += 1
+        logger.debug(f"Candidate index refreshed recipe_id={recipe_id}")
+
+    def discard(self, recipe_id: int):
+        """Удаляет рецепт из индекса."""
+        if self._touched_during_rebuild is not None:
+            self._touched_during_rebuild.add(recipe_id)
+        if self._remove(recipe_id):
+            self.generation += 1
+            logger.debug(f"Candidate index discarded recipe_id={recipe_id}")
+
+    def _remove(self, recipe_id: int) -> bool:
+        user_id = self._owners.pop(recipe_id, None)
+        if user_id is None:
+            return False
+        user_recipes = self._by_user.get(user_id)
+        if user_recipes is not None:
+            user_recipes.discard(recipe_id)
+            if not user_recipes:
+                del self._by_user[user_id]
+        self._public.discard(recipe_id)
+        for ingredient_id in ingredient_ids_from_mask(self._ingredient_bits.pop(recipe_id, 0)):
+            recipes = self._ingredient_recipes.get(ingredient_id)
+            if recipes is not None:
+                recipes.discard(recipe_id)
+        self._nutrition.pop(recipe_id, None)
+        for meal_type_id in self._recipe_meal_types.pop(recipe_id, ()):
+            pool = self._meal_type_pools.get(meal_type_id)
+            if pool is not None:
+                pool.discard(recipe_id)
+        return True
+
+    def visible(self, user_id: int, recipe_source: str = "both") -> Set[int]:
+        own = self._by_user.get(user_id, set())
+        if recipe_source == "mine":
+            return set(own)
+        if recipe_source == "mealflow":
+            return set(self._public)
+        return own | self._public
+
+    def recipes_with_ingredient(self, ingredient_id: int) -> Set[int]:
+        """Рецепты, в которых есть ингредиент (обратный индекс). Множество не копируется."""
+        return self._ingredient_recipes.get(ingredient_id, set())
+
+    def ingredient_postings(self) -> Dict[int, Set[int]]:
+        """Обратный индекс целиком: ingredient_id -> рецепты. Словарь не копируется."""
+        return self._ingredient_recipes
+
+    def ingredient_masks(self) -> Dict[int, int]:
+        """Битовые маски ингредиентов всех рецептов: recipe_id -> маска. Словарь не копируется."""
+        return self._ingredient_bits
+
+    def public_recipes(self) -> Set[int]:
+        return self._public
+
+    def user_recipes(self, user_id: int) -> Set[int]:
+        return self._by_user.get(user_id, set())
+
+    def nutrition(self, recipe_ids: Iterable[int]) -> Dict[int, Tuple]:
+        """КБЖУ и время приготовления рецептов в порядке NUTRITION_COLUMNS."""
+        return {recipe_id: self._nutrition[recipe_id] for recipe_id in recipe_ids if recipe_id in self._nutrition}
+
+    def candidates(self, user_id: int, recipe_source: str, excluded_ingredients: Iterable[int]) -> Dict[int, Set[int]]:
+        """Возвращает рецепты, доступные пользователю, сгруппированные по типам блюд."""
+        allowed = self.visible(user_id, recipe_source)
+        # Ингредиенты, которых нет ни в одном рецепте, ничего не исключают; в маску они не идут,
+        # чтобы произвольный id из запроса не раздувал её до 1 << id
+        known = self._ingredient_recipes
+        mask = ingredient_mask(i for i in excluded_ingredients if i in known)
+        if mask:
+            bits = self._ingredient_bits
+            allowed = {recipe_id for recipe_id in allowed if not bits.get(recipe_id, 0) & mask}
+        return {
+            meal_type_id: pool & allowed
+            for meal_type_id, pool in self._meal_type_pools.items()
+        }
+
+
+candidate_index = CandidateIndex()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, JSON, DateTime, String
+from sqlalchemy import Boolean, Column, Integer, ForeignKey, DateTime, Date, String, Index, CheckConstraint
 from sqlalchemy.orm import relationship
 from core.database import Base
 from datetime import datetime
@@ -10,14 +10,55 @@ class MealPlan(Base):
     start_date = Column(DateTime, default=datetime.utcnow)
     days = Column(Integer, nullable=False)  # Количество дней в плане
     persons = Column(Integer, nullable=False)  # Количество персон
-    plan = Column(JSON, nullable=False)  # Сгенерированный план в формате JSON
     recipe_source = Column(String, default="both")  # Источник рецептов: mine, mealflow, both
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Увеличивается при каждом изменении плана
     user = relationship("User", backref="meal_plans")
 
+class MealPlanEntry(Base):
+    __tablename__ = "meal_plan_entries"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    date = Column(Date, nullable=False)
+    meal_type_id = Column(Integer, ForeignKey("meal_types.id", ondelete="CASCADE"), nullable=False)
+    recipe_id = Column(Integer, ForeignKey("recipes.id", ondelete="CASCADE"), nullable=False)
+    recipe = relationship("Recipe")
+
+    __table_args__ = (
+        # Одна ячейка плана на пользователя, дату и тип блюда; recipe_id включен
+        # в индекс, чтобы чтение плана за период обходилось без обращения к таблице
+        Index("ux_meal_plan_entries_user_id_date_meal_type_id", "user_id", "date", "meal_type_id",
+              unique=True, postgresql_include=["recipe_id"]),
+    )
+
 class ExcludedIngredient(Base):
+    """Исключение пользователя: либо один ингредиент, либо целая категория вместе с подкатегориями."""
     __tablename__ = "excluded_ingredients"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    ingredient_id = Column(Integer, ForeignKey("ingredients.id"), nullable=False)
+    ingredient_id = Column(Integer, ForeignKey("ingredients.id"), nullable=True)
+    category_id = Column(Integer, ForeignKey("ingredient_categories.id", ondelete="CASCADE"), nullable=True)
     user = relationship("User", backref="excluded_ingredients")
     ingredient = relationship("Ingredient")
+
+    __table_args__ = (
+        Index("ix_excluded_ingredients_user_id_ingredient_id", "user_id", "ingredient_id"),
+        Index("ix_excluded_ingredients_user_id_category_id", "user_id", "category_id"),
+        CheckConstraint(
+            "(ingredient_id IS NULL) <> (category_id IS NULL)",
+            name="ck_excluded_ingredients_ingredient_or_category"
+        ),
+    )
+
+class MealPlanPrecomputeRun(Base):
+    """Проход предварительной генерации меню. Строки общие для всех воркеров: по ним
+    проверяется, был ли ночной проход за дату, и строится состояние для администратора."""
+    __tablename__ = "meal_plan_precompute_runs"
+    id = Column(Integer, primary_key=True, index=True)
+    run_date = Column(Date, nullable=False, index=True)
+    nightly = Column(Boolean, nullable=False, default=False)
+    week_start = Column(Date, nullable=False)
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)  # NULL — проход идет или был прерван
+    pending = Column(Integer, nullable=False, default=0)  # Пользователей с незаполненной неделей на начало прохода
+    prepared = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
@@ -1,29 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from apps.meal_planner.schemas import MealPlanCreate, MealPlan, ExcludedIngredient
-from apps.meal_planner.crud import create_meal_plan, get_meal_plan, get_excluded_ingredients, replace_recipe
+from apps.meal_planner.schemas import MealPlanCreate, MealPlanParams, MealPlan, ExcludedIngredient, ShoppingList, \
+    MealPlanBatchCreate, MealPlanBatchResult, MealPlanEdits, IngredientSubstitute, MAX_PLAN_DAYS
+from apps.meal_planner.batch import generate_plans_batch
+from apps.meal_planner import scheduler
+from apps.meal_planner.crud import create_meal_plan, get_meal_plan, get_excluded_ingredients, replace_recipe, \
+    replace_recipes, get_shopping_list, expand_plan_recipes, get_substitutes, stream_shopping_list, has_meal_plan
+from core.database import async_session
 from core.dependencies import get_db
 from apps.auth.routes import get_current_user
 from apps.auth.models import User
-from typing import List
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+import asyncio
+import csv
+import io
+import json
 import logging
 
 router = APIRouter(prefix="/meal-planner", tags=["meal-planner"])
 logger = logging.getLogger(__name__)
 
-MAX_DAYS = 7
+# Период списка покупок по умолчанию, если не указана дата окончания
+SHOPPING_LIST_DAYS = 7
+SHOPPING_LIST_CSV_HEADER = ["ingredient_id", "ingredient_name", "unit", "amount", "recipes"]
+
+
+async def ensure_admin(user: User = Depends(get_current_user)):
+    if not user.is_superuser:
+        raise HTTPException(status_code=403, detail="Только администраторы могут выполнять это действие")
+    return user
 
 
 @router.post("/generate", response_model=MealPlan)
 async def generate_meal_plan(
         data: MealPlanCreate,
+        expand: Optional[str] = Query(None, pattern="^recipes$", description="recipes — добавить краткие данные рецептов"),
         user: User = Depends(get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
-    logger.info(f"Generating meal plan for user_id={user.id}, days={data.days}, start_date={data.start_date}")
-    if data.days > MAX_DAYS:
-        logger.warning(f"Requested days ({data.days}) exceeds maximum ({MAX_DAYS})")
-        raise HTTPException(status_code=400, detail=f"Максимальный период — {MAX_DAYS} дней")
+    logger.info(f"Generating meal plan for user_id={user.id}, days={data.days}, start_date={data.start_date}, "
+                f"mode={data.mode}")
+    if data.days > MAX_PLAN_DAYS:
+        logger.warning(f"Requested days ({data.days}) exceeds maximum ({MAX_PLAN_DAYS})")
+        raise HTTPException(status_code=400, detail=f"Максимальный период — {MAX_PLAN_DAYS} дней")
     meal_plan = await create_meal_plan(
         db,
         user.id,
@@ -31,19 +52,33 @@ async def generate_meal_plan(
         data.days,
         data.persons,
         data.excluded_ingredients or [],
-        data.recipe_source
+        data.recipe_source,
+        data.nutrition_targets,
+        data.max_total_time,
+        data.no_repeat_days,
+        data.seed,
+        data.mode,
+        data.allow_substitutions,
+        data.excluded_categories
     )
+    if expand == "recipes":
+        meal_plan = await expand_plan_recipes(db, meal_plan)
     logger.info(f"Meal plan generated successfully for user_id={user.id}")
     return meal_plan
 
 
 @router.get("/current", response_model=MealPlan)
 async def get_current_meal_plan(
+        date_from: Optional[date] = Query(None, alias="from"),
+        date_to: Optional[date] = Query(None, alias="to"),
+        expand: Optional[str] = Query(None, pattern="^recipes$", description="recipes — добавить краткие данные рецептов"),
         user: User = Depends(get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
-    logger.info(f"Fetching current meal plan for user_id={user.id}")
-    meal_plan = await get_meal_plan(db, user.id)
+    if date_from and date_to and date_to < date_from:
+        raise HTTPException(status_code=400, detail="Дата окончания раньше даты начала")
+    logger.info(f"Fetching current meal plan for user_id={user.id}, from={date_from}, to={date_to}")
+    meal_plan = await get_meal_plan(db, user.id, date_from, date_to)
     if not meal_plan:
         logger.info(f"No meal plan found for user_id={user.id}, returning empty plan")
         return MealPlan(
@@ -54,6 +89,8 @@ async def get_current_meal_plan(
             persons=0,
             plan={}
         )
+    if expand == "recipes":
+        meal_plan = await expand_plan_recipes(db, meal_plan)
     logger.info(f"Current meal plan retrieved for user_id={user.id}")
     return meal_plan
 
@@ -69,9 +106,21 @@ async def get_user_excluded_ingredients(
     return excluded
 
 
+@router.get("/substitutions/{ingredient_id}", response_model=List[IngredientSubstitute])
+async def get_ingredient_substitutes(
+        ingredient_id: int,
+        limit: int = Query(5, ge=1, le=20),
+        user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    logger.info(f"Fetching substitutes for ingredient_id={ingredient_id}, user_id={user.id}")
+    return await get_substitutes(db, user.id, ingredient_id, limit)
+
+
 @router.post("/replace-recipe", response_model=MealPlan)
 async def replace_meal_plan_recipe(
         data: dict,
+        expand: Optional[str] = Query(None, pattern="^recipes$", description="recipes — добавить краткие данные рецептов"),
         user: User = Depends(get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
@@ -93,11 +142,148 @@ async def replace_meal_plan_recipe(
             meal_type_id,
             new_recipe_id
         )
+        if expand == "recipes":
+            meal_plan = await expand_plan_recipes(db, meal_plan)
         logger.info(f"Recipe replaced successfully for user_id={user.id}")
         return meal_plan
+    except HTTPException:
+        raise
     except ValueError as e:
         logger.error(f"Error replacing recipe: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Unexpected error replacing recipe: {str(e)}")
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+
+@router.post("/replace-recipes", response_model=MealPlan)
+async def replace_meal_plan_recipes(
+        data: MealPlanEdits,
+        expand: Optional[str] = Query(None, pattern="^recipes$", description="recipes — добавить краткие данные рецептов"),
+        user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    logger.info(f"Replacing {len(data.edits)} recipes for user_id={user.id}, version={data.version}")
+    try:
+        meal_plan = await replace_recipes(
+            db,
+            user.id,
+            [edit.model_dump() for edit in data.edits],
+            data.version
+        )
+        if expand == "recipes":
+            meal_plan = await expand_plan_recipes(db, meal_plan)
+        logger.info(f"Recipes replaced successfully for user_id={user.id}")
+        return meal_plan
+    except HTTPException:
+        raise
+    except ValueError as e:
+        logger.error(f"Error replacing recipes: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Unexpected error replacing recipes: {str(e)}")
+        raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+
+@router.get("/shopping-list", response_model=ShoppingList)
+async def get_meal_plan_shopping_list(
+        date_from: Optional[date] = Query(None, alias="from"),
+        date_to: Optional[date] = Query(None, alias="to"),
+        format: str = Query("json", pattern="^(json|csv)$"),
+        user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    date_from = date_from or datetime.utcnow().date()
+    date_to = date_to or date_from + timedelta(days=SHOPPING_LIST_DAYS - 1)
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="Дата окончания раньше даты начала")
+    logger.info(f"Building shopping list for user_id={user.id}, from={date_from}, to={date_to}, format={format}")
+
+    if format == "csv":
+        # Отсутствие меню проверяем до начала потока: после первой строки статус уже не изменить
+        if not await has_meal_plan(db, user.id):
+            raise HTTPException(status_code=404, detail="Меню не найдено")
+        # Сессия из get_db закрывается до начала отправки ответа, поэтому поток
+        # открывает собственную
+        async def csv_rows():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(SHOPPING_LIST_CSV_HEADER)
+            async with async_session() as session:
+                async for row in stream_shopping_list(session, user.id, date_from, date_to):
+                    writer.writerow([row.ingredient_id, row.ingredient_name, row.unit,
+                                     round(row.amount or 0, 2), row.recipes])
+                    if buffer.tell() > 8192:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+            yield buffer.getvalue()
+
+        filename = f"shopping-list_{date_from}_{date_to}.csv"
+        return StreamingResponse(
+            csv_rows(),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+
+    shopping_list = await get_shopping_list(db, user.id, date_from, date_to)
+    if shopping_list is None:
+        raise HTTPException(status_code=404, detail="Меню не найдено")
+    return shopping_list
+
+
+@router.post("/admin/generate-batch", response_model=MealPlanBatchResult)
+async def generate_meal_plans_batch(
+        data: MealPlanBatchCreate,
+        stream: bool = False,
+        user: User = Depends(ensure_admin),
+        db: AsyncSession = Depends(get_db)
+):
+    """Генерирует меню для списка пользователей.
+
+    При stream=true возвращает NDJSON: событие на каждого пользователя по мере
+    готовности и итоговую строку с event=done.
+    """
+    logger.info(f"Batch meal plan generation by user_id={user.id} for {len(data.user_ids)} users")
+    params = MealPlanParams(**data.model_dump(exclude={"user_ids", "workers"}))
+    if not stream:
+        return await generate_plans_batch(db, data.user_ids, params, data.workers)
+
+    async def events():
+        queue = asyncio.Queue()
+
+        async def run():
+            try:
+                async with async_session() as session:
+                    summary = await generate_plans_batch(session, data.user_ids, params, data.workers,
+                                                         queue.put_nowait)
+                queue.put_nowait({"event": "done", **summary})
+            except Exception as e:
+                logger.error(f"Batch meal plan generation failed: {str(e)}", exc_info=True)
+                queue.put_nowait({"event": "error", "error": str(e)})
+
+        task = asyncio.create_task(run())
+        while True:
+            event = await queue.get()
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+            if event["event"] in ("done", "error"):
+                break
+        await task
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@router.get("/admin/precompute")
+async def get_precompute_status(user: User = Depends(ensure_admin), db: AsyncSession = Depends(get_db)):
+    """Состояние предварительной генерации меню на следующую неделю: последние проходы и очередь."""
+    return await scheduler.precompute_status(db)
+
+
+@router.post("/admin/precompute")
+async def run_precompute(limit: Optional[int] = Query(None, ge=1), user: User = Depends(ensure_admin)):
+    """Запускает проход предварительной генерации вне расписания."""
+    logger.info(f"Meal plan precompute started manually by user_id={user.id}, limit={limit}")
+    result = await scheduler.precompute_once(limit)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Генерация уже выполняется")
+    return result
@@ -0,0 +1,113 @@
+import random
+from datetime import date, timedelta
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Set
+
+# Во сколько раз избранный рецепт выбирается чаще обычного
+FAVORITE_WEIGHT = 3.0
+# Множитель веса за каждое появление рецепта в плане за последние RECENCY_DAYS дней
+RECENT_WEIGHT = 0.5
+RECENCY_DAYS = 14
+# Окно без повторов по умолчанию: рецепт не ставится, если он был в плане в этот
+# день или в предыдущие NO_REPEAT_DAYS дней
+NO_REPEAT_DAYS = 1
+# Сколько раз перевыбирать рецепт, попавший в окно без повторов, прежде чем
+# перейти к выбору перебором
+MAX_REJECTIONS = 8
+
+
+class AliasTable:
+    """Взвешенная выборка методом alias (Vose): построение O(n), выбор O(1)."""
+
+    def __init__(self, items: Sequence[int], weights: Sequence[float]):
+        if not items:
+            raise ValueError("Пустой набор для выборки")
+        n = len(items)
+        total = float(sum(weights))
+        if total <= 0:
+            weights, total = [1.0] * n, float(n)
+        scaled = [w * n / total for w in weights]
+        self.items = list(items)
+        self.weights = list(weights)
+        self._prob = [1.0] * n
+        self._alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+
+    def draw(self, rng: random.Random) -> int:
+        i = rng.randrange(len(self.items))
+        return self.items[i] if rng.random() < self._prob[i] else self.items[self._alias[i]]
+
+
+class PlanSampler:
+    """Случайное заполнение плана с весами рецептов и окном без повторов.
+
+    Таблицы выборки строятся один раз на тип блюда, после чего каждая ячейка
+    заполняется за O(1) в среднем. Рецепт, уже стоящий в плане в пределах окна
+    no_repeat_days, отклоняется и выбирается заново; если подходящих рецептов
+    не осталось, повтор допускается.
+    """
+
+    def __init__(self, mt_recipes: Mapping[int, Sequence[int]], weights: Optional[Mapping[int, float]] = None,
+                 no_repeat_days: int = NO_REPEAT_DAYS, seed: Optional[int] = None):
+        weights = weights or {}
+        self.no_repeat_days = no_repeat_days
+        self.rng = random.Random(seed)
+        self.tables = {
+            mt_id: AliasTable(recipe_ids, [weights.get(r, 1.0) for r in recipe_ids])
+            for mt_id, recipe_ids in mt_recipes.items() if recipe_ids
+        }
+
+    def draw(self, meal_type_id: int, blocked: Set[int] = frozenset()) -> int:
+        table = self.tables[meal_type_id]
+        for _ in range(MAX_REJECTIONS):
+            recipe_id = table.draw(self.rng)
+            if recipe_id not in blocked:
+                return recipe_id
+        allowed = [(r, w) for r, w in zip(table.items, table.weights) if r not in blocked]
+        if not allowed:
+            return table.draw(self.rng)
+        recipe_ids, weights = zip(*allowed)
+        return self.rng.choices(recipe_ids, weights)[0]
+
+    def blocked(self, plan: Mapping[date, Mapping[int, int]], day: date) -> Set[int]:
+        """Рецепты плана в окне без повторов вокруг day (в обе стороны)."""
+        blocked = set()
+        for offset in range(-self.no_repeat_days, self.no_repeat_days + 1):
+            blocked.update(plan.get(day + timedelta(days=offset), {}).values())
+        return blocked
+
+    def fill(self, dates: Iterable[date],
+             history: Optional[Mapping[date, Mapping[int, int]]] = None) -> Dict[date, Dict[int, int]]:
+        """Заполняет дни dates. history — ячейки плана, которые остаются без изменений.
+
+        Дни не обязаны идти подряд: окно без повторов проверяется по соседним
+        дням как из history, так и из уже заполненных dates.
+        """
+        dates = list(dates)
+        plan = {day: cells for day, cells in (history or {}).items()}
+        for day in dates:
+            plan.pop(day, None)
+        new_plan = {}
+        for day in dates:
+            used = self.blocked(plan, day) if self.no_repeat_days else set()
+            cells = {}
+            for mt_id in self.tables:
+                cells[mt_id] = self.draw(mt_id, used)
+                if self.no_repeat_days:
+                    used.add(cells[mt_id])
+            new_plan[day] = plan[day] = cells
+        return new_plan
+
+
+def recipe_weights(favorites: Iterable[int], recent_counts: Mapping[int, int]) -> Dict[int, float]:
+    """Веса рецептов: избранные чаще, недавно стоявшие в плане — реже. Вес 1.0 не хранится."""
+    weights = {recipe_id: FAVORITE_WEIGHT for recipe_id in favorites}
+    for recipe_id, count in recent_counts.items():
+        weights[recipe_id] = weights.get(recipe_id, 1.0) * RECENT_WEIGHT ** count
+    return weights
@@ -0,0 +1,249 @@
+"""Предварительная генерация меню на следующую неделю.
+
+Планировщик запускается в lifespan приложения (MEAL_PLAN_PRECOMPUTE_ENABLED=true)
+или отдельным процессом:
+    python -m apps.meal_planner.scheduler [--once]
+
+Работа распределяется по ночам перед началом недели: за каждый запуск
+обрабатывается часть пользователей, у которых неделя еще не заполнена.
+Список таких пользователей вычисляется по БД, поэтому после перезапуска
+генерация продолжается с того же места. Одновременно работает только один
+экземпляр планировщика — это обеспечивает advisory lock в PostgreSQL. Каждый
+проход записывается в БД (meal_plan_precompute_runs); наличие завершенного
+ночного прохода за дату проверяется под блокировкой, так что за ночь проход
+выполняет один воркер. Состояние для администратора тоже строится по этой
+таблице, а не по памяти процесса.
+"""
+import argparse
+import asyncio
+import logging
+import math
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import distinct, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from apps.auth import models as auth_models  # noqa: F401 — модель User нужна для связей Recipe при запуске из CLI
+from apps.meal_planner.crud import create_meal_plan
+from apps.meal_planner.models import MealPlan, MealPlanEntry, MealPlanPrecomputeRun
+from apps.meal_planner.schemas import PLAN_HISTORY_DAYS
+from core.config import config
+from core.database import async_session, engine
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock, общий для всех воркеров
+ADVISORY_LOCK_KEY = 0x6D65616C
+# За сколько дней до начала недели начинается генерация
+LEAD_DAYS = 3
+WEEK_DAYS = 7
+# Как часто планировщик проверяет, наступили ли часы низкой нагрузки
+CHECK_INTERVAL_SECONDS = 600
+
+# Сколько последних проходов показывает состояние для администратора
+STATUS_RUNS = 10
+
+
+def upcoming_week_start(today: date) -> date:
+    """Понедельник следующей недели."""
+    return today + timedelta(days=WEEK_DAYS - today.weekday())
+
+
+def off_peak_hours() -> Tuple[int, int]:
+    start, end = config.MEAL_PLAN_PRECOMPUTE_HOURS.split("-")
+    return int(start), int(end)
+
+
+def is_off_peak(now: datetime) -> bool:
+    start, end = off_peak_hours()
+    if start <= end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end
+
+
+def pending_users_query(week_start: date, today: date):
+    """Пользователи с активным меню, у которых следующая неделя заполнена не полностью."""
+    week_end = week_start + timedelta(days=WEEK_DAYS - 1)
+    active = select(MealPlanEntry.user_id).filter(MealPlanEntry.date >= today - timedelta(days=PLAN_HISTORY_DAYS))
+    covered = (
+        select(MealPlanEntry.user_id)
+        .filter(MealPlanEntry.date.between(week_start, week_end))
+        .group_by(MealPlanEntry.user_id)
+        .having(func.count(distinct(MealPlanEntry.date)) >= WEEK_DAYS)
+    )
+    return (
+        select(MealPlan.user_id, MealPlan.persons, MealPlan.recipe_source)
+        .filter(MealPlan.user_id.in_(active), MealPlan.user_id.not_in(covered))
+        .order_by(MealPlan.user_id)
+    )
+
+
+async def prepare_user_week(user_id: int, persons: int, recipe_source: str, week_start: date):
+    """Дозаполняет неделю пользователя с его сохраненными параметрами; исключения не меняются."""
+    async with async_session() as db:
+        await create_meal_plan(
+            db,
+            user_id,
+            datetime.combine(week_start, datetime.min.time()),
+            WEEK_DAYS,
+            persons,
+            None,
+            recipe_source or "both",
+            mode="fill"
+        )
+
+
+def run_view(run: MealPlanPrecomputeRun) -> dict:
+    seconds = (run.finished_at - run.started_at).total_seconds() if run.finished_at else None
+    return {
+        "id": run.id,
+        "run_date": run.run_date,
+        "nightly": run.nightly,
+        "week_start": run.week_start,
+        "started_at": run.started_at,
+        "finished_at": run.finished_at,
+        "seconds": round(seconds, 3) if seconds is not None else None,
+        "pending": run.pending,
+        "prepared": run.prepared,
+        "failed": run.failed,
+    }
+
+
+async def precompute_once(limit: Optional[int] = None, nightly: bool = False) -> Optional[dict]:
+    """Один проход генерации. Возвращает None, если проход уже выполняет другой воркер.
+
+    При nightly=True обрабатывается только доля пользователей, приходящаяся на эту ночь,
+    и не больше одного раза за дату: если завершенный ночной проход за сегодня уже
+    записан в БД, возвращается None. Каждый проход записывается в meal_plan_precompute_runs.
+    """
+    today = datetime.utcnow().date()
+    week_start = upcoming_week_start(today)
+
+    # Блокировка сессионная, на соединении в autocommit: оно не держит открытую транзакцию
+    # все время прохода, а сами пользователи обрабатываются в отдельных сессиях
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        locked = (await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})).scalar()
+        if not locked:
+            logger.info("Meal plan precompute is already running in another worker")
+            return None
+        try:
+            async with async_session() as db:
+                if nightly:
+                    done = await db.execute(
+                        select(MealPlanPrecomputeRun.id).filter(
+                            MealPlanPrecomputeRun.run_date == today,
+                            MealPlanPrecomputeRun.nightly.is_(True),
+                            MealPlanPrecomputeRun.finished_at.is_not(None),
+                        ).limit(1)
+                    )
+                    if done.scalar() is not None:
+                        logger.info(f"Meal plan precompute for {today} has already run")
+                        return None
+                pending: List[tuple] = (await db.execute(pending_users_query(week_start, today))).all()
+                run = MealPlanPrecomputeRun(run_date=today, nightly=nightly, week_start=week_start,
+                                            pending=len(pending), prepared=0, failed=0)
+                db.add(run)
+                await db.commit()
+
+            if nightly:
+                limit = nightly_quota(len(pending), today)
+            if limit is not None:
+                pending = pending[:limit]
+
+            semaphore = asyncio.Semaphore(config.MEAL_PLAN_PRECOMPUTE_CONCURRENCY)
+
+            async def prepare(user_id: int, persons: int, recipe_source: str):
+                async with semaphore:
+                    try:
+                        await prepare_user_week(user_id, persons, recipe_source, week_start)
+                    except (HTTPException, ValueError) as e:
+                        run.failed += 1
+                        detail = e.detail if isinstance(e, HTTPException) else str(e)
+                        logger.warning(f"Meal plan precompute skipped user_id={user_id}: {detail}")
+                        return
+                    except Exception as e:
+                        run.failed += 1
+                        logger.error(f"Meal plan precompute failed for user_id={user_id}: {str(e)}", exc_info=True)
+                        return
+                    run.prepared += 1
+
+            await asyncio.gather(*(prepare(*row) for row in pending))
+            run.finished_at = datetime.utcnow()
+            async with async_session() as db:
+                run = await db.merge(run)
+                await db.commit()
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+
+    result = run_view(run)
+    logger.info(
+        f"Meal plan precompute for week {week_start}: prepared {run.prepared} "
+        f"of {len(pending)} in {result['seconds']:.1f}s, {run.failed} failed"
+    )
+    return result
+
+
+async def precompute_status(db: AsyncSession) -> dict:
+    """Состояние генерации по данным БД, одинаковое для всех воркеров."""
+    today = datetime.utcnow().date()
+    week_start = upcoming_week_start(today)
+    running = (await db.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND classid = 0 AND objid = :key AND granted)"),
+        {"key": ADVISORY_LOCK_KEY}
+    )).scalar()
+    pending = (await db.execute(
+        select(func.count()).select_from(pending_users_query(week_start, today).subquery())
+    )).scalar()
+    runs = (await db.execute(
+        select(MealPlanPrecomputeRun).order_by(MealPlanPrecomputeRun.id.desc()).limit(STATUS_RUNS)
+    )).scalars().all()
+    return {
+        "running": running,
+        "week_start": week_start,
+        "pending": pending,
+        "runs": [run_view(run) for run in runs],
+    }
+
+
+def nightly_quota(pending: int, today: date) -> int:
+    """Сколько пользователей обработать за ночь, чтобы к началу недели успеть всех."""
+    nights_left = max((upcoming_week_start(today) - today).days, 1)
+    return math.ceil(pending / nights_left)
+
+
+async def run_scheduler():
+    """Цикл планировщика: раз за ночь обрабатывает свою долю пользователей."""
+    logger.info(f"Meal plan precompute scheduler started, off-peak hours {config.MEAL_PLAN_PRECOMPUTE_HOURS} UTC")
+    while True:
+        try:
+            now = datetime.utcnow()
+            today = now.date()
+            days_before_week = (upcoming_week_start(today) - today).days
+            if is_off_peak(now) and days_before_week <= LEAD_DAYS:
+                await precompute_once(nightly=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Meal plan precompute scheduler error: {str(e)}", exc_info=True)
+        await asyncio.sleep(CHECK_INTERVAL_SECONDS)
+
+
+async def _main(args):
+    try:
+        if args.once:
+            print(await precompute_once(args.limit))
+        else:
+            await run_scheduler()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Предварительная генерация меню на следующую неделю")
+    parser.add_argument("--once", action="store_true", help="Выполнить один проход без учета расписания")
+    parser.add_argument("--limit", type=int, help="Максимальное число пользователей за проход")
+    asyncio.run(_main(parser.parse_args()))
@@ -1,7 +1,17 @@
-from pydantic import BaseModel, Field, ConfigDict, validator
+from pydantic import BaseModel, Field, ConfigDict, conint, validator
 from typing import List, Optional, Dict
 from datetime import datetime, date, timedelta
 from fastapi import HTTPException
+from apps.recipes.schemas import RecipeSummary, Ingredient
+
+# На сколько дней вперед от текущей даты может начинаться меню
+MAX_START_OFFSET_DAYS = 14
+# Максимальная длина периода одной генерации
+MAX_PLAN_DAYS = 31
+# Сколько дней прошедшего меню хранится
+PLAN_HISTORY_DAYS = 14
+# Сколько ингредиентов можно исключить в одном запросе генерации
+MAX_EXCLUDED_INGREDIENTS = 500
 
 class MealType(BaseModel):
     id: int
@@ -11,7 +21,8 @@ class MealType(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 class ExcludedIngredientBase(BaseModel):
-    ingredient_id: int = Field(..., gt=0)
+    ingredient_id: Optional[int] = Field(None, gt=0)
+    category_id: Optional[int] = Field(None, gt=0, description="Исключенная категория ингредиентов")
 
 class ExcludedIngredientCreate(ExcludedIngredientBase):
     pass
@@ -22,33 +33,93 @@ class ExcludedIngredient(ExcludedIngredientBase):
 
     model_config = ConfigDict(from_attributes=True)
 
-class MealPlanCreate(BaseModel):
+class MealPlanParams(BaseModel):
+    """Параметры подбора меню, общие для генерации одному пользователю и массовой генерации."""
     start_date: datetime = Field(..., description="Дата начала генерации меню")
-    days: int = Field(..., ge=1, le=7)
+    days: int = Field(..., ge=1, le=MAX_PLAN_DAYS)
     persons: int = Field(..., ge=1)
-    excluded_ingredients: Optional[List[int]] = []
+    excluded_ingredients: Optional[List[conint(gt=0)]] = Field(default=[], max_length=MAX_EXCLUDED_INGREDIENTS)
     recipe_source: str = Field(default="both", pattern="^(mine|mealflow|both)$")
+    target_calories: Optional[float] = Field(None, gt=0, description="Целевая калорийность на человека в день")
+    target_proteins: Optional[float] = Field(None, gt=0, description="Целевое количество белков в день, г")
+    target_fats: Optional[float] = Field(None, gt=0, description="Целевое количество жиров в день, г")
+    target_carbohydrates: Optional[float] = Field(None, gt=0, description="Целевое количество углеводов в день, г")
+    max_total_time: Optional[int] = Field(None, gt=0, description="Максимальное время готовки за день, мин")
+    no_repeat_days: int = Field(1, ge=0, le=14, description="Сколько предыдущих дней рецепт не должен повторяться")
+    seed: Optional[int] = Field(None, description="Зерно генератора для воспроизводимого меню")
+
+    @property
+    def nutrition_targets(self) -> Dict[str, Optional[float]]:
+        return {
+            "calories": self.target_calories,
+            "proteins": self.target_proteins,
+            "fats": self.target_fats,
+            "carbohydrates": self.target_carbohydrates,
+        }
 
     @validator("start_date")
     def validate_start_date(cls, v):
         today = datetime.utcnow().date()
-        max_date = today + timedelta(days=14)
+        max_date = today + timedelta(days=MAX_START_OFFSET_DAYS)
         start_date = v.date()
         if start_date < today:
             raise HTTPException(status_code=400, detail="Нельзя генерировать меню на прошлые даты")
         if start_date > max_date:
-            raise HTTPException(status_code=400, detail="Дата начала не может быть позже чем +14 дней от текущей")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Дата начала не может быть позже чем +{MAX_START_OFFSET_DAYS} дней от текущей"
+            )
         return v
 
-    @validator("days")
-    def validate_days(cls, v, values):
-        if "start_date" in values:
-            start_date = values["start_date"].date()
-            today = datetime.utcnow().date()
-            max_days = (today + timedelta(days=14) - start_date).days + 1
-            if v > max_days:
-                raise HTTPException(status_code=400, detail=f"Количество дней не может превышать {max_days}")
-        return v
+class MealPlanCreate(MealPlanParams):
+    excluded_categories: Optional[List[int]] = Field(
+        None, description="Исключаемые категории ингредиентов вместе с подкатегориями; если не указано, остаются прежние"
+    )
+    allow_substitutions: bool = Field(
+        True, description="Если исключения не оставили рецептов, предлагать рецепты с заменой ингредиентов"
+    )
+    mode: str = Field(
+        default="replace", pattern="^(replace|fill)$",
+        description="replace — пересоздать все дни периода, fill — только отсутствующие и ставшие недоступными"
+    )
+
+class MealPlanCellEdit(BaseModel):
+    date: date
+    meal_type_id: int = Field(..., gt=0)
+    new_recipe_id: Optional[int] = Field(None, gt=0, description="Если не указан, рецепт подбирается случайно")
+
+class MealPlanEdits(BaseModel):
+    version: Optional[int] = Field(
+        None, ge=1, description="Версия меню, на основе которой сделаны изменения; при расхождении вернется 409"
+    )
+    edits: List[MealPlanCellEdit] = Field(..., min_length=1, max_length=500)
+
+class MealPlanBatchCreate(MealPlanParams):
+    """Массовая генерация всегда пересоздает период и не меняет сохраненные исключения;
+    поля, которые она не поддерживает (mode, allow_substitutions, excluded_categories), дают 422."""
+    model_config = ConfigDict(extra="forbid")
+
+    user_ids: List[int] = Field(..., min_length=1, description="Пользователи, для которых генерируется меню")
+    workers: Optional[int] = Field(None, ge=1, le=64, description="Число процессов для подбора рецептов")
+
+class MealPlanBatchFailure(BaseModel):
+    user_id: int
+    error: str
+
+class MealPlanBatchResult(BaseModel):
+    total: int
+    succeeded: int
+    failed: List[MealPlanBatchFailure] = []
+    elapsed_seconds: float
+    plans_per_second: float
+
+class NutritionTotals(BaseModel):
+    """Суммы КБЖУ на всех персон плана и суммарное время приготовления, мин."""
+    calories: float = 0
+    proteins: float = 0
+    fats: float = 0
+    carbohydrates: float = 0
+    total_time: float = 0
 
 class MealPlan(BaseModel):
     id: Optional[int] = None
@@ -59,6 +130,16 @@ class MealPlan(BaseModel):
     plan: Dict
     meal_types: List[MealType] = []
     recipe_source: str = "both"
+    version: Optional[int] = None
+    recipes: Optional[Dict[int, RecipeSummary]] = Field(
+        None, description="Краткие данные рецептов плана, заполняется при expand=recipes"
+    )
+    generated_dates: List[date] = Field(default=[], description="Дни, рецепты которых подобраны этим запросом")
+    daily_totals: Dict[str, NutritionTotals] = {}
+    substitutions: Dict[int, Dict[int, int]] = Field(
+        default={}, description="recipe_id -> {исключенный ингредиент: замена}"
+    )
+    totals: Optional[NutritionTotals] = None
 
     model_config = ConfigDict(
         from_attributes=True,
@@ -66,3 +147,20 @@ class MealPlan(BaseModel):
             datetime: lambda v: v.isoformat() if v else None
         }
     )
+
+class IngredientSubstitute(BaseModel):
+    ingredient: Ingredient
+    score: float = Field(..., description="Оценка взаимозаменяемости от 0 до 1")
+
+class ShoppingListItem(BaseModel):
+    ingredient_id: int
+    ingredient_name: str
+    unit: str
+    amount: float
+    recipes: int = Field(..., description="Количество блюд в плане, где используется ингредиент")
+
+class ShoppingList(BaseModel):
+    date_from: date
+    date_to: date
+    persons: int
+    items: List[ShoppingListItem] = []
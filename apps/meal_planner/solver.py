@@ -0,0 +1,200 @@
+import warnings
+from datetime import date, timedelta
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from apps.meal_planner.sampler import NO_REPEAT_DAYS, PlanSampler
+
+# Столбцы матрицы характеристик рецепта (значения на одну порцию)
+NUTRITION_FIELDS = ("calories", "proteins", "fats", "carbohydrates", "total_time")
+TIME_COLUMN = NUTRITION_FIELDS.index("total_time")
+
+# Количество проходов покоординатного спуска по типам блюд
+SWEEPS = 3
+# Из скольких лучших кандидатов выбирается блюдо, чтобы меню не было одинаковым
+TOP_K = 5
+# Вес штрафа за превышение времени приготовления относительно отклонения по КБЖУ
+TIME_PENALTY = 10.0
+# Штраф за рецепт с меньшим весом выборки (недавно стоял в плане, не в избранном):
+# RECENCY_PENALTY * ln(наибольший вес в пуле / вес рецепта). Одно появление рецепта
+# за RECENCY_DAYS весит примерно как отклонение калорийности на 19%
+RECENCY_PENALTY = 0.05
+
+
+def nutrition_matrix(recipe_ids: Sequence[int], nutrition: Mapping[int, Tuple]) -> np.ndarray:
+    """Матрица (рецепты x NUTRITION_FIELDS). Пропуски заполняются средним по столбцу."""
+    matrix = np.array(
+        [[np.nan if v is None else v for v in nutrition[recipe_id]] for recipe_id in recipe_ids],
+        dtype=np.float64
+    ).reshape(len(recipe_ids), len(NUTRITION_FIELDS))
+    if np.isnan(matrix).any():
+        with warnings.catch_warnings():
+            # Столбец целиком из пропусков даёт предупреждение и заполняется нулями
+            warnings.simplefilter("ignore", RuntimeWarning)
+            means = np.nan_to_num(np.nanmean(matrix, axis=0))
+        rows, cols = np.nonzero(np.isnan(matrix))
+        matrix[rows, cols] = means[cols]
+    return matrix
+
+
+def _score(totals: np.ndarray, targets: np.ndarray, max_total_time: Optional[float]) -> np.ndarray:
+    """Отклонение дневных сумм от целей. totals имеет форму (..., NUTRITION_FIELDS)."""
+    score = np.zeros(totals.shape[:-1])
+    mask = ~np.isnan(targets)
+    if mask.any():
+        deviation = (totals[..., :TIME_COLUMN][..., mask] - targets[mask]) / targets[mask]
+        score += np.square(deviation).sum(axis=-1)
+    if max_total_time:
+        overtime = np.maximum(totals[..., TIME_COLUMN] - max_total_time, 0) / max_total_time
+        score += TIME_PENALTY * np.square(overtime)
+    return score
+
+
+def weight_penalties(pool: Sequence[int], weights: Mapping[int, float]) -> np.ndarray:
+    """Штрафы RECENCY_PENALTY за вес выборки: у рецепта с наибольшим весом в пуле штраф 0."""
+    values = np.array([weights.get(recipe_id, 1.0) for recipe_id in pool], dtype=np.float64)
+    values = np.maximum(values, np.finfo(np.float64).tiny)
+    return RECENCY_PENALTY * np.log(values.max() / values)
+
+
+def _pick_unblocked(scores: np.ndarray, blocked: np.ndarray, top_k: int, rng: np.random.Generator) -> int:
+    """Один из top_k лучших незаблокированных кандидатов; если все top_k заблокированы — лучший
+    незаблокированный, если заблокированы все — один из top_k лучших (повтор допускается)."""
+    order = np.argsort(scores, kind="stable")
+    best = order[:top_k]
+    allowed = best[~blocked[best]]
+    if not len(allowed):
+        allowed = order[~blocked[order]][:1]
+    if not len(allowed):
+        allowed = best
+    return int(allowed[rng.integers(len(allowed))])
+
+
+def solve_plan(
+        pools: Sequence[np.ndarray],
+        matrices: Sequence[np.ndarray],
+        days: int,
+        targets: Dict[str, Optional[float]],
+        max_total_time: Optional[float] = None,
+        rng: Optional[np.random.Generator] = None,
+        sweeps: int = SWEEPS,
+        top_k: int = TOP_K,
+        penalties: Optional[Sequence[np.ndarray]] = None,
+        neighbours: Optional[Sequence[Sequence[int]]] = None,
+        fixed: Optional[Sequence[Set[int]]] = None
+) -> np.ndarray:
+    """Подбирает рецепты на days дней так, чтобы дневные суммы были близки к целям.
+
+    pools[t] — идентификаторы рецептов для t-го типа блюда, matrices[t] — их
+    характеристики. targets — дневные цели по calories/proteins/fats/carbohydrates
+    на одного человека. Возвращает массив идентификаторов формы (days, len(pools)).
+
+    Начальный план выбирается случайно, затем для каждого типа блюда все кандидаты
+    оцениваются сразу для всех дней, и в каждый день ставится один из top_k лучших.
+    penalties[t] прибавляется к оценке кандидатов t-го типа. Если заданы neighbours
+    (индексы дней в окне без повторов вокруг дня d, включая сам d), рецепт не ставится
+    в день d, если он уже стоит в одном из этих дней или в fixed[d] — рецептах соседних
+    дней, которые не подбираются; тогда дни обходятся по очереди.
+    """
+    rng = rng or np.random.default_rng()
+    target_vector = np.array(
+        [np.nan if targets.get(field) is None else targets[field] for field in NUTRITION_FIELDS[:TIME_COLUMN]],
+        dtype=np.float64
+    )
+    day_index = np.arange(days)
+    picks = np.column_stack([rng.integers(len(pool), size=days) for pool in pools])
+    totals = np.zeros((days, len(NUTRITION_FIELDS)))
+    for t, matrix in enumerate(matrices):
+        totals += matrix[picks[:, t]]
+    plan = np.column_stack([pool[picks[:, t]] for t, pool in enumerate(pools)])
+
+    for _ in range(sweeps):
+        for t in rng.permutation(len(pools)):
+            matrix = matrices[t]
+            rest = totals - matrix[picks[:, t]]
+            scores = _score(rest[:, None, :] + matrix[None, :, :], target_vector, max_total_time)
+            if penalties is not None:
+                scores += penalties[t]
+            k = min(top_k, len(matrix))
+            if neighbours is not None:
+                for day in range(days):
+                    window = plan[list(neighbours[day])].ravel().tolist()
+                    window.remove(int(plan[day, t]))
+                    blocked = np.isin(pools[t], window + list(fixed[day] if fixed else ()))
+                    picks[day, t] = _pick_unblocked(scores[day], blocked, k, rng)
+                    plan[day, t] = pools[t][picks[day, t]]
+            else:
+                if k < len(matrix):
+                    best = np.argpartition(scores, k - 1, axis=1)[:, :k]
+                else:
+                    best = np.broadcast_to(np.arange(k), (days, k))
+                picks[:, t] = best[day_index, rng.integers(k, size=days)]
+                plan[:, t] = pools[t][picks[:, t]]
+            totals = rest + matrix[picks[:, t]]
+
+    return plan
+
+
+def has_targets(targets: Optional[Dict[str, Optional[float]]], max_total_time: Optional[float] = None) -> bool:
+    return bool(max_total_time) or bool(targets and any(v is not None for v in targets.values()))
+
+
+def choose_plan(
+        dates: List[date],
+        mt_recipes: Dict[int, List[int]],
+        nutrition: Optional[Mapping[int, Tuple]] = None,
+        targets: Optional[Dict[str, Optional[float]]] = None,
+        max_total_time: Optional[float] = None,
+        weights: Optional[Mapping[int, float]] = None,
+        no_repeat_days: int = NO_REPEAT_DAYS,
+        seed: Optional[int] = None,
+        history: Optional[Mapping[date, Mapping[int, int]]] = None
+) -> Dict[date, Dict[int, int]]:
+    """Заполняет дни рецептами из mt_recipes (тип блюда -> кандидаты).
+
+    Если заданы цели по КБЖУ или лимит времени, рецепты подбирает solve_plan по
+    характеристикам из nutrition, иначе их выбирает PlanSampler. В обоих случаях
+    учитываются веса weights (у solve_plan — как штраф) и окно без повторов, в том
+    числе по дням из history. При одинаковом seed результат повторяется.
+    """
+    if not has_targets(targets, max_total_time):
+        sampler = PlanSampler(mt_recipes, weights, no_repeat_days, seed)
+        return sampler.fill(dates, history)
+
+    new_plan = {day: {} for day in dates}
+    planned_types = [mt_id for mt_id, recipe_ids in mt_recipes.items() if recipe_ids]
+
+    nutrition = nutrition or {}
+    pools = {mt_id: np.array([r for r in mt_recipes[mt_id] if r in nutrition]) for mt_id in planned_types}
+    pools = {mt_id: pool for mt_id, pool in pools.items() if len(pool)}
+    if not pools:
+        return new_plan
+    # Рецепты соседних дней, которые остаются без изменений, как в PlanSampler.fill
+    kept = {day: cells for day, cells in (history or {}).items() if day not in new_plan}
+    fixed = [
+        {recipe_id
+         for offset in range(-no_repeat_days, no_repeat_days + 1)
+         for recipe_id in kept.get(day + timedelta(days=offset), {}).values()}
+        for day in dates
+    ]
+    # Дни не обязаны идти подряд (режим fill), поэтому окно считается по датам, а не по индексам
+    neighbours = [
+        [j for j, other in enumerate(dates) if abs((other - day).days) <= no_repeat_days]
+        for day in dates
+    ] if no_repeat_days else None
+    solution = solve_plan(
+        list(pools.values()),
+        [nutrition_matrix(pool, nutrition) for pool in pools.values()],
+        len(dates),
+        targets or {},
+        max_total_time,
+        np.random.default_rng(seed),
+        penalties=[weight_penalties(pool, weights or {}) for pool in pools.values()],
+        neighbours=neighbours,
+        fixed=fixed
+    )
+    for row, day in enumerate(dates):
+        for column, mt_id in enumerate(pools):
+            new_plan[day][mt_id] = int(solution[row, column])
+    return new_plan
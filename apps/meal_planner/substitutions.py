@@ -0,0 +1,151 @@
+"""Подбор замен ингредиентов по матрице совместной встречаемости.
+
+Два ингредиента считаются взаимозаменяемыми, если они встречаются с одними и
+теми же ингредиентами (близкие PPMI-векторы контекста), но редко — в одном
+рецепте друг с другом.
+"""
+import asyncio
+import logging
+import time
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from apps.meal_planner.index import CandidateIndex, candidate_index
+
+logger = logging.getLogger(__name__)
+
+# Матрица перестраивается после изменений каталога, но не чаще этого интервала
+SUBSTITUTIONS_MAX_AGE_SECONDS = 600
+# Минимальная оценка, при которой ингредиент предлагается как замена
+MIN_SUBSTITUTE_SCORE = 0.2
+# Ингредиенты из меньшего числа рецептов не предлагаются: статистики по ним мало
+MIN_INGREDIENT_RECIPES = 3
+# Сколько лучших замен хранится в кэше для каждого ингредиента
+CACHED_SUBSTITUTES = 50
+
+
+def build_similarity(postings: Dict[int, List[int]]):
+    """Строит по обратному индексу ингредиент -> рецепты матрицы для подбора замен.
+
+    Возвращает идентификаторы ингредиентов (порядок строк), нормированные
+    PPMI-векторы контекста, матрицу совместной встречаемости с нулевой
+    диагональю и число рецептов каждого ингредиента.
+    """
+    ingredient_ids = np.array(sorted(i for i, recipes in postings.items() if recipes), dtype=np.int64)
+    lengths = np.array([len(postings[i]) for i in ingredient_ids], dtype=np.int64)
+    columns = np.repeat(np.arange(len(ingredient_ids)), lengths)
+    recipe_ids = np.fromiter(
+        chain.from_iterable(postings[i] for i in ingredient_ids), dtype=np.int64, count=int(lengths.sum())
+    )
+    _, rows = np.unique(recipe_ids, return_inverse=True)
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(int(rows.max()) + 1 if len(rows) else 0, len(ingredient_ids))
+    )
+
+    cooccurrence = (incidence.T @ incidence).tocsr()
+    counts = cooccurrence.diagonal().copy()
+    cooccurrence.setdiag(0)
+    cooccurrence.eliminate_zeros()
+
+    pairs = cooccurrence.tocoo()
+    row_sums = np.asarray(cooccurrence.sum(axis=1)).ravel()
+    total = row_sums.sum()
+    with np.errstate(divide="ignore"):
+        pmi = np.log(pairs.data * total / (row_sums[pairs.row] * row_sums[pairs.col]))
+    keep = pmi > 0
+    context = sparse.csr_matrix((pmi[keep], (pairs.row[keep], pairs.col[keep])), shape=cooccurrence.shape)
+    norms = np.sqrt(np.asarray(context.multiply(context).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    context = sparse.diags(1 / norms) @ context
+    return ingredient_ids, context.tocsr(), cooccurrence, counts
+
+
+class SubstitutionIndex:
+    """Матрицы сходства ингредиентов, построенные по индексу кандидатов."""
+
+    def __init__(self, index: CandidateIndex):
+        self._index = index
+        self._generation: Optional[int] = None
+        self._built_at: Optional[float] = None
+        self._positions: Dict[int, int] = {}
+        self._ingredient_ids = np.zeros(0, dtype=np.int64)
+        self._context = None
+        self._cooccurrence = None
+        self._counts = np.zeros(0)
+        self._cache: Dict[int, List[Tuple[int, float]]] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._built_at is not None
+
+    async def ensure_fresh(self):
+        """Перестраивает матрицы, если каталог изменился и прошлая сборка устарела."""
+        if self._generation == self._index.generation:
+            return
+        if (self.is_ready and len(self._ingredient_ids)
+                and time.monotonic() - self._built_at < SUBSTITUTIONS_MAX_AGE_SECONDS):
+            return
+        async with self._lock:
+            if self._generation == self._index.generation:
+                return
+            generation = self._index.generation
+            # Копия снимается в потоке event loop, пока индекс не меняется;
+            # сами матрицы считаются в отдельном потоке
+            postings = {i: list(recipes) for i, recipes in self._index.ingredient_postings().items()}
+            started = time.monotonic()
+            ingredient_ids, context, cooccurrence, counts = await asyncio.to_thread(build_similarity, postings)
+            self._positions = {int(i): position for position, i in enumerate(ingredient_ids)}
+            self._ingredient_ids, self._context, self._cooccurrence, self._counts = (
+                ingredient_ids, context, cooccurrence, counts
+            )
+            self._cache = {}
+            self._generation = generation
+            self._built_at = time.monotonic()
+            logger.info(
+                f"Substitution matrix rebuilt: {len(ingredient_ids)} ingredients, {cooccurrence.nnz} pairs "
+                f"in {(self._built_at - started) * 1000:.1f} ms"
+            )
+
+    def _ranked(self, ingredient_id: int) -> List[Tuple[int, float]]:
+        ranked = self._cache.get(ingredient_id)
+        if ranked is not None:
+            return ranked
+        position = self._positions.get(ingredient_id)
+        if position is None:
+            return []
+        similarity = (self._context @ self._context[position].T).toarray().ravel()
+        together = self._cooccurrence[position].toarray().ravel()
+        smaller = np.maximum(np.minimum(self._counts[position], self._counts), 1)
+        scores = similarity * (1 - together / smaller)
+        scores[position] = 0
+        scores[self._counts < MIN_INGREDIENT_RECIPES] = 0
+        top = np.argsort(-scores)[:CACHED_SUBSTITUTES]
+        ranked = [
+            (int(self._ingredient_ids[i]), round(float(scores[i]), 3))
+            for i in top if scores[i] >= MIN_SUBSTITUTE_SCORE
+        ]
+        self._cache[ingredient_id] = ranked
+        return ranked
+
+    def suggest(self, ingredient_id: int, limit: int = 5, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Лучшие замены ингредиента: список (ingredient_id, оценка), без ингредиентов из exclude."""
+        exclude = set(exclude)
+        return [pair for pair in self._ranked(ingredient_id) if pair[0] not in exclude][:limit]
+
+    def swaps(self, ingredient_ids: Iterable[int], exclude: Set[int]) -> Optional[Dict[int, int]]:
+        """Замена для каждого из ingredient_ids или None, если хотя бы для одного замены нет."""
+        result = {}
+        for ingredient_id in ingredient_ids:
+            best = self.suggest(ingredient_id, 1, exclude)
+            if not best:
+                return None
+            result[ingredient_id] = best[0][0]
+        return result
+
+
+substitution_index = SubstitutionIndex(candidate_index)
@@ -1,7 +1,10 @@
+from typing import Optional
+from sqlalchemy import tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from apps.news.models import News
 from apps.auth.models import User
+from core.pagination import decode_cursor, next_cursor
 
 async def create_news(db: AsyncSession, title: str, content: str, image_path: str, user: User):
     db_news = News(
@@ -19,9 +22,20 @@ async def get_news_by_id(db: AsyncSession, news_id: int):
     result = await db.execute(select(News).filter(News.id == news_id))
     return result.scalars().first()
 
-async def get_all_news(db: AsyncSession, skip: int = 0, limit: int = 10):
-    result = await db.execute(select(News).offset(skip).limit(limit).order_by(News.created_at.desc()))
-    return result.scalars().all()
+async def get_all_news(db: AsyncSession, skip: int = 0, limit: int = 10, cursor: Optional[str] = None):
+    """Страница новостей от новых к старым и курсор следующей страницы.
+
+    Если передан cursor, страница выбирается по ключу (created_at, id) и skip не используется.
+    """
+    query = select(News).order_by(News.created_at.desc(), News.id.desc()).limit(limit)
+    if cursor:
+        created_at, news_id = decode_cursor(cursor, 2)
+        query = query.filter(tuple_(News.created_at, News.id) < tuple_(created_at, news_id))
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    news = result.scalars().all()
+    return news, next_cursor(news, limit, lambda n: n.created_at, lambda n: n.id)
 
 async def update_news(db: AsyncSession, news: News, title: str | None, content: str | None, image_path: str | None):
     if title is not None:
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
 from sqlalchemy.sql import func
 from core.database import Base
 
@@ -9,5 +9,10 @@ class News(Base):
     content = Column(String, nullable=False)
     image_path = Column(String, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, nullable=False, default=func.now(), server_default=func.now())  # Ключ сортировки ленты, без NULL
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Ключ сортировки ленты и курсора постраничной выборки
+        Index("ix_news_created_at_id", "created_at", "id"),
+    )
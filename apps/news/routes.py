@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Form, Response
 from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from apps.news.schemas import NewsCreate, NewsOut, NewsUpdate
@@ -6,6 +6,7 @@ from apps.news.crud import create_news, get_news_by_id, get_all_news, update_new
 from apps.auth.routes import get_current_user
 from apps.auth.models import User
 from core.dependencies import get_db
+from core.pagination import NEXT_CURSOR_HEADER
 from minio import Minio
 from minio.error import S3Error
 import os
@@ -75,9 +76,16 @@ async def read_news(news_id: int, db: AsyncSession = Depends(get_db)):
     return news
 
 @router.get("/", response_model=list[NewsOut])
-async def read_all_news(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_db)):
-    """Получает список всех новостей с пагинацией."""
-    news = await get_all_news(db, skip, limit)
+async def read_all_news(response: Response, skip: int = 0, limit: int = 10, cursor: str | None = None,
+                        db: AsyncSession = Depends(get_db)):
+    """Получает список всех новостей с пагинацией.
+
+    Курсор следующей страницы возвращается в заголовке X-Next-Cursor; его можно
+    передать в параметре cursor вместо skip.
+    """
+    news, cursor = await get_all_news(db, skip, limit, cursor)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
     return news
 
 @router.put("/{news_id}", response_model=NewsOut)
@@ -0,0 +1,180 @@
+"""Кэш готовых JSON-документов рецептов для GET /recipes/{recipe_id}.
+
+Два уровня: LRU в памяти воркера и необязательный общий уровень (Redis или
+его заменитель в памяти процесса), общий для всех воркеров. Ключ документа —
+id рецепта и его версия; запись рецепта увеличивает версию, поэтому старые
+документы просто перестают находиться. Без общего уровня версии локальны для
+воркера, и изменения из других воркеров видны не позже чем через TTL; доступ
+к рецепту в этом случае маршрут проверяет по БД, а не по сохраненному документу.
+"""
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from core.config import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedRecipe:
+    body: bytes  # JSON схемы Recipe
+    user_id: int
+    is_public: bool
+
+    def to_bytes(self) -> bytes:
+        return f"{self.user_id} {int(self.is_public)}\n".encode() + self.body
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CachedRecipe":
+        header, body = data.split(b"\n", 1)
+        user_id, is_public = header.split()
+        return cls(body, int(user_id), is_public == b"1")
+
+
+class MemorySharedTier:
+    """Общий уровень в памяти процесса с тем же интерфейсом, что и Redis. Для разработки и тестов."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = self._data.get(key)
+        if value is None:
+            return None
+        data, expires = value
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return None
+        return data
+
+    async def set(self, key: str, value: bytes, ex: Optional[int] = None):
+        self._data[key] = (value, time.monotonic() + ex if ex else None)
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        self._data[key] = (str(value).encode(), None)
+        return value
+
+
+def shared_tier_from_config():
+    """Общий уровень по RECIPE_CACHE_SHARED_URL: пусто — нет, "memory" — в памяти, redis://... — Redis."""
+    url = config.RECIPE_CACHE_SHARED_URL
+    if not url:
+        return None
+    if url == "memory":
+        return MemorySharedTier()
+    try:
+        from redis import asyncio as redis
+    except ImportError:
+        logger.warning("RECIPE_CACHE_SHARED_URL is set but the redis package is not installed; shared tier disabled")
+        return None
+    return redis.from_url(url)
+
+
+class RecipeDocumentCache:
+    def __init__(self, max_entries: int, ttl_seconds: int, shared=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[CachedRecipe, float]]" = OrderedDict()
+        self._versions: Dict[int, int] = {}
+        self.stats = {
+            "local_hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0, "evictions": 0,
+            "hit_seconds": 0.0, "miss_seconds": 0.0,
+        }
+
+    async def version(self, recipe_id: int) -> int:
+        if self.shared is not None:
+            return int(await self.shared.get(f"recipe:{recipe_id}:version") or 0)
+        return self._versions.get(recipe_id, 0)
+
+    async def invalidate(self, recipe_id: int):
+        """Вызывается после каждой записи рецепта (после commit)."""
+        self.stats["invalidations"] += 1
+        if self.shared is not None:
+            try:
+                await self.shared.incr(f"recipe:{recipe_id}:version")
+            except Exception as e:
+                logger.error(f"Recipe cache shared invalidation failed for recipe_id={recipe_id}: {str(e)}")
+        self._versions[recipe_id] = self._versions.get(recipe_id, 0) + 1
+        for key in [key for key in self._entries if key[0] == recipe_id]:
+            del self._entries[key]
+
+    def _get_local(self, key: Tuple[int, int]) -> Optional[CachedRecipe]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        document, expires = item
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return document
+
+    def _put_local(self, key: Tuple[int, int], document: CachedRecipe):
+        self._entries[key] = (document, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def get_or_load(self, recipe_id: int,
+                          load: Callable[[], Awaitable[Optional[CachedRecipe]]]) -> Tuple[Optional[CachedRecipe], str]:
+        """Документ рецепта и источник: "local", "shared" или "miss". Отсутствующие рецепты не кэшируются."""
+        started = time.perf_counter()
+        try:
+            key = (recipe_id, await self.version(recipe_id))
+            shared_key = f"recipe:{recipe_id}:v{key[1]}"
+            document = self._get_local(key)
+            if document is not None:
+                self.stats["local_hits"] += 1
+                self.stats["hit_seconds"] += time.perf_counter() - started
+                return document, "local"
+            if self.shared is not None:
+                data = await self.shared.get(shared_key)
+                if data is not None:
+                    document = CachedRecipe.from_bytes(data)
+                    self._put_local(key, document)
+                    self.stats["shared_hits"] += 1
+                    self.stats["hit_seconds"] += time.perf_counter() - started
+                    return document, "shared"
+        except Exception as e:
+            # Недоступный общий уровень не должен ломать чтение рецепта
+            logger.error(f"Recipe cache lookup failed for recipe_id={recipe_id}: {str(e)}")
+            return await load(), "miss"
+
+        document = await load()
+        self.stats["misses"] += 1
+        self.stats["miss_seconds"] += time.perf_counter() - started
+        if document is not None:
+            self._put_local(key, document)
+            if self.shared is not None:
+                try:
+                    await self.shared.set(shared_key, document.to_bytes(), ex=self.ttl_seconds)
+                except Exception as e:
+                    logger.error(f"Recipe cache shared store failed for recipe_id={recipe_id}: {str(e)}")
+        return document, "miss"
+
+    def report(self) -> dict:
+        """Счетчики и средняя задержка попадания и промаха, мс."""
+        hits = self.stats["local_hits"] + self.stats["shared_hits"]
+        misses = self.stats["misses"]
+        return {
+            **{k: v for k, v in self.stats.items() if not k.endswith("_seconds")},
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "shared_tier": type(self.shared).__name__ if self.shared is not None else None,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+            "avg_hit_ms": round(self.stats["hit_seconds"] / hits * 1000, 3) if hits else None,
+            "avg_miss_ms": round(self.stats["miss_seconds"] / misses * 1000, 3) if misses else None,
+        }
+
+
+recipe_cache = RecipeDocumentCache(
+    config.RECIPE_CACHE_SIZE,
+    config.RECIPE_CACHE_TTL_SECONDS,
+    shared_tier_from_config()
+)
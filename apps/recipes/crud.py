@@ -1,8 +1,15 @@
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, func, insert, literal, literal_column, union_all, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload
-from apps.recipes.models import Recipe, RecipeIngredient, Ingredient, RecipeMealType, MealType, RecipeDishCategory, DishCategory, RecipeTag, Tag
+from apps.recipes.models import Recipe, RecipeIngredient, Ingredient, RecipeMealType, MealType, RecipeDishCategory, DishCategory, RecipeTag, Tag, IngredientCategory, IngredientCategoryClosure
 from apps.recipes.schemas import RecipeCreate, RecipeUpdate
+from apps.meal_planner.index import candidate_index
+from apps.recipes.cache import recipe_cache
+from apps.recipes.pantry import pantry_index
+from apps.recipes.reference import reference_snapshot
+from apps.recipes.search import apply_search
+from core.pagination import decode_cursor, next_cursor
 from fastapi import HTTPException
 import logging
 from sqlalchemy.orm import selectinload
@@ -10,29 +17,182 @@ from sqlalchemy.orm import selectinload
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Колонки схемы RecipeSummary
+RECIPE_SUMMARY_COLUMNS = (
+    Recipe.id, Recipe.title, Recipe.image_path, Recipe.image_version, Recipe.total_time, Recipe.servings,
+    Recipe.calories, Recipe.proteins, Recipe.fats, Recipe.carbohydrates,
+)
+
+async def get_recipe_summaries(db: AsyncSession, recipe_ids) -> dict:
+    """Краткие данные рецептов одним запросом по колонкам: recipe_id -> dict."""
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return {}
+    result = await db.execute(select(*RECIPE_SUMMARY_COLUMNS).filter(Recipe.id.in_(recipe_ids)))
+    return {row.id: dict(row._mapping) for row in result.all()}
+
+async def search_by_pantry(db: AsyncSession, user_id: int, ingredient_ids: list, min_coverage: float = 0.0,
+                           max_missing: int = None, limit: int = 20) -> list:
+    """Рецепты, которые можно приготовить из имеющихся ингредиентов, с недостающими ингредиентами."""
+    await candidate_index.ensure_loaded(db)
+    matches = pantry_index.search(user_id, ingredient_ids, min_coverage, max_missing, limit)
+    summaries = await get_recipe_summaries(db, [m["recipe_id"] for m in matches])
+    missing_ids = {i for m in matches for i in m["missing_ingredient_ids"]}
+    ingredients = {}
+    if missing_ids:
+        result = await db.execute(select(Ingredient).filter(Ingredient.id.in_(missing_ids)))
+        ingredients = {ingredient.id: ingredient for ingredient in result.scalars().all()}
+    logger.info(f"Pantry search for user_id={user_id}: {len(ingredient_ids)} ingredients, {len(matches)} recipes")
+    return [
+        {
+            "recipe": summaries[m["recipe_id"]],
+            "coverage": m["coverage"],
+            "matched": m["matched"],
+            "total": m["total"],
+            "missing_ingredients": [ingredients[i] for i in m["missing_ingredient_ids"] if i in ingredients],
+        }
+        for m in matches if m["recipe_id"] in summaries
+    ]
+
+# Жадная загрузка всех связей рецепта для ответа API: по запросу на коллекцию,
+# справочные записи присоединяются к нему через JOIN
+RECIPE_DETAIL_OPTIONS = (
+    selectinload(Recipe.ingredients).joinedload(RecipeIngredient.ingredient),
+    selectinload(Recipe.meal_types).joinedload(RecipeMealType.meal_type),
+    selectinload(Recipe.dish_categories).joinedload(RecipeDishCategory.dish_category),
+    selectinload(Recipe.tags).joinedload(RecipeTag.tag),
+)
+
+async def load_recipe(db: AsyncSession, recipe_id: int) -> Recipe:
+    """Рецепт со всеми связями; уже загруженные в сессию объекты перечитываются."""
+    result = await db.execute(
+        select(Recipe)
+        .options(*RECIPE_DETAIL_OPTIONS)
+        .filter(Recipe.id == recipe_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().one()
+
+async def ensure_exist(db: AsyncSession, model, ids, detail: str):
+    """Проверяет одним запросом, что все ids есть в таблице model; иначе 400 с detail для первого отсутствующего."""
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return
+    result = await db.execute(select(model.id).filter(model.id.in_(ids)))
+    found = set(result.scalars().all())
+    for item_id in ids:
+        if item_id not in found:
+            raise HTTPException(status_code=400, detail=detail.format(id=item_id))
+
+async def validate_recipe_links(db: AsyncSession, recipe):
+    """Проверяет ссылки рецепта на справочники — по одному запросу на справочник. Пропущенные списки (None) не проверяются."""
+    if recipe.ingredients is not None:
+        await ensure_exist(db, Ingredient, [i.ingredient_id for i in recipe.ingredients], "Ингредиент с ID {id} не найден")
+    if recipe.meal_type_ids is not None:
+        await ensure_exist(db, MealType, recipe.meal_type_ids, "Тип блюда с ID {id} не найден")
+    if recipe.dish_category_ids is not None:
+        await ensure_exist(db, DishCategory, recipe.dish_category_ids, "Категория блюда с ID {id} не найдена")
+    if recipe.tag_ids is not None:
+        await ensure_exist(db, Tag, recipe.tag_ids, "Тег с ID {id} не найден")
+
+# Таблицы связей рецепта: колонка-ссылка на справочник и изменяемые колонки строки
+RECIPE_LINKS = {
+    RecipeIngredient: ("ingredient_id", ("amount",)),
+    RecipeMealType: ("meal_type_id", ()),
+    RecipeDishCategory: ("dish_category_id", ()),
+    RecipeTag: ("tag_id", ()),
+}
+
+def recipe_link_rows(recipe) -> Dict[type, Optional[List[dict]]]:
+    """Строки связей из схемы рецепта (без recipe_id). None — список не передан и не меняется."""
+    return {
+        RecipeIngredient: None if recipe.ingredients is None else [
+            {"ingredient_id": i.ingredient_id, "amount": i.amount} for i in recipe.ingredients
+        ],
+        RecipeMealType: None if recipe.meal_type_ids is None else [
+            {"meal_type_id": meal_type_id} for meal_type_id in recipe.meal_type_ids
+        ],
+        RecipeDishCategory: None if recipe.dish_category_ids is None else [
+            {"dish_category_id": dish_category_id} for dish_category_id in recipe.dish_category_ids
+        ],
+        RecipeTag: None if recipe.tag_ids is None else [
+            {"tag_id": tag_id} for tag_id in recipe.tag_ids
+        ],
+    }
+
+async def insert_recipe_links(db: AsyncSession, recipe_id: int, recipe):
+    """Вставляет связи нового рецепта: по одному INSERT на таблицу."""
+    for model, rows in recipe_link_rows(recipe).items():
+        if rows:
+            await db.execute(insert(model).values([{"recipe_id": recipe_id, **row} for row in rows]))
+
+def diff_links(current: List[dict], desired: List[dict], key: str,
+               fields: Tuple[str, ...]) -> Tuple[List[dict], List[dict], List[int]]:
+    """Сравнивает текущие и нужные строки связей как мультимножества по key.
+
+    Совпавшие строки сохраняют свой id и обновляются, только если изменились
+    fields. Возвращает (строки для вставки, изменения по id, id для удаления).
+    """
+    by_key = {}
+    for row in current:
+        by_key.setdefault(row[key], []).append(row)
+    inserts, updates = [], []
+    for row in desired:
+        matches = by_key.get(row[key])
+        if not matches:
+            inserts.append(row)
+            continue
+        # Среди повторов одного ключа сначала берется строка с теми же значениями
+        existing = next((m for m in matches if all(m[f] == row[f] for f in fields)), matches[0])
+        matches.remove(existing)
+        changed = {f: row[f] for f in fields if existing[f] != row[f]}
+        if changed:
+            updates.append({"id": existing["id"], **changed})
+    delete_ids = [row["id"] for rows in by_key.values() for row in rows]
+    return inserts, updates, delete_ids
+
+async def sync_recipe_links(db: AsyncSession, recipe_id: int, links: Dict[type, Optional[List[dict]]]) -> Dict[str, int]:
+    """Приводит связи рецепта к links (модель -> строки без recipe_id), меняя только отличающиеся строки.
+
+    На каждую таблицу — одно чтение и не больше одного INSERT, UPDATE и DELETE.
+    Таблицы со значением None не трогаются. Возвращает число измененных строк.
+    """
+    counts = {"inserted": 0, "updated": 0, "deleted": 0}
+    for model, desired in links.items():
+        if desired is None:
+            continue
+        key, fields = RECIPE_LINKS[model]
+        columns = [model.id, getattr(model, key), *(getattr(model, f) for f in fields)]
+        result = await db.execute(select(*columns).filter(model.recipe_id == recipe_id).order_by(model.id))
+        current = [dict(row._mapping) for row in result.all()]
+        inserts, updates, delete_ids = diff_links(current, desired, key, fields)
+        if delete_ids:
+            await db.execute(delete(model).where(model.id.in_(delete_ids)))
+        if updates:
+            await db.execute(update(model), updates)
+        if inserts:
+            await db.execute(insert(model).values([{"recipe_id": recipe_id, **row} for row in inserts]))
+        counts["inserted"] += len(inserts)
+        counts["updated"] += len(updates)
+        counts["deleted"] += len(delete_ids)
+    return counts
+
 async def create_recipe(db: AsyncSession, recipe: RecipeCreate, user_id: int, image_path: str = None):
     existing_recipe_query = (
-        select(Recipe)
+        select(Recipe.id)
         .filter(
             Recipe.user_id == user_id,
             Recipe.title == recipe.title,
         )
     )
     result = await db.execute(existing_recipe_query)
-    existing_recipe = result.scalars().first()
+    existing_recipe_id = result.scalars().first()
 
-    if existing_recipe:
+    if existing_recipe_id:
         logger.info(f"Рецепт '{recipe.title}' уже существует для user_id={user_id}, возвращаем существующий")
-        await db.refresh(existing_recipe, attribute_names=["ingredients", "meal_types", "dish_categories", "tags"])
-        for ri in existing_recipe.ingredients:
-            await db.refresh(ri, attribute_names=["ingredient"])
-        for mt in existing_recipe.meal_types:
-            await db.refresh(mt, attribute_names=["meal_type"])
-        for dc in existing_recipe.dish_categories:
-            await db.refresh(dc, attribute_names=["dish_category"])
-        for rt in existing_recipe.tags:
-            await db.refresh(rt, attribute_names=["tag"])
-        return existing_recipe
+        return await load_recipe(db, existing_recipe_id)
+
+    await validate_recipe_links(db, recipe)
 
     steps_dict = [step.dict() for step in recipe.steps]
 
@@ -52,89 +212,26 @@ async def create_recipe(db: AsyncSession, recipe: RecipeCreate, user_id: int, im
     )
     db.add(db_recipe)
     await db.flush()
-
-    for ingredient in recipe.ingredients:
-        existing_ingredient = await db.execute(
-            select(Ingredient).filter(Ingredient.id == ingredient.ingredient_id)
-        )
-        ingredient_obj = existing_ingredient.scalars().first()
-        if not ingredient_obj:
-            raise HTTPException(status_code=400, detail=f"Ингредиент с ID {ingredient.ingredient_id} не найден")
-        db_ingredient = RecipeIngredient(
-            recipe_id=db_recipe.id,
-            ingredient_id=ingredient.ingredient_id,
-            amount=ingredient.amount
-        )
-        db.add(db_ingredient)
-
-    for meal_type_id in recipe.meal_type_ids:
-        existing_meal_type = await db.execute(
-            select(MealType).filter(MealType.id == meal_type_id)
-        )
-        meal_type_obj = existing_meal_type.scalars().first()
-        if not meal_type_obj:
-            raise HTTPException(status_code=400, detail=f"Тип блюда с ID {meal_type_id} не найден")
-        db_meal_type = RecipeMealType(
-            recipe_id=db_recipe.id,
-            meal_type_id=meal_type_id
-        )
-        db.add(db_meal_type)
-
-    for dish_category_id in recipe.dish_category_ids:
-        existing_dish_category = await db.execute(
-            select(DishCategory).filter(DishCategory.id == dish_category_id)
-        )
-        dish_category_obj = existing_dish_category.scalars().first()
-        if not dish_category_obj:
-            raise HTTPException(status_code=400, detail=f"Категория блюда с ID {dish_category_id} не найдена")
-        db_dish_category = RecipeDishCategory(
-            recipe_id=db_recipe.id,
-            dish_category_id=dish_category_id
-        )
-        db.add(db_dish_category)
-
-    for tag_id in recipe.tag_ids:
-        existing_tag = await db.execute(
-            select(Tag).filter(Tag.id == tag_id)
-        )
-        tag_obj = existing_tag.scalars().first()
-        if not tag_obj:
-            raise HTTPException(status_code=400, detail=f"Тег с ID {tag_id} не найден")
-        db_tag = RecipeTag(
-            recipe_id=db_recipe.id,
-            tag_id=tag_id
-        )
-        db.add(db_tag)
+    await insert_recipe_links(db, db_recipe.id, recipe)
 
     await db.commit()
-    await db.refresh(db_recipe, attribute_names=["ingredients", "meal_types", "dish_categories", "tags"])
-    for ri in db_recipe.ingredients:
-        await db.refresh(ri, attribute_names=["ingredient"])
-    for mt in db_recipe.meal_types:
-        await db.refresh(mt, attribute_names=["meal_type"])
-    for dc in db_recipe.dish_categories:
-        await db.refresh(dc, attribute_names=["dish_category"])
-    for rt in db_recipe.tags:
-        await db.refresh(rt, attribute_names=["tag"])
+    await recipe_cache.invalidate(db_recipe.id)
+    db_recipe = await load_recipe(db, db_recipe.id)
+    await candidate_index.refresh_recipe(db, db_recipe.id)
     logger.info(f"Создан новый рецепт: {db_recipe.title} для user_id={user_id}")
     return db_recipe
 
 async def update_recipe(db: AsyncSession, recipe_id: int, recipe_update: RecipeUpdate, user_id: int, image_path: str = None):
     result = await db.execute(
-        select(Recipe)
-        .options(
-            joinedload(Recipe.ingredients),
-            joinedload(Recipe.meal_types),
-            joinedload(Recipe.dish_categories),
-            joinedload(Recipe.tags)
-        )
-        .filter(Recipe.id == recipe_id, Recipe.user_id == user_id)
+        select(Recipe).filter(Recipe.id == recipe_id, Recipe.user_id == user_id)
     )
     db_recipe = result.scalars().first()
 
     if not db_recipe:
         raise HTTPException(status_code=404, detail="Рецепт не найден или не принадлежит вам")
 
+    await validate_recipe_links(db, recipe_update)
+
     update_data = recipe_update.dict(exclude_unset=True, exclude={"ingredients", "meal_type_ids", "dish_category_ids", "tag_ids"})
     for key, value in update_data.items():
         if key == "steps" and value is not None:
@@ -145,161 +242,257 @@ async def update_recipe(db: AsyncSession, recipe_id: int, recipe_update: RecipeU
     if image_path is not None:
         db_recipe.image_path = image_path
 
-    if recipe_update.ingredients is not None:
-        await db.execute(
-            RecipeIngredient.__table__.delete().where(RecipeIngredient.recipe_id == recipe_id)
-        )
-        for ingredient in recipe_update.ingredients:
-            existing_ingredient = await db.execute(
-                select(Ingredient).filter(Ingredient.id == ingredient.ingredient_id)
-            )
-            ingredient_obj = existing_ingredient.scalars().first()
-            if not ingredient_obj:
-                raise HTTPException(status_code=400, detail=f"Ингредиент с ID {ingredient.ingredient_id} не найден")
-            db_ingredient = RecipeIngredient(
-                recipe_id=db_recipe.id,
-                ingredient_id=ingredient.ingredient_id,
-                amount=ingredient.amount
-            )
-            db.add(db_ingredient)
-
-    if recipe_update.meal_type_ids is not None:
-        await db.execute(
-            RecipeMealType.__table__.delete().where(RecipeMealType.recipe_id == recipe_id)
-        )
-        for meal_type_id in recipe_update.meal_type_ids:
-            existing_meal_type = await db.execute(
-                select(MealType).filter(MealType.id == meal_type_id)
-            )
-            meal_type_obj = existing_meal_type.scalars().first()
-            if not meal_type_obj:
-                raise HTTPException(status_code=400, detail=f"Тип блюда с ID {meal_type_id} не найден")
-            db_meal_type = RecipeMealType(
-                recipe_id=db_recipe.id,
-                meal_type_id=meal_type_id
-            )
-            db.add(db_meal_type)
-
-    if recipe_update.dish_category_ids is not None:
-        await db.execute(
-            RecipeDishCategory.__table__.delete().where(RecipeDishCategory.recipe_id == recipe_id)
-        )
-        for dish_category_id in recipe_update.dish_category_ids:
-            existing_dish_category = await db.execute(
-                select(DishCategory).filter(DishCategory.id == dish_category_id)
-            )
-            dish_category_obj = existing_dish_category.scalars().first()
-            if not dish_category_obj:
-                raise HTTPException(status_code=400, detail=f"Категория блюда с ID {dish_category_id} не найдена")
-            db_dish_category = RecipeDishCategory(
-                recipe_id=db_recipe.id,
-                dish_category_id=dish_category_id
-            )
-            db.add(db_dish_category)
-
-    if recipe_update.tag_ids is not None:
-        await db.execute(
-            RecipeTag.__table__.delete().where(RecipeTag.recipe_id == recipe_id)
-        )
-        for tag_id in recipe_update.tag_ids:
-            existing_tag = await db.execute(
-                select(Tag).filter(Tag.id == tag_id)
-            )
-            tag_obj = existing_tag.scalars().first()
-            if not tag_obj:
-                raise HTTPException(status_code=400, detail=f"Тег с ID {tag_id} не найден")
-            db_tag = RecipeTag(
-                recipe_id=db_recipe.id,
-                tag_id=tag_id
-            )
-            db.add(db_tag)
+    changes = await sync_recipe_links(db, db_recipe.id, recipe_link_rows(recipe_update))
 
     await db.commit()
-    await db.refresh(db_recipe, attribute_names=["ingredients", "meal_types", "dish_categories", "tags"])
-    for ri in db_recipe.ingredients:
-        await db.refresh(ri, attribute_names=["ingredient"])
-    for mt in db_recipe.meal_types:
-        await db.refresh(mt, attribute_names=["meal_type"])
-    for dc in db_recipe.dish_categories:
-        await db.refresh(dc, attribute_names=["dish_category"])
-    for rt in db_recipe.tags:
-        await db.refresh(rt, attribute_names=["tag"])
-    logger.info(f"Обновлен рецепт: {db_recipe.title} для user_id={user_id}")
+    await recipe_cache.invalidate(db_recipe.id)
+    db_recipe = await load_recipe(db, db_recipe.id)
+    await candidate_index.refresh_recipe(db, db_recipe.id)
+    logger.info(f"Обновлен рецепт: {db_recipe.title} для user_id={user_id}, связи: {changes}")
     return db_recipe
 
-async def get_user_recipes(db: AsyncSession, user_id: int, show_mealflow: bool = False, search: str = "", skip: int = 0, limit: int = 10):
-    query = (
-        select(Recipe)
-        .options(
-            selectinload(Recipe.ingredients).selectinload(RecipeIngredient.ingredient),
-            selectinload(Recipe.meal_types).selectinload(RecipeMealType.meal_type),
-            selectinload(Recipe.dish_categories).selectinload(RecipeDishCategory.dish_category),
-            selectinload(Recipe.tags).selectinload(RecipeTag.tag)
-        )
-        .filter(Recipe.user_id == user_id)
-    )
+def visible_recipes_filter(user_id: int, show_mealflow: bool):
+    """Свои рецепты пользователя и, если show_mealflow, общедоступные."""
     if show_mealflow:
-        query = (
-            select(Recipe)
-            .options(
-                selectinload(Recipe.ingredients).selectinload(RecipeIngredient.ingredient),
-                selectinload(Recipe.meal_types).selectinload(RecipeMealType.meal_type),
-                selectinload(Recipe.dish_categories).selectinload(RecipeDishCategory.dish_category),
-                selectinload(Recipe.tags).selectinload(RecipeTag.tag)
-            )
-            .filter((Recipe.user_id == user_id) | (Recipe.is_public == True))
+        return (Recipe.user_id == user_id) | (Recipe.is_public == True)
+    return Recipe.user_id == user_id
+
+# Поля рецепта, которые можно выбрать параметром fields списка рецептов
+RECIPE_FIELD_COLUMNS = {
+    column.key: column for column in (
+        Recipe.id, Recipe.title, Recipe.description, Recipe.steps, Recipe.total_time, Recipe.servings,
+        Recipe.calories, Recipe.proteins, Recipe.fats, Recipe.carbohydrates, Recipe.image_path,
+        Recipe.image_version, Recipe.user_id, Recipe.is_public,
+    )
+}
+
+def recipe_field_columns(fields: str) -> tuple:
+    """Колонки для списка полей через запятую. id включается всегда — по нему строится курсор."""
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in RECIPE_FIELD_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(RECIPE_FIELD_COLUMNS)}"
         )
+    return tuple(RECIPE_FIELD_COLUMNS[name] for name in dict.fromkeys(["id", *names]))
+
+async def get_user_recipes(db: AsyncSession, user_id: int, show_mealflow: bool = False, search: str = "", skip: int = 0,
+                           limit: int = 10, cursor: Optional[str] = None,
+                           columns: Optional[tuple] = None) -> Tuple[list, Optional[str]]:
+    """Страница рецептов и курсор следующей страницы.
+
+    Без поиска рецепты идут по id, с поиском — по релевантности. Если передан
+    cursor, страница выбирается по ключу сортировки и skip не используется.
+    С columns (должны включать Recipe.id) выбираются только эти колонки, без
+    загрузки связей, и рецепты возвращаются словарями.
+    """
+    if columns:
+        query = select(*columns)
+        recipe_id = lambda row: row.id
+    else:
+        query = select(Recipe).options(*RECIPE_DETAIL_OPTIONS)
+        recipe_id = lambda row: row[0].id
+    query = query.filter(visible_recipes_filter(user_id, show_mealflow))
     if search:
-        query = query.filter(Recipe.title.ilike(f"%{search}%"))
-    query = query.offset(skip).limit(limit)
-    result = await db.execute(query)
-    recipes = result.unique().scalars().all()
-    logger.info(f"Recipes fetched: {[{k: v for k, v in r.__dict__.items() if k != '_sa_instance_state'} for r in recipes]}")
-    return recipes
+        query = apply_search(query, search, decode_cursor(cursor, 3) if cursor else None)
+        key = (lambda row: row.rank, lambda row: row.similarity, recipe_id)
+    else:
+        if cursor:
+            query = query.filter(Recipe.id > decode_cursor(cursor, 1)[0])
+        query = query.order_by(Recipe.id)
+        key = (recipe_id,)
+    if not cursor:
+        query = query.offset(skip)
+    result = await db.execute(query.limit(limit))
+    rows = result.all()
+    if columns:
+        recipes = [{column.key: row._mapping[column.key] for column in columns} for row in rows]
+        logger.info(f"Recipes fetched: {len(recipes)} rows, columns={[column.key for column in columns]}")
+    else:
+        recipes = [row[0] for row in rows]
+        logger.info(f"Recipes fetched: {[{k: v for k, v in r.__dict__.items() if k != '_sa_instance_state'} for r in recipes]}")
+    return recipes, next_cursor(rows, limit, *key)
+
+# Фасеты каталога: таблица связи и колонка значения
+BROWSE_FACETS = {
+    "meal_types": (RecipeMealType, RecipeMealType.meal_type_id),
+    "dish_categories": (RecipeDishCategory, RecipeDishCategory.dish_category_id),
+    "tags": (RecipeTag, RecipeTag.tag_id),
+}
+
+# Фильтры по КБЖУ на порцию: имя -> колонка
+NUTRITION_RANGES = {
+    "calories": Recipe.calories,
+    "proteins": Recipe.proteins,
+    "fats": Recipe.fats,
+    "carbohydrates": Recipe.carbohydrates,
+}
+
+def browse_filters(user_id: int, show_mealflow: bool, facets: Dict[str, List[int]], max_total_time: Optional[int],
+                   ranges: Dict[str, Tuple[Optional[float], Optional[float]]]) -> Tuple[list, dict]:
+    """Условия выборки каталога: общие (видимость, время, КБЖУ) и отдельно по каждому выбранному фасету."""
+    common = [visible_recipes_filter(user_id, show_mealflow)]
+    if max_total_time is not None:
+        common.append(Recipe.total_time <= max_total_time)
+    for name, (low, high) in ranges.items():
+        column = NUTRITION_RANGES[name]
+        if low is not None:
+            common.append(column >= low)
+        if high is not None:
+            common.append(column <= high)
+    facet_filters = {}
+    for name, ids in facets.items():
+        if ids:
+            model, column = BROWSE_FACETS[name]
+            facet_filters[name] = Recipe.id.in_(select(model.recipe_id).filter(column.in_(ids)))
+    return common, facet_filters
+
+async def browse_recipes(db: AsyncSession, user_id: int, show_mealflow: bool, facets: Dict[str, List[int]],
+                         max_total_time: Optional[int] = None,
+                         ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+                         limit: int = 20, cursor: Optional[str] = None) -> Tuple[dict, Optional[str]]:
+    """Страница каталога по фильтрам и счетчики по фасетам.
+
+    Внутри фасета значения объединяются через ИЛИ, разные фасеты и диапазоны — через И.
+    Счетчики фасета считаются по всем условиям, кроме условий самого фасета, чтобы
+    клиент видел, сколько рецептов даст выбор другого значения. Все счетчики и общее
+    число рецептов — один запрос UNION ALL с группировкой по таблицам связей.
+    """
+    common, facet_filters = browse_filters(user_id, show_mealflow, facets, max_total_time, ranges or {})
+
+    query = select(*RECIPE_SUMMARY_COLUMNS).filter(*common, *facet_filters.values())
+    if cursor:
+        query = query.filter(Recipe.id > decode_cursor(cursor, 1)[0])
+    rows = (await db.execute(query.order_by(Recipe.id).limit(limit))).all()
+
+    counts = [
+        select(literal_column("'total'").label("facet"), literal_column("0").label("value_id"),
+               func.count().label("count"))
+        .select_from(Recipe).filter(*common, *facet_filters.values())
+    ]
+    for name, (model, column) in BROWSE_FACETS.items():
+        others = [condition for other, condition in facet_filters.items() if other != name]
+        counts.append(
+            select(literal_column(f"'{name}'"), column, func.count(model.recipe_id.distinct()))
+            .join(Recipe, Recipe.id == model.recipe_id)
+            .filter(*common, *others)
+            .group_by(column)
+        )
+    result = await db.execute(union_all(*counts))
+
+    total, facet_counts = 0, {name: [] for name in BROWSE_FACETS}
+    for facet, value_id, count in result.all():
+        if facet == "total":
+            total = count
+        else:
+            facet_counts[facet].append({"id": value_id, "count": count})
+    for values in facet_counts.values():
+        values.sort(key=lambda value: (-value["count"], value["id"]))
+    logger.info(f"Browse for user_id={user_id}: {total} recipes, facets={ {k: v for k, v in facets.items() if v} }")
+    cursor = next_cursor(rows, limit, lambda row: row.id)
+    page = {"total": total, "items": [dict(row._mapping) for row in rows], "facets": facet_counts, "next_cursor": cursor}
+    return page, cursor
 
 async def get_available_ingredients(db: AsyncSession):
-    result = await db.execute(select(Ingredient).filter(Ingredient.is_public == True))
-    return result.scalars().all()
+    await reference_snapshot.ensure_fresh(db)
+    return reference_snapshot.rows("available_ingredients")
 
-async def create_ingredient(db: AsyncSession, ingredient_name: str, unit: str, is_public: bool):
-    db_ingredient = Ingredient(ingredient_name=ingredient_name, unit=unit, is_public=is_public)
+async def create_ingredient(db: AsyncSession, ingredient_name: str, unit: str, is_public: bool, category_id: int = None):
+    if category_id is not None and not await db.get(IngredientCategory, category_id):
+        raise HTTPException(status_code=400, detail=f"Категория ингредиентов с ID {category_id} не найдена")
+    db_ingredient = Ingredient(ingredient_name=ingredient_name, unit=unit, is_public=is_public, category_id=category_id)
     db.add(db_ingredient)
     await db.commit()
     await db.refresh(db_ingredient)
+    await reference_snapshot.invalidate(db)
     return db_ingredient
 
+async def get_ingredient_categories(db: AsyncSession):
+    result = await db.execute(select(IngredientCategory).order_by(IngredientCategory.name))
+    return result.scalars().all()
+
+async def create_ingredient_category(db: AsyncSession, name: str, parent_id: int = None):
+    """Создает категорию и добавляет в таблицу замыкания ее пары со всеми предками родителя."""
+    if parent_id is not None and not await db.get(IngredientCategory, parent_id):
+        raise HTTPException(status_code=400, detail=f"Категория ингредиентов с ID {parent_id} не найдена")
+    db_category = IngredientCategory(name=name, parent_id=parent_id)
+    db.add(db_category)
+    await db.flush()
+    db.add(IngredientCategoryClosure(ancestor_id=db_category.id, descendant_id=db_category.id, depth=0))
+    if parent_id is not None:
+        await db.execute(
+            IngredientCategoryClosure.__table__.insert().from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(
+                    IngredientCategoryClosure.ancestor_id,
+                    literal(db_category.id),
+                    IngredientCategoryClosure.depth + 1
+                ).filter(IngredientCategoryClosure.descendant_id == parent_id)
+            )
+        )
+    await db.commit()
+    await db.refresh(db_category)
+    return db_category
+
+def category_closure_rows(parents: dict) -> list:
+    """Строки таблицы замыкания по словарю category_id -> parent_id."""
+    rows = []
+    for category_id in parents:
+        ancestor_id, depth, seen = category_id, 0, set()
+        while ancestor_id is not None:
+            if ancestor_id in seen:
+                raise ValueError(f"Цикл в дереве категорий ингредиентов у категории {category_id}")
+            seen.add(ancestor_id)
+            rows.append({"ancestor_id": ancestor_id, "descendant_id": category_id, "depth": depth})
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    return rows
+
+async def rebuild_category_closure(db: AsyncSession):
+    """Пересчитывает таблицу замыкания целиком. Нужна после переноса категорий из админ-панели."""
+    result = await db.execute(select(IngredientCategory.id, IngredientCategory.parent_id))
+    rows = category_closure_rows(dict(result.all()))
+    await db.execute(IngredientCategoryClosure.__table__.delete())
+    if rows:
+        await db.execute(IngredientCategoryClosure.__table__.insert(), rows)
+    await db.commit()
+    logger.info(f"Ingredient category closure rebuilt: {len(rows)} rows")
+
 async def create_meal_type(db: AsyncSession, name: str, description: str = None, is_active: bool = True):
     db_meal_type = MealType(name=name, description=description, is_active=is_active)
     db.add(db_meal_type)
     await db.commit()
     await db.refresh(db_meal_type)
+    await reference_snapshot.invalidate(db)
     return db_meal_type
 
 async def get_available_meal_types(db: AsyncSession):
-    result = await db.execute(select(MealType).filter(MealType.is_active == True))
-    return result.scalars().all()
+    await reference_snapshot.ensure_fresh(db)
+    return reference_snapshot.rows("available_meal_types")
 
 async def create_dish_category(db: AsyncSession, name: str, description: str = None, is_active: bool = True):
     db_dish_category = DishCategory(name=name, description=description, is_active=is_active)
     db.add(db_dish_category)
     await db.commit()
     await db.refresh(db_dish_category)
+    await reference_snapshot.invalidate(db)
     return db_dish_category
 
 async def get_available_dish_categories(db: AsyncSession):
-    result = await db.execute(select(DishCategory).filter(DishCategory.is_active == True))
-    return result.scalars().all()
+    await reference_snapshot.ensure_fresh(db)
+    return reference_snapshot.rows("available_dish_categories")
 
 async def create_tag(db: AsyncSession, name: str, is_active: bool = True):
     db_tag = Tag(name=name, is_active=is_active)
     db.add(db_tag)
     await db.commit()
     await db.refresh(db_tag)
+    await reference_snapshot.invalidate(db)
     return db_tag
 
 async def get_available_tags(db: AsyncSession):
-    result = await db.execute(select(Tag).filter(Tag.is_active == True))
-    return result.scalars().all()
+    await reference_snapshot.ensure_fresh(db)
+    return reference_snapshot.rows("available_tags")
 
 async def delete_recipe(db: AsyncSession, recipe_id: int, user_id: int):
     try:
@@ -313,6 +506,8 @@ async def delete_recipe(db: AsyncSession, recipe_id: int, user_id: int):
 
         await db.delete(db_recipe)
         await db.commit()
+        await recipe_cache.invalidate(recipe_id)
+        candidate_index.discard(recipe_id)
         logger.info(f"Recipe with id={recipe_id} deleted for user_id={user_id}")
         return db_recipe
     except HTTPException as e:
@@ -0,0 +1,187 @@
+"""Потоковая выгрузка рецептов в NDJSON или CSV, по желанию со сжатием gzip.
+
+Рецепты читаются серверным курсором порциями по EXPORT_BATCH_SIZE; связи
+каждой порции загружаются одним запросом на таблицу связей. В памяти
+находится только текущая порция, сколько бы рецептов ни было в каталоге.
+Записи NDJSON совместимы с импортом (apps.recipes.importer): ингредиенты
+содержат и ingredient_id, и ingredient_name.
+
+Запуск из командной строки:
+    python -m apps.recipes.exporter --user 1 --format csv -o recipes.csv.gz
+    python -m apps.recipes.exporter --public -o catalog.ndjson.gz
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import sys
+import time
+import zlib
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from apps.recipes.crud import RECIPE_LINKS
+from apps.recipes.models import Recipe, RecipeDishCategory, RecipeIngredient, RecipeMealType, RecipeTag
+from apps.recipes.reference import reference_snapshot
+from core.database import async_session
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 500
+
+# Размер буфера, после которого очередной кусок отдается клиенту
+EXPORT_CHUNK_BYTES = 1 << 16
+
+EXPORT_COLUMNS = (
+    Recipe.id, Recipe.user_id, Recipe.title, Recipe.description, Recipe.steps, Recipe.total_time, Recipe.servings,
+    Recipe.calories, Recipe.proteins, Recipe.fats, Recipe.carbohydrates, Recipe.is_public,
+)
+
+CSV_HEADER = (
+    "id", "user_id", "title", "description", "total_time", "servings", "calories", "proteins", "fats",
+    "carbohydrates", "is_public", "steps", "ingredients", "meal_type_ids", "dish_category_ids", "tag_ids",
+)
+
+# Поле выгрузки для каждой таблицы связей
+LINK_FIELDS = {
+    RecipeIngredient: "ingredients",
+    RecipeMealType: "meal_type_ids",
+    RecipeDishCategory: "dish_category_ids",
+    RecipeTag: "tag_ids",
+}
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+async def _load_links(db: AsyncSession, recipe_ids: List[int], ingredient_names: Dict[int, str]) -> Dict[int, dict]:
+    """Связи порции рецептов: recipe_id -> {поле выгрузки: список}."""
+    links = {recipe_id: {field: [] for field in LINK_FIELDS.values()} for recipe_id in recipe_ids}
+    for model, field in LINK_FIELDS.items():
+        key, fields = RECIPE_LINKS[model]
+        result = await db.execute(
+            select(model.recipe_id, getattr(model, key), *(getattr(model, f) for f in fields))
+            .filter(model.recipe_id.in_(recipe_ids))
+            .order_by(model.id)
+        )
+        for recipe_id, value, *rest in result.all():
+            if model is RecipeIngredient:
+                links[recipe_id][field].append(
+                    {"ingredient_id": value, "ingredient_name": ingredient_names.get(value), "amount": rest[0]}
+                )
+            else:
+                links[recipe_id][field].append(value)
+    return links
+
+
+async def stream_recipes(db: AsyncSession, user_id: Optional[int] = None,
+                         batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """Рецепты пользователя (или все общедоступные, если user_id не задан) по возрастанию id."""
+    await reference_snapshot.ensure_fresh(db)
+    ingredient_names = {row["id"]: row["ingredient_name"] for row in reference_snapshot.rows("ingredients")}
+    query = select(*EXPORT_COLUMNS).order_by(Recipe.id).execution_options(yield_per=batch_size)
+    query = query.filter(Recipe.user_id == user_id) if user_id is not None else query.filter(Recipe.is_public == True)
+    result = await db.stream(query)
+    async for partition in result.partitions():
+        links = await _load_links(db, [row.id for row in partition], ingredient_names)
+        for row in partition:
+            yield {**row._mapping, **links[row.id]}
+
+
+def _csv_writer():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def write(values) -> str:
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    return write
+
+
+async def export_recipes(db: AsyncSession, user_id: Optional[int] = None, format: str = "ndjson",
+                         compress: bool = True, stats: Optional[dict] = None) -> AsyncIterator[bytes]:
+    """Куски выгрузки в выбранном формате; при compress — сразу сжатые gzip.
+
+    В stats, если передан, записываются число рецептов и время выгрузки.
+    """
+    started = time.perf_counter()
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    pending, pending_size, count = [], 0, 0
+
+    def flush() -> bytes:
+        nonlocal pending, pending_size
+        data = "".join(pending).encode()
+        pending, pending_size = [], 0
+        return compressor.compress(data) if compressor else data
+
+    write_csv = _csv_writer() if format == "csv" else None
+    if write_csv:
+        pending.append(write_csv(CSV_HEADER))
+    async for recipe in stream_recipes(db, user_id):
+        if write_csv:
+            text = write_csv([
+                recipe["id"], recipe["user_id"], recipe["title"], recipe["description"], recipe["total_time"],
+                recipe["servings"], recipe["calories"], recipe["proteins"], recipe["fats"], recipe["carbohydrates"],
+                recipe["is_public"],
+                *(json.dumps(recipe[field], ensure_ascii=False) for field in ("steps", *LINK_FIELDS.values())),
+            ])
+        else:
+            text = json.dumps(recipe, ensure_ascii=False) + "\n"
+        pending.append(text)
+        pending_size += len(text)
+        count += 1
+        if pending_size >= EXPORT_CHUNK_BYTES:
+            chunk = flush()
+            if chunk:
+                yield chunk
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+    elapsed = time.perf_counter() - started
+    if stats is not None:
+        stats.update({"recipes": count, "elapsed_seconds": round(elapsed, 3)})
+    scope = f"user_id={user_id}" if user_id is not None else "public catalog"
+    logger.info(f"Recipe export ({scope}, {format}, gzip={compress}): {count} recipes in {elapsed:.2f}s")
+
+
+def export_filename(format: str, compress: bool, user_id: Optional[int] = None) -> str:
+    name = f"recipes_{user_id}" if user_id is not None else "recipes_public"
+    return f"{name}.{format}" + (".gz" if compress else "")
+
+
+async def _main(args):
+    if args.user is None and not args.public:
+        raise SystemExit("Укажите --user или --public")
+    compress = not args.no_gzip
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    stats = {}
+    try:
+        async with async_session() as session:
+            async for chunk in export_recipes(session, args.user, args.format, compress, stats):
+                output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    elapsed = stats.get("elapsed_seconds") or 0
+    stats["recipes_per_second"] = round(stats.get("recipes", 0) / elapsed, 1) if elapsed else 0.0
+    print(json.dumps(stats, ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка рецептов в NDJSON или CSV")
+    parser.add_argument("--user", type=int, help="ID пользователя, чьи рецепты выгружаются")
+    parser.add_argument("--public", action="store_true", help="Выгрузить все общедоступные рецепты")
+    parser.add_argument("--format", default="ndjson", choices=list(EXPORT_MEDIA_TYPES))
+    parser.add_argument("--no-gzip", action="store_true", help="Не сжимать выгрузку")
+    parser.add_argument("-o", "--output", default="-", help="Файл результата; - для stdout")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,231 @@
+"""Массовый импорт рецептов из NDJSON.
+
+Каждая строка — рецепт в формате RecipeCreate; ингредиент можно указать по
+ingredient_id или по ingredient_name. Записи проверяются пакетами: названия
+ингредиентов и ссылки на справочники разрешаются по снимку справочников в
+памяти, без запросов к БД. Рецепты и связи пишутся командой COPY. Ошибки
+отдельных записей попадают в отчет и не прерывают импорт.
+
+Запуск из командной строки:
+    python -m apps.recipes.importer --user 1 catalog.ndjson
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import AsyncIterable, AsyncIterator, Callable, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from apps.auth.models import User
+from apps.meal_planner.index import candidate_index
+from apps.recipes.crud import RECIPE_LINKS, ensure_exist, recipe_link_rows
+from apps.recipes.models import Recipe
+from apps.recipes.reference import reference_snapshot
+from apps.recipes.schemas import RecipeCreate, RecipeImport
+from core.database import async_session
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+
+# Сколько ошибок попадает в отчет; счетчик failed учитывает все
+MAX_REPORTED_ERRORS = 1000
+
+RECIPE_COPY_COLUMNS = (
+    "id", "title", "description", "steps", "total_time", "servings", "calories", "proteins", "fats",
+    "carbohydrates", "image_path", "image_version", "user_id", "is_public",
+)
+
+
+class ImportRecordError(ValueError):
+    pass
+
+
+class ReferenceResolver:
+    """Справочники для проверки записей: название ингредиента -> id и множества допустимых id."""
+
+    def __init__(self):
+        ingredients = reference_snapshot.rows("ingredients")
+        self.ingredient_ids = {row["id"] for row in ingredients}
+        self.ingredient_names = {row["ingredient_name"].casefold(): row["id"] for row in ingredients}
+        self.meal_type_ids = {row["id"] for row in reference_snapshot.rows("meal_types")}
+        self.dish_category_ids = {row["id"] for row in reference_snapshot.rows("dish_categories")}
+        self.tag_ids = {row["id"] for row in reference_snapshot.rows("tags")}
+
+    def recipe(self, record: RecipeImport) -> RecipeCreate:
+        ingredients = []
+        for item in record.ingredients:
+            if item.ingredient_name is not None:
+                ingredient_id = self.ingredient_names.get(item.ingredient_name.strip().casefold())
+                if ingredient_id is None:
+                    raise ImportRecordError(f"Ингредиент «{item.ingredient_name}» не найден")
+            else:
+                if item.ingredient_id not in self.ingredient_ids:
+                    raise ImportRecordError(f"Ингредиент с ID {item.ingredient_id} не найден")
+                ingredient_id = item.ingredient_id
+            ingredients.append({"ingredient_id": ingredient_id, "amount": item.amount})
+        self._check(record.meal_type_ids, self.meal_type_ids, "Тип блюда с ID {id} не найден")
+        self._check(record.dish_category_ids, self.dish_category_ids, "Категория блюда с ID {id} не найдена")
+        self._check(record.tag_ids, self.tag_ids, "Тег с ID {id} не найден")
+        return RecipeCreate(**record.model_dump(exclude={"ingredients"}), ingredients=ingredients)
+
+    @staticmethod
+    def _check(ids: List[int], known: set, detail: str):
+        for item_id in ids:
+            if item_id not in known:
+                raise ImportRecordError(detail.format(id=item_id))
+
+
+def error_text(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc'])) or 'record'}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+
+async def ndjson_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Строки NDJSON из потока байтов произвольной нарезки (например, тела запроса)."""
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
+
+
+async def _copy_batch(db: AsyncSession, batch: List[Tuple[int, RecipeCreate]], user_id: int):
+    """Записывает пакет рецептов и их связей командой COPY в одной транзакции."""
+    # id рецептов нужны для связей, а COPY их не возвращает — берем их из последовательности заранее
+    ids = (await db.execute(
+        select(func.nextval(func.pg_get_serial_sequence("recipes", "id")))
+        .select_from(func.generate_series(1, len(batch)))
+    )).scalars().all()
+
+    recipes, links = [], {model: [] for model in RECIPE_LINKS}
+    for recipe_id, (_, recipe) in zip(ids, batch):
+        recipes.append((
+            recipe_id, recipe.title, recipe.description,
+            json.dumps([step.model_dump() for step in recipe.steps], ensure_ascii=False),
+            recipe.total_time, recipe.servings, recipe.calories, recipe.proteins, recipe.fats,
+            recipe.carbohydrates, None, 0, user_id, bool(recipe.is_public),
+        ))
+        for model, rows in recipe_link_rows(recipe).items():
+            links[model].extend({"recipe_id": recipe_id, **row} for row in rows)
+
+    connection = (await (await db.connection()).get_raw_connection()).driver_connection
+    await connection.copy_records_to_table("recipes", records=recipes, columns=RECIPE_COPY_COLUMNS)
+    for model, rows in links.items():
+        if rows:
+            key, fields = RECIPE_LINKS[model]
+            columns = ("recipe_id", key, *fields)
+            await connection.copy_records_to_table(
+                model.__tablename__, records=[tuple(row[c] for c in columns) for row in rows], columns=columns
+            )
+    await db.commit()
+
+
+async def write_batch(db: AsyncSession, batch: List[Tuple[int, RecipeCreate]], user_id: int, summary: dict):
+    """Пишет пакет целиком; если COPY не прошел, повторяет по одной записи, чтобы найти сломанные."""
+    try:
+        await _copy_batch(db, batch, user_id)
+        summary["imported"] += len(batch)
+    except Exception as e:
+        await db.rollback()
+        if len(batch) == 1:
+            add_error(summary, batch[0][0], f"Ошибка записи: {str(e)}")
+            return
+        logger.warning(f"Recipe import batch of {len(batch)} failed, retrying one by one: {str(e)}")
+        for record in batch:
+            await write_batch(db, [record], user_id, summary)
+
+
+def add_error(summary: dict, line: int, error: str):
+    summary["failed"] += 1
+    if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+        summary["errors"].append({"line": line, "error": error})
+
+
+async def import_recipes(db: AsyncSession, lines: AsyncIterable[bytes], user_id: int,
+                         batch_size: int = IMPORT_BATCH_SIZE, report: Optional[Callable[[dict], None]] = None) -> dict:
+    """Импортирует рецепты из строк NDJSON от имени user_id и возвращает отчет.
+
+    Рецепт с названием, которое у владельца уже есть, пропускается, как и в create_recipe.
+    """
+    started = time.perf_counter()
+    await ensure_exist(db, User, [user_id], "Пользователь с ID {id} не найден")
+    await reference_snapshot.ensure_fresh(db)
+    resolver = ReferenceResolver()
+    titles = set((await db.execute(select(Recipe.title).filter(Recipe.user_id == user_id))).scalars().all())
+
+    summary = {"total": 0, "imported": 0, "skipped": 0, "failed": 0, "errors": []}
+    batch: List[Tuple[int, RecipeCreate]] = []
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        summary["total"] += 1
+        try:
+            recipe = resolver.recipe(RecipeImport.model_validate_json(line))
+        except ValueError as e:
+            add_error(summary, line_number, error_text(e))
+            continue
+        if recipe.title in titles:
+            summary["skipped"] += 1
+            continue
+        titles.add(recipe.title)
+        batch.append((line_number, recipe))
+        if len(batch) >= batch_size:
+            await write_batch(db, batch, user_id, summary)
+            batch = []
+            if report:
+                report({k: v for k, v in summary.items() if k != "errors"})
+    if batch:
+        await write_batch(db, batch, user_id, summary)
+
+    summary["errors"].sort(key=lambda error: error["line"])
+    elapsed = time.perf_counter() - started
+    summary["elapsed_seconds"] = round(elapsed, 3)
+    summary["records_per_second"] = round(summary["total"] / elapsed, 1) if elapsed else 0.0
+    if summary["imported"] and candidate_index.is_ready:
+        candidate_index.schedule_rebuild()
+    logger.info(
+        f"Recipe import for user_id={user_id}: {summary['imported']}/{summary['total']} imported, "
+        f"{summary['skipped']} skipped, {summary['failed']} failed in {elapsed:.2f}s "
+        f"({summary['records_per_second']} records/s)"
+    )
+    return summary
+
+
+async def _file_chunks(path: str, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while chunk := f.read(chunk_size):
+            yield chunk
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+async def _main(args):
+    def report(event):
+        print(json.dumps(event, ensure_ascii=False), file=sys.stderr, flush=True)
+
+    async with async_session() as session:
+        summary = await import_recipes(session, ndjson_lines(_file_chunks(args.file)), args.user, args.batch_size, report)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт рецептов из NDJSON")
+    parser.add_argument("file", help="Файл NDJSON, по рецепту в строке; - для stdin")
+    parser.add_argument("--user", type=int, required=True, help="ID владельца рецептов")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    asyncio.run(_main(parser.parse_args()))
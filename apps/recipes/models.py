@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, JSON, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from core.database import Base
 
 class MealType(Base):
@@ -31,6 +32,10 @@ class RecipeMealType(Base):
     recipe = relationship("Recipe", back_populates="meal_types")
     meal_type = relationship("MealType")
 
+    __table_args__ = (
+        Index("ix_recipe_meal_types_meal_type_id_recipe_id", "meal_type_id", "recipe_id"),
+    )
+
 class RecipeDishCategory(Base):
     __tablename__ = "recipe_dish_categories"
     id = Column(Integer, primary_key=True, index=True)
@@ -39,6 +44,11 @@ class RecipeDishCategory(Base):
     recipe = relationship("Recipe", back_populates="dish_categories")
     dish_category = relationship("DishCategory")
 
+    __table_args__ = (
+        Index("ix_recipe_dish_categories_dish_category_id_recipe_id", "dish_category_id", "recipe_id"),
+        Index("ix_recipe_dish_categories_recipe_id", "recipe_id"),
+    )
+
 class RecipeTag(Base):
     __tablename__ = "recipe_tags"
     id = Column(Integer, primary_key=True, index=True)
@@ -47,6 +57,11 @@ class RecipeTag(Base):
     recipe = relationship("Recipe", back_populates="tags")
     tag = relationship("Tag")
 
+    __table_args__ = (
+        Index("ix_recipe_tags_tag_id_recipe_id", "tag_id", "recipe_id"),
+        Index("ix_recipe_tags_recipe_id", "recipe_id"),
+    )
+
 class Recipe(Base):
     __tablename__ = "recipes"
     id = Column(Integer, primary_key=True, index=True)
@@ -63,12 +78,20 @@ class Recipe(Base):
     image_version = Column(Integer, default=0)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     is_public = Column(Boolean, default=False)
+    search_vector = deferred(Column(TSVECTOR, nullable=True))  # Заполняется триггером, см. apps.recipes.search
     user = relationship("User", back_populates="recipes")
     ingredients = relationship("RecipeIngredient", back_populates="recipe", cascade="all, delete-orphan")
     meal_types = relationship("RecipeMealType", back_populates="recipe", cascade="all, delete-orphan")
     dish_categories = relationship("RecipeDishCategory", back_populates="recipe", cascade="all, delete-orphan")
     tags = relationship("RecipeTag", back_populates="recipe", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_recipes_user_id_id", "user_id", "id"),
+        Index("ix_recipes_is_public_id", "is_public", "id"),
+        Index("ix_recipes_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_recipes_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+    )
+
 class RecipeIngredient(Base):
     __tablename__ = "recipe_ingredients"
     id = Column(Integer, primary_key=True, index=True)
@@ -78,12 +101,40 @@ class RecipeIngredient(Base):
     recipe = relationship("Recipe", back_populates="ingredients")
     ingredient = relationship("Ingredient")
 
+    __table_args__ = (
+        Index("ix_recipe_ingredients_recipe_id_ingredient_id", "recipe_id", "ingredient_id"),
+    )
+
 class Ingredient(Base):
     __tablename__ = "ingredients"
     id = Column(Integer, primary_key=True, index=True)
     ingredient_name = Column(String(100), nullable=False, unique=True)
     unit = Column(String(20), nullable=False, default="г")
     is_public = Column(Boolean, default=False)
+    category_id = Column(Integer, ForeignKey("ingredient_categories.id", ondelete="SET NULL"), nullable=True, index=True)
+    category = relationship("IngredientCategory")
+
+class IngredientCategory(Base):
+    """Категория ингредиентов («Молочные продукты», «Орехи»). Категории образуют дерево."""
+    __tablename__ = "ingredient_categories"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(50), nullable=False, unique=True)
+    parent_id = Column(Integer, ForeignKey("ingredient_categories.id", ondelete="CASCADE"), nullable=True)
+    parent = relationship("IngredientCategory", remote_side=[id])
+
+    def __str__(self):
+        return self.name
+
+class IngredientCategoryClosure(Base):
+    """Таблица замыкания дерева категорий: все пары предок — потомок, включая саму категорию (depth = 0)."""
+    __tablename__ = "ingredient_category_closure"
+    ancestor_id = Column(Integer, ForeignKey("ingredient_categories.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey("ingredient_categories.id", ondelete="CASCADE"), primary_key=True)
+    depth = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_ingredient_category_closure_descendant_id", "descendant_id", "ancestor_id"),
+    )
 
 class FavoriteRecipe(Base):
     __tablename__ = "favorite_recipes"
@@ -0,0 +1,99 @@
+"""Поиск рецептов по ингредиентам, которые есть у пользователя."""
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from apps.meal_planner.index import CandidateIndex, candidate_index, ingredient_ids_from_mask, ingredient_mask
+
+logger = logging.getLogger(__name__)
+
+
+class PantryIndex:
+    """Массивы NumPy поверх обратного индекса CandidateIndex.
+
+    Рецепты адресуются по id как по позиции в массиве. Массивы перестраиваются,
+    когда меняется generation индекса кандидатов; списки рецептов по
+    ингредиентам преобразуются в массивы лениво, при первом запросе.
+    """
+
+    def __init__(self, index: CandidateIndex):
+        self._index = index
+        self._generation: Optional[int] = None
+        self._counts = np.zeros(0, dtype=np.int32)
+        self._public = np.zeros(0, dtype=bool)
+        self._postings: Dict[int, np.ndarray] = {}
+
+    def _sync(self):
+        if self._generation == self._index.generation:
+            return
+        masks = self._index.ingredient_masks()
+        size = max(masks, default=-1) + 1
+        counts = np.zeros(size, dtype=np.int32)
+        if masks:
+            ids = np.fromiter(masks.keys(), dtype=np.int64, count=len(masks))
+            counts[ids] = np.fromiter((mask.bit_count() for mask in masks.values()), dtype=np.int32, count=len(masks))
+        public = np.zeros(size, dtype=bool)
+        public_ids = self._index.public_recipes()
+        if public_ids:
+            public[np.fromiter(public_ids, dtype=np.int64, count=len(public_ids))] = True
+        self._counts, self._public, self._postings = counts, public, {}
+        self._generation = self._index.generation
+
+    def _posting(self, ingredient_id: int) -> np.ndarray:
+        posting = self._postings.get(ingredient_id)
+        if posting is None:
+            recipes = self._index.recipes_with_ingredient(ingredient_id)
+            posting = np.fromiter(recipes, dtype=np.int64, count=len(recipes))
+            self._postings[ingredient_id] = posting
+        return posting
+
+    def search(self, user_id: int, ingredient_ids: List[int], min_coverage: float = 0.0,
+               max_missing: Optional[int] = None, limit: int = 20) -> List[dict]:
+        """Рецепты, доступные пользователю, по убыванию доли имеющихся ингредиентов.
+
+        Учитываются только рецепты, в которых есть хотя бы один из ingredient_ids.
+        """
+        self._sync()
+        # Id, которых нет в обратном индексе, не совпадают ни с одним рецептом; отбрасываем их
+        # до построения маски, иначе 1 << id растет вместе со значением id из запроса
+        postings = self._index.ingredient_postings()
+        ingredient_ids = {i for i in ingredient_ids if i in postings}
+        size = len(self._counts)
+        matched = np.zeros(size, dtype=np.int32)
+        for ingredient_id in ingredient_ids:
+            matched[self._posting(ingredient_id)] += 1
+
+        visible = self._public.copy()
+        own = self._index.user_recipes(user_id)
+        if own:
+            visible[np.fromiter(own, dtype=np.int64, count=len(own))] = True
+
+        candidates = np.nonzero((matched > 0) & visible)[0]
+        hits = matched[candidates]
+        totals = self._counts[candidates]
+        coverage = hits / totals
+        missing = totals - hits
+        keep = coverage >= min_coverage
+        if max_missing is not None:
+            keep &= missing <= max_missing
+        candidates, hits, totals, coverage, missing = (
+            candidates[keep], hits[keep], totals[keep], coverage[keep], missing[keep]
+        )
+        order = np.lexsort((candidates, missing, -coverage))[:limit]
+
+        pantry = ingredient_mask(ingredient_ids)
+        masks = self._index.ingredient_masks()
+        return [
+            {
+                "recipe_id": int(candidates[i]),
+                "coverage": round(float(coverage[i]), 3),
+                "matched": int(hits[i]),
+                "total": int(totals[i]),
+                "missing_ingredient_ids": ingredient_ids_from_mask(masks.get(int(candidates[i]), 0) & ~pantry),
+            }
+            for i in order
+        ]
+
+
+pantry_index = PantryIndex(candidate_index)
@@ -0,0 +1,166 @@
+"""Снимок справочников (ингредиенты, типы блюд, категории блюд, теги), общий для воркеров gunicorn.
+
+Снимок хранится в одном файле (по умолчанию в /dev/shm), который каждый воркер
+отображает в память через mmap: списки справочников отдаются готовыми
+JSON-байтами прямо из отображения, без копии объектов в каждом процессе.
+Запись справочника пересобирает снимок и публикует файл с версией на единицу
+больше (атомарной заменой), остальные воркеры замечают новый файл по stat.
+Изменения в обход приложения попадают в снимок не позже REFERENCE_MAX_AGE_SECONDS.
+
+Формат файла: длина заголовка (8 байт, little-endian), заголовок JSON
+{"version": N, "sections": {имя: [смещение, длина, хеш]}}, затем разделы подряд.
+Хеш раздела (blake2b от его байтов) служит ETag: он зависит только от
+содержимого, поэтому не меняется при пересборке без изменений и после
+очистки /dev/shm.
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from apps.recipes.models import DishCategory, Ingredient, MealType, Tag
+from apps.recipes.schemas import (
+    DishCategory as DishCategorySchema, Ingredient as IngredientSchema, MealType as MealTypeSchema, Tag as TagSchema
+)
+from core.config import config
+
+logger = logging.getLogger(__name__)
+
+HEADER_SIZE = struct.Struct("<Q")
+
+# Разделы снимка: таблица, схема ответа API и флаг доступности записи. Для каждой
+# таблицы в снимке два раздела: все строки со всеми колонками (для админки и
+# планировщика) и доступные записи в формате ответа API (available_<имя>).
+SECTIONS = {
+    "ingredients": (Ingredient, IngredientSchema, "is_public"),
+    "meal_types": (MealType, MealTypeSchema, "is_active"),
+    "dish_categories": (DishCategory, DishCategorySchema, "is_active"),
+    "tags": (Tag, TagSchema, "is_active"),
+}
+
+
+class ReferenceSnapshot:
+    def __init__(self, path: str, max_age_seconds: int):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.version = 0
+        self._mmap: Optional[mmap.mmap] = None
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._sections: Dict[str, Tuple[int, int, str]] = {}
+        self._parsed: Dict[str, list] = {}
+        self._lock = asyncio.Lock()
+
+    def etag(self, name: str) -> str:
+        """ETag раздела — хеш его содержимого."""
+        return f'"{self._sections[name][2]}"'
+
+    async def ensure_fresh(self, db: AsyncSession):
+        """Отображает актуальный файл снимка; пересобирает его, если файла нет или он устарел."""
+        stat = self._stat()
+        if stat is None or time.time() - stat.st_mtime > self.max_age_seconds:
+            async with self._lock:
+                stat = self._stat()
+                if stat is None or time.time() - stat.st_mtime > self.max_age_seconds:
+                    await self.rebuild(db)
+                    stat = self._stat()
+        if (stat.st_ino, stat.st_mtime_ns) != self._file_id:
+            self._map()
+
+    async def rebuild(self, db: AsyncSession):
+        """Перечитывает справочники из БД и публикует новую версию снимка для всех воркеров."""
+        started = time.monotonic()
+        sections = {}
+        for name, (model, schema, available) in SECTIONS.items():
+            rows = (await db.execute(select(model).order_by(model.id))).scalars().all()
+            columns = [column.key for column in model.__table__.columns]
+            sections[name] = json.dumps(
+                [{key: getattr(row, key) for key in columns} for row in rows], ensure_ascii=False
+            ).encode()
+            sections[f"available_{name}"] = TypeAdapter(List[schema]).dump_json(
+                [row for row in rows if getattr(row, available)]
+            )
+        version = self._publish(sections)
+        self._map()
+        logger.info(f"Reference snapshot v{version} published in {(time.monotonic() - started) * 1000:.1f} ms")
+
+    async def invalidate(self, db: AsyncSession):
+        """Вызывается после записи в справочник (после commit). Ошибка пересборки не
+        отменяет саму запись: снимок тогда обновится по REFERENCE_MAX_AGE_SECONDS."""
+        try:
+            async with self._lock:
+                await self.rebuild(db)
+        except Exception as e:
+            logger.error(f"Reference snapshot rebuild failed: {str(e)}", exc_info=True)
+
+    def section_bytes(self, name: str) -> bytes:
+        """JSON-массив раздела в том виде, в котором его отдает API."""
+        offset, length, _ = self._sections[name]
+        return self._mmap[offset:offset + length]
+
+    def rows(self, name: str) -> List[dict]:
+        """Записи раздела как словари. Разбираются один раз на версию снимка."""
+        if name not in self._parsed:
+            self._parsed[name] = json.loads(self.section_bytes(name))
+        return self._parsed[name]
+
+    def _stat(self) -> Optional[os.stat_result]:
+        try:
+            return os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+    def _publish(self, sections: Dict[str, bytes]) -> int:
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            version = self._published_version() + 1
+            index, offset = {}, 0
+            for name, data in sections.items():
+                index[name] = [offset, len(data), hashlib.blake2b(data, digest_size=16).hexdigest()]
+                offset += len(data)
+            header = json.dumps({"version": version, "sections": index}).encode()
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(HEADER_SIZE.pack(len(header)))
+                f.write(header)
+                for data in sections.values():
+                    f.write(data)
+            os.replace(tmp_path, self.path)
+        return version
+
+    def _published_version(self) -> int:
+        try:
+            with open(self.path, "rb") as f:
+                (size,) = HEADER_SIZE.unpack(f.read(HEADER_SIZE.size))
+                return json.loads(f.read(size))["version"]
+        except (FileNotFoundError, ValueError, KeyError, struct.error):
+            return 0
+
+    def _map(self):
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (size,) = HEADER_SIZE.unpack(mapped[:HEADER_SIZE.size])
+        header = json.loads(mapped[HEADER_SIZE.size:HEADER_SIZE.size + size])
+        data_offset = HEADER_SIZE.size + size
+        old, self._mmap = self._mmap, mapped
+        self._sections = {
+            name: (data_offset + offset, length, digest) for name, (offset, length, digest) in header["sections"].items()
+        }
+        self._parsed = {}
+        self.version = header["version"]
+        self._file_id = (stat.st_ino, stat.st_mtime_ns)
+        if old is not None:
+            old.close()
+
+
+reference_snapshot = ReferenceSnapshot(config.REFERENCE_SNAPSHOT_PATH, config.REFERENCE_MAX_AGE_SECONDS)
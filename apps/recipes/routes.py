@@ -1,14 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Response
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from sqlalchemy.orm import joinedload
-from apps.recipes.models import Recipe as RecipeModel, FavoriteRecipe, MealType, RecipeIngredient, RecipeMealType, DishCategory, RecipeDishCategory, Tag, RecipeTag
-from apps.recipes.schemas import RecipeCreate, Recipe, IngredientBase, Ingredient, RecipeUpdate, MealType as MealTypeSchema, MealTypeBase, DishCategory as DishCategorySchema, DishCategoryBase, Tag as TagSchema, TagBase
-from apps.recipes.crud import create_recipe, get_user_recipes, get_available_ingredients, create_ingredient, update_recipe, delete_recipe, create_meal_type, get_available_meal_types, create_dish_category, get_available_dish_categories, create_tag, get_available_tags
+from apps.recipes.models import Recipe as RecipeModel, FavoriteRecipe, MealType, DishCategory, Tag
+from apps.recipes.schemas import RecipeCreate, Recipe, IngredientBase, Ingredient, RecipeUpdate, MealType as MealTypeSchema, MealTypeBase, DishCategory as DishCategorySchema, DishCategoryBase, IngredientCategory as IngredientCategorySchema, IngredientCategoryBase, Tag as TagSchema, TagBase, PantrySearch, PantryMatch, RecipeBrowse, RecipeImportReport, RecipeSummary, RecipeFields
+from apps.recipes.crud import create_recipe, get_user_recipes, create_ingredient, update_recipe, delete_recipe, create_meal_type, create_dish_category, create_ingredient_category, get_ingredient_categories, create_tag, search_by_pantry, browse_recipes, recipe_field_columns, RECIPE_DETAIL_OPTIONS, RECIPE_SUMMARY_COLUMNS
+from apps.recipes.cache import CachedRecipe, recipe_cache
+from apps.recipes.exporter import EXPORT_MEDIA_TYPES, export_filename, export_recipes
+from apps.recipes.importer import import_recipes, ndjson_lines
+from apps.recipes.reference import reference_snapshot
+from core.database import async_session
 from core.dependencies import get_db
+from core.pagination import NEXT_CURSOR_HEADER
 from apps.auth.routes import get_current_user
 from apps.auth.models import User
-from typing import List
+from typing import List, Optional, Union
 from minio import Minio
 from minio.error import S3Error
 from dotenv import load_dotenv
@@ -43,7 +50,7 @@ async def create_user_recipe(
     description: str = Form(None),
     steps: str = Form(...),
     total_time: int = Form(...),
-    servings: int = Form(...),
+    servings: int = Form(..., ge=1),
     calories: float = Form(None),
     proteins: float = Form(None),
     fats: float = Form(None),
@@ -96,17 +103,10 @@ async def create_user_recipe(
         except S3Error as e:
             logger.error(f"Ошибка загрузки в MinIO: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Ошибка загрузки изображения: {str(e)}")
+        # create_recipe мог вернуть уже существующий рецепт, документ которого лежит в кэше
+        await recipe_cache.invalidate(db_recipe.id)
 
-    await db.refresh(db_recipe, attribute_names=["ingredients", "meal_types", "dish_categories", "tags"])
-    for ri in db_recipe.ingredients:
-        await db.refresh(ri, attribute_names=["ingredient"])
-    for mt in db_recipe.meal_types:
-        await db.refresh(mt, attribute_names=["meal_type"])
-    for dc in db_recipe.dish_categories:
-        await db.refresh(dc, attribute_names=["dish_category"])
-    for rt in db_recipe.tags:
-        await db.refresh(rt, attribute_names=["tag"])
-
+    # create_recipe уже вернул рецепт со всеми связями (load_recipe), сессия не сбрасывает их при commit
     return Recipe.from_orm(db_recipe)
 
 @router.put("/{recipe_id}", response_model=Recipe)
@@ -116,7 +116,7 @@ async def update_user_recipe(
     description: str = Form(None),
     steps: str = Form(None),
     total_time: int = Form(None),
-    servings: int = Form(None),
+    servings: int = Form(None, ge=1),
     calories: float = Form(None),
     proteins: float = Form(None),
     fats: float = Form(None),
@@ -179,6 +179,7 @@ async def update_user_recipe(
     if image:
         db_recipe.image_version += 1
         await db.commit()
+        await recipe_cache.invalidate(recipe_id)
     return Recipe.from_orm(db_recipe)
 
 @router.delete("/{recipe_id}", status_code=204)
@@ -203,28 +204,162 @@ async def delete_user_recipe(
         logger.error(f"Error deleting recipe {recipe_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
 
-@router.get("/", response_model=List[Recipe])
+# Плоские схемы для облегченных вариантов списка рецептов
+recipe_summaries_adapter = TypeAdapter(List[RecipeSummary])
+recipe_fields_adapter = TypeAdapter(List[RecipeFields])
+
+# Схема ответа зависит от view и fields: полные рецепты, RecipeSummary или выбранные поля RecipeFields
+@router.get("/", response_model=Union[List[Recipe], List[RecipeSummary], List[RecipeFields]])
 async def read_user_recipes(
+    response: Response,
     show_mealflow: bool = False,
     search: str = "",
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|summary)$", description="summary — краткие данные (схема RecipeSummary)"),
+    fields: Optional[str] = Query(None, description="Поля рецепта через запятую, например title,image_path,total_time"),
     user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
+    """Список рецептов. Курсор следующей страницы возвращается в заголовке X-Next-Cursor.
+
+    view=summary и fields выбирают из БД только нужные колонки, без ингредиентов,
+    типов блюд, категорий и тегов; fields имеет приоритет над view.
+    """
     logger.info(
-        f"Fetching recipes for user_id={user.id}, show_mealflow={show_mealflow}, search={search}, skip={skip}, limit={limit}")
-    recipes = await get_user_recipes(db, user.id, show_mealflow, search, skip, limit)
+        f"Fetching recipes for user_id={user.id}, show_mealflow={show_mealflow}, search={search}, skip={skip}, "
+        f"limit={limit}, cursor={cursor}, view={view}, fields={fields}")
+    if fields:
+        columns = recipe_field_columns(fields)
+    elif view == "summary":
+        columns = RECIPE_SUMMARY_COLUMNS
+    else:
+        columns = None
+    recipes, cursor = await get_user_recipes(db, user.id, show_mealflow, search, skip, limit, cursor, columns)
+    headers = {NEXT_CURSOR_HEADER: cursor} if cursor else {}
+    if fields:
+        body = recipe_fields_adapter.dump_json(recipe_fields_adapter.validate_python(recipes), exclude_unset=True)
+        return Response(content=body, media_type="application/json", headers=headers)
+    if view == "summary":
+        body = recipe_summaries_adapter.dump_json(recipe_summaries_adapter.validate_python(recipes))
+        return Response(content=body, media_type="application/json", headers=headers)
+    response.headers.update(headers)
     return [Recipe.from_orm(r) for r in recipes]
 
+@router.get("/browse", response_model=RecipeBrowse)
+async def browse_user_recipes(
+    response: Response,
+    show_mealflow: bool = False,
+    meal_type_ids: List[int] = Query([]),
+    dish_category_ids: List[int] = Query([]),
+    tag_ids: List[int] = Query([]),
+    max_total_time: Optional[int] = Query(None, ge=0),
+    min_calories: Optional[float] = Query(None, ge=0),
+    max_calories: Optional[float] = Query(None, ge=0),
+    min_proteins: Optional[float] = Query(None, ge=0),
+    max_proteins: Optional[float] = Query(None, ge=0),
+    min_fats: Optional[float] = Query(None, ge=0),
+    max_fats: Optional[float] = Query(None, ge=0),
+    min_carbohydrates: Optional[float] = Query(None, ge=0),
+    max_carbohydrates: Optional[float] = Query(None, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Каталог с фильтрами по типам блюд, категориям, тегам, времени и КБЖУ и счетчиками по фасетам.
+
+    Курсор следующей страницы возвращается в поле next_cursor и в заголовке X-Next-Cursor.
+    """
+    page, cursor = await browse_recipes(
+        db, user.id, show_mealflow,
+        {"meal_types": meal_type_ids, "dish_categories": dish_category_ids, "tags": tag_ids},
+        max_total_time,
+        {
+            "calories": (min_calories, max_calories),
+            "proteins": (min_proteins, max_proteins),
+            "fats": (min_fats, max_fats),
+            "carbohydrates": (min_carbohydrates, max_carbohydrates),
+        },
+        limit, cursor
+    )
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+    return page
+
+@router.post("/import", response_model=RecipeImportReport)
+async def import_recipes_ndjson(
+    request: Request,
+    user_id: Optional[int] = Query(None, description="Владелец рецептов; по умолчанию администратор"),
+    user: User = Depends(ensure_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    """Массовый импорт рецептов из тела запроса в формате NDJSON (application/x-ndjson).
+
+    Тело читается потоком; ошибки отдельных записей возвращаются в отчете по номерам строк.
+    """
+    owner_id = user_id or user.id
+    logger.info(f"Recipe import started by user_id={user.id} for owner_id={owner_id}")
+    return await import_recipes(db, ndjson_lines(request.stream()), owner_id)
+
+@router.get("/export")
+async def export_recipes_stream(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    scope: str = Query("mine", pattern="^(mine|public)$", description="mine — свои рецепты, public — весь общедоступный каталог (только администраторы)"),
+    gzip: bool = True,
+    user: User = Depends(get_current_user)
+):
+    """Выгрузка рецептов файлом NDJSON или CSV, по умолчанию сжатым gzip. Отдается потоком."""
+    if scope == "public" and not user.is_superuser:
+        raise HTTPException(status_code=403, detail="Только администраторы могут выполнять это действие")
+    owner_id = None if scope == "public" else user.id
+    logger.info(f"Recipe export for user_id={user.id}, scope={scope}, format={format}, gzip={gzip}")
+
+    # Сессия из get_db закрывается до начала отправки ответа, поэтому поток
+    # открывает собственную
+    async def chunks():
+        async with async_session() as session:
+            async for chunk in export_recipes(session, owner_id, format, gzip):
+                yield chunk
+
+    return StreamingResponse(
+        chunks(),
+        media_type="application/gzip" if gzip else EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(format, gzip, owner_id)}"'}
+    )
+
+@router.get("/cache-stats")
+async def read_recipe_cache_stats(user: User = Depends(ensure_admin)):
+    """Попадания и промахи кэша документов рецептов и средняя задержка каждого случая."""
+    return recipe_cache.report()
+
+@router.post("/pantry-search", response_model=List[PantryMatch])
+async def search_recipes_by_pantry(
+        data: PantrySearch,
+        user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    logger.info(f"Pantry search for user_id={user.id}, ingredients={data.ingredient_ids}")
+    return await search_by_pantry(db, user.id, data.ingredient_ids, data.min_coverage, data.max_missing, data.limit)
+
+async def reference_response(request: Request, db: AsyncSession, name: str) -> Response:
+    """Доступные записи справочника из общего снимка. ETag — хеш раздела, 304 без тела, если он не изменился."""
+    await reference_snapshot.ensure_fresh(db)
+    section = f"available_{name}"
+    headers = {"ETag": reference_snapshot.etag(section)}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    logger.info(f"Returning {name} from reference snapshot v{reference_snapshot.version}")
+    return Response(content=reference_snapshot.section_bytes(section), media_type="application/json", headers=headers)
+
 @router.get("/ingredients/", response_model=List[Ingredient])
 async def read_available_ingredients(
+        request: Request,
         user: User = Depends(get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
-    ingredients = await get_available_ingredients(db)
-    logger.info(f"Returning ingredients: {[i.__dict__ for i in ingredients]}")
-    return ingredients
+    return await reference_response(request, db, "ingredients")
 
 @router.post("/ingredients/", response_model=Ingredient)
 async def create_new_ingredient(
@@ -232,18 +367,36 @@ async def create_new_ingredient(
         user: User = Depends(ensure_admin),
         db: AsyncSession = Depends(get_db)
 ):
-    db_ingredient = await create_ingredient(db, ingredient.ingredient_name, ingredient.unit, ingredient.is_public)
+    db_ingredient = await create_ingredient(db, ingredient.ingredient_name, ingredient.unit, ingredient.is_public, ingredient.category_id)
     logger.info(f"Created ingredient: {db_ingredient.__dict__}")
     return db_ingredient
 
+@router.get("/ingredient-categories/", response_model=List[IngredientCategorySchema])
+async def read_ingredient_categories(
+        user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    categories = await get_ingredient_categories(db)
+    logger.info(f"Returning {len(categories)} ingredient categories")
+    return categories
+
+@router.post("/ingredient-categories/", response_model=IngredientCategorySchema)
+async def create_new_ingredient_category(
+        category: IngredientCategoryBase,
+        user: User = Depends(ensure_admin),
+        db: AsyncSession = Depends(get_db)
+):
+    db_category = await create_ingredient_category(db, category.name, category.parent_id)
+    logger.info(f"Created ingredient category: {db_category.__dict__}")
+    return db_category
+
 @router.get("/meal-types/", response_model=List[MealTypeSchema])
 async def read_available_meal_types(
+        request: Request,
         user: User = Depends(get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
-    meal_types = await get_available_meal_types(db)
-    logger.info(f"Returning meal types: {[mt.__dict__ for mt in meal_types]}")
-    return meal_types
+    return await reference_response(request, db, "meal_types")
 
 @router.post("/meal-types/", response_model=MealTypeSchema)
 async def create_new_meal_type(
@@ -257,12 +410,11 @@ async def create_new_meal_type(
 
 @router.get("/dish-categories/", response_model=List[DishCategorySchema])
 async def read_available_dish_categories(
+        request: Request,
         user: User = Depends(get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
-    dish_categories = await get_available_dish_categories(db)
-    logger.info(f"Returning dish categories: {[dc.__dict__ for dc in dish_categories]}")
-    return dish_categories
+    return await reference_response(request, db, "dish_categories")
 
 @router.post("/dish-categories/", response_model=DishCategorySchema)
 async def create_new_dish_category(
@@ -276,12 +428,11 @@ async def create_new_dish_category(
 
 @router.get("/tags/", response_model=List[TagSchema])
 async def read_available_tags(
+        request: Request,
         user: User = Depends(get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
-    tags = await get_available_tags(db)
-    logger.info(f"Returning tags: {[t.__dict__ for t in tags]}")
-    return tags
+    return await reference_response(request, db, "tags")
 
 @router.post("/tags/", response_model=TagSchema)
 async def create_new_tag(
@@ -373,20 +524,25 @@ async def read_recipe_by_id(
     user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(
-        select(RecipeModel)
-        .options(
-            joinedload(RecipeModel.ingredients).joinedload(RecipeIngredient.ingredient),
-            joinedload(RecipeModel.meal_types).joinedload(RecipeMealType.meal_type),
-            joinedload(RecipeModel.dish_categories).joinedload(RecipeDishCategory.dish_category),
-            joinedload(RecipeModel.tags).joinedload(RecipeTag.tag)
+    """Рецепт из кэша документов; источник ответа — в заголовке X-Cache (local, shared или miss)."""
+    async def load():
+        result = await db.execute(
+            select(RecipeModel).options(*RECIPE_DETAIL_OPTIONS).filter(RecipeModel.id == recipe_id)
         )
-        .filter(
-            (RecipeModel.id == recipe_id) &
-            ((RecipeModel.user_id == user.id) | (RecipeModel.is_public == True))
+        recipe = result.scalars().first()
+        if not recipe:
+            return None
+        return CachedRecipe(Recipe.from_orm(recipe).model_dump_json().encode(), recipe.user_id, bool(recipe.is_public))
+
+    recipe, source = await recipe_cache.get_or_load(recipe_id, load)
+    if recipe and source == "local" and recipe_cache.shared is None:
+        # Без общего уровня запись в другом воркере не сбрасывает здешний документ,
+        # поэтому владелец и видимость перед отдачей берутся из БД
+        result = await db.execute(
+            select(RecipeModel.user_id, RecipeModel.is_public).filter(RecipeModel.id == recipe_id)
         )
-    )
-    recipe = result.scalars().first()
-    if not recipe:
+        row = result.first()
+        recipe = CachedRecipe(recipe.body, row.user_id, bool(row.is_public)) if row else None
+    if not recipe or not (recipe.user_id == user.id or recipe.is_public):
         raise HTTPException(status_code=404, detail="Рецепт не найден или недоступен")
-    return Recipe.from_orm(recipe)
+    return Response(content=recipe.body, media_type="application/json", headers={"X-Cache": source})
@@ -1,6 +1,9 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, conint, model_validator
 from typing import List, Optional
 
+# Сколько ингредиентов можно передать в поиск по имеющимся продуктам
+MAX_PANTRY_INGREDIENTS = 200
+
 class MealTypeBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=50)
     description: Optional[str] = None
@@ -23,6 +26,16 @@ class DishCategory(DishCategoryBase):
     class Config:
         from_attributes = True
 
+class IngredientCategoryBase(BaseModel):
+    name: str = Field(..., min_length=1, max_length=50)
+    parent_id: Optional[int] = Field(None, gt=0, description="Родительская категория")
+
+class IngredientCategory(IngredientCategoryBase):
+    id: int
+
+    class Config:
+        from_attributes = True
+
 class TagBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=50)
     is_active: Optional[bool] = True
@@ -103,12 +116,44 @@ class RecipeCreate(RecipeBase):
     dish_category_ids: List[int] = Field(default=[])
     tag_ids: List[int] = Field(default=[])
 
+class RecipeImportIngredient(BaseModel):
+    """Ингредиент импортируемого рецепта: по ID или по названию из справочника.
+
+    Если указано и то и другое (как в выгрузке), используется название — оно
+    не зависит от нумерации справочника в конкретной базе.
+    """
+    ingredient_id: Optional[int] = Field(None, gt=0)
+    ingredient_name: Optional[str] = Field(None, min_length=1, max_length=100)
+    amount: float = Field(..., gt=0)
+
+    @model_validator(mode="after")
+    def check_reference(self):
+        if self.ingredient_id is None and self.ingredient_name is None:
+            raise ValueError("Укажите ingredient_id или ingredient_name")
+        return self
+
+class RecipeImport(RecipeCreate):
+    ingredients: List[RecipeImportIngredient]
+
+class RecipeImportError(BaseModel):
+    line: int
+    error: str
+
+class RecipeImportReport(BaseModel):
+    total: int
+    imported: int
+    skipped: int = Field(..., description="Рецепты с уже существующим у владельца названием")
+    failed: int
+    errors: List[RecipeImportError]
+    elapsed_seconds: float
+    records_per_second: float
+
 class RecipeUpdate(BaseModel):
     title: Optional[str] = Field(None, min_length=1, max_length=100)
     description: Optional[str] = None
     steps: Optional[List[Step]] = None
     total_time: Optional[int] = None
-    servings: Optional[int] = None
+    servings: Optional[int] = Field(None, ge=1)
     calories: Optional[float] = None
     proteins: Optional[float] = None
     fats: Optional[float] = None
@@ -136,13 +181,76 @@ class Recipe(RecipeBase):
     class Config:
         from_attributes = True
 
+class RecipeSummary(BaseModel):
+    """Краткие данные рецепта для отображения в списках и меню."""
+    id: int
+    title: str
+    image_path: Optional[str] = None
+    image_version: int = 0
+    total_time: int
+    servings: int
+    calories: Optional[float] = None
+    proteins: Optional[float] = None
+    fats: Optional[float] = None
+    carbohydrates: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
+class RecipeFields(BaseModel):
+    """Выбранные поля рецепта (параметр fields списка рецептов). Невыбранные поля в ответ не попадают."""
+    id: int
+    title: Optional[str] = None
+    description: Optional[str] = None
+    steps: Optional[List[Step]] = None
+    total_time: Optional[int] = None
+    servings: Optional[int] = None
+    calories: Optional[float] = None
+    proteins: Optional[float] = None
+    fats: Optional[float] = None
+    carbohydrates: Optional[float] = None
+    image_path: Optional[str] = None
+    image_version: Optional[int] = None
+    user_id: Optional[int] = None
+    is_public: Optional[bool] = None
+
+class FacetCount(BaseModel):
+    id: int
+    count: int
+
+class RecipeFacets(BaseModel):
+    meal_types: List[FacetCount]
+    dish_categories: List[FacetCount]
+    tags: List[FacetCount]
+
+class RecipeBrowse(BaseModel):
+    total: int = Field(..., description="Число рецептов, подходящих под все фильтры")
+    items: List[RecipeSummary]
+    facets: RecipeFacets
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы; нет на последней странице")
+
 class IngredientBase(BaseModel):
     ingredient_name: str = Field(..., min_length=1, max_length=100)
     unit: str = Field(default="г", max_length=20)
     is_public: Optional[bool] = False
+    category_id: Optional[int] = Field(None, gt=0)
 
 class Ingredient(IngredientBase):
     id: int
 
     class Config:
         from_attributes = True
+
+class PantrySearch(BaseModel):
+    ingredient_ids: List[conint(gt=0)] = Field(..., min_length=1, max_length=MAX_PANTRY_INGREDIENTS,
+                                               description="Ингредиенты, которые есть у пользователя")
+    min_coverage: float = Field(0.0, ge=0, le=1, description="Минимальная доля имеющихся ингредиентов рецепта")
+    max_missing: Optional[int] = Field(None, ge=0, description="Максимальное число недостающих ингредиентов")
+    limit: int = Field(20, ge=1, le=100)
+
+class PantryMatch(BaseModel):
+    recipe: RecipeSummary
+    coverage: float = Field(..., description="Доля ингредиентов рецепта, которые есть у пользователя")
+    matched: int
+    total: int
+    missing_ingredients: List[Ingredient]
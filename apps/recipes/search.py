@@ -0,0 +1,108 @@
+"""Полнотекстовый поиск рецептов.
+
+Колонка recipes.search_vector поддерживается триггерами PostgreSQL и содержит
+название (вес A), ингредиенты (B), описание (C) и текст шагов (D). Поиск идет
+по GIN-индексу, а для опечаток добавлено нечеткое совпадение по названию через
+pg_trgm, тоже по GIN-индексу.
+"""
+from typing import Optional, Sequence
+
+from sqlalchemy import DDL, cast, event, func, literal, tuple_
+from sqlalchemy.dialects.postgresql import REGCONFIG
+
+from apps.recipes.models import Recipe, RecipeIngredient
+
+SEARCH_CONFIG = "russian"
+
+CREATE_TRGM_EXTENSION = "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+
+# Каждая строка списков — отдельная команда: asyncpg не выполняет несколько команд за раз
+CREATE_SEARCH_FUNCTIONS = [
+    f"""
+CREATE OR REPLACE FUNCTION recipes_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+            SELECT string_agg(i.ingredient_name, ' ')
+            FROM recipe_ingredients ri JOIN ingredients i ON i.id = ri.ingredient_id
+            WHERE ri.recipe_id = NEW.id
+        ), '')), 'B') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.description, '')), 'C') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(CASE WHEN json_typeof(NEW.steps) = 'array' THEN (
+            SELECT string_agg(step ->> 'description', ' ') FROM json_array_elements(NEW.steps) AS step
+        ) END, '')), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+""",
+    """
+CREATE OR REPLACE FUNCTION recipe_ingredients_search_refresh() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE recipes SET title = title WHERE id IN (SELECT recipe_id FROM new_rows);
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE recipes SET title = title WHERE id IN (SELECT recipe_id FROM old_rows);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""",
+    """
+CREATE OR REPLACE FUNCTION ingredients_search_refresh() RETURNS trigger AS $$
+BEGIN
+    UPDATE recipes SET title = title
+    WHERE id IN (SELECT recipe_id FROM recipe_ingredients WHERE ingredient_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""",
+]
+
+# Изменения ингредиентов рецепта обрабатываются триггерами уровня оператора,
+# чтобы вектор пересчитывался один раз на рецепт, а не на каждую строку
+CREATE_SEARCH_TRIGGERS = [
+    """CREATE TRIGGER recipes_search_vector
+    BEFORE INSERT OR UPDATE OF title, description, steps ON recipes
+    FOR EACH ROW EXECUTE FUNCTION recipes_search_vector_update()""",
+    """CREATE TRIGGER recipe_ingredients_search_insert
+    AFTER INSERT ON recipe_ingredients REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredients_search_refresh()""",
+    """CREATE TRIGGER recipe_ingredients_search_update
+    AFTER UPDATE ON recipe_ingredients REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredients_search_refresh()""",
+    """CREATE TRIGGER recipe_ingredients_search_delete
+    AFTER DELETE ON recipe_ingredients REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredients_search_refresh()""",
+    """CREATE TRIGGER ingredients_search_refresh
+    AFTER UPDATE OF ingredient_name ON ingredients
+    FOR EACH ROW WHEN (OLD.ingredient_name IS DISTINCT FROM NEW.ingredient_name)
+    EXECUTE FUNCTION ingredients_search_refresh()""",
+]
+
+# Для новой БД, создаваемой через Base.metadata.create_all. Существующие БД
+# получают то же самое миграцией. Триггеры создаются вместе с recipe_ingredients,
+# к этому моменту таблицы recipes и ingredients уже есть.
+event.listen(Recipe.__table__, "before_create", DDL(CREATE_TRGM_EXTENSION).execute_if(dialect="postgresql"))
+for statement in CREATE_SEARCH_FUNCTIONS + CREATE_SEARCH_TRIGGERS:
+    event.listen(RecipeIngredient.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+def apply_search(query, search: str, after: Optional[Sequence] = None):
+    """Фильтр и сортировка по релевантности: сначала совпадения полнотекстового
+    поиска по ts_rank, затем названия, похожие на запрос с учетом опечаток.
+
+    К выборке добавляются колонки rank и similarity — вместе с Recipe.id они
+    образуют ключ курсора; after — этот ключ у последней строки предыдущей страницы.
+    """
+    ts_query = func.websearch_to_tsquery(cast(SEARCH_CONFIG, REGCONFIG), search)
+    matches = Recipe.search_vector.op("@@")(ts_query)
+    # title %> search — word_similarity(search, title) выше порога pg_trgm
+    similar = Recipe.title.op("%>")(literal(search))
+    rank = func.ts_rank(Recipe.search_vector, ts_query)
+    similarity = func.word_similarity(search, Recipe.title)
+    query = query.add_columns(rank.label("rank"), similarity.label("similarity")).filter(matches | similar)
+    if after is not None:
+        query = query.filter(tuple_(rank, similarity, Recipe.id) < tuple_(*after))
+    return query.order_by(rank.desc(), similarity.desc(), Recipe.id.desc())
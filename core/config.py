@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import tempfile
 
 load_dotenv()
 
@@ -25,5 +26,25 @@ class Config:
         self.BASE_URL = os.getenv("BASE_URL",
                                   default="http://192.168.1.174:8000")
 
+        # Предварительная генерация меню на следующую неделю
+        self.MEAL_PLAN_PRECOMPUTE_ENABLED = os.getenv("MEAL_PLAN_PRECOMPUTE_ENABLED", "false").lower() == "true"
+        # Часы низкой нагрузки (UTC), в которые работает генерация: "начало-конец"
+        self.MEAL_PLAN_PRECOMPUTE_HOURS = os.getenv("MEAL_PLAN_PRECOMPUTE_HOURS", "1-5")
+        self.MEAL_PLAN_PRECOMPUTE_CONCURRENCY = int(os.getenv("MEAL_PLAN_PRECOMPUTE_CONCURRENCY", "2"))
+
+        # Кэш документов рецептов: размер LRU воркера, время жизни записи и
+        # необязательный общий уровень ("memory" или redis://...)
+        self.RECIPE_CACHE_SIZE = int(os.getenv("RECIPE_CACHE_SIZE", "5000"))
+        self.RECIPE_CACHE_TTL_SECONDS = int(os.getenv("RECIPE_CACHE_TTL_SECONDS", "300"))
+        self.RECIPE_CACHE_SHARED_URL = os.getenv("RECIPE_CACHE_SHARED_URL", "")
+
+        # Снимок справочников, общий для воркеров: файл в разделяемой памяти и
+        # интервал, после которого он перечитывается из БД
+        self.REFERENCE_SNAPSHOT_PATH = os.getenv(
+            "REFERENCE_SNAPSHOT_PATH",
+            os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "mealflow-reference.bin")
+        )
+        self.REFERENCE_MAX_AGE_SECONDS = int(os.getenv("REFERENCE_MAX_AGE_SECONDS", "300"))
+
 
 config = Config()
\ No newline at end of file
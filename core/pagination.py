@@ -0,0 +1,44 @@
+"""Курсоры для постраничной выборки по ключу (keyset pagination).
+
+Курсор — значения ключа сортировки последней строки страницы, упакованные в
+непрозрачную для клиента строку. Следующая страница выбирается условием
+«ключ строго после курсора», поэтому ее стоимость не зависит от глубины, а
+вставка новых строк не сдвигает уже полученные.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional
+
+from fastapi import HTTPException
+
+# Заголовок ответа с курсором следующей страницы; отсутствует на последней странице
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values: Any) -> str:
+    payload = [{"dt": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Значения ключа из курсора. Ошибка 400, если курсор поврежден или от другого списка."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(payload, list) or len(payload) != size:
+            raise ValueError(cursor)
+        return [datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v for v in payload]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+
+def next_cursor(rows: list, limit: int, *key) -> Optional[str]:
+    """Курсор после последней строки, если страница заполнена целиком.
+
+    key — функции, извлекающие из строки значения ключа сортировки.
+    """
+    if limit <= 0 or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(*(get(last) for get in key))
@@ -1,5 +1,6 @@
 from fastapi import FastAPI
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+import asyncio
 from apps.auth.routes import router as auth_router
 from apps.parser.routes import router as parser_router
 from apps.news.routes import router as news_router
@@ -8,12 +9,26 @@ from apps.admin import init_admin
 from core.database import Base, engine
 from starlette.middleware.sessions import SessionMiddleware
 from apps.meal_planner.routes import router as meal_planner_router
+from apps.meal_planner.index import candidate_index
+from apps.meal_planner.scheduler import run_scheduler
+from core.config import config
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # Индекс кандидатов планировщика строится в фоне, до его готовности
+    # кандидаты выбираются запросом к БД
+    candidate_index.schedule_rebuild()
+    precompute_task = None
+    if config.MEAL_PLAN_PRECOMPUTE_ENABLED:
+        precompute_task = asyncio.create_task(run_scheduler())
     yield
+    if precompute_task:
+        precompute_task.cancel()
+        # Дожидаемся отмены, чтобы проход не обращался к БД после engine.dispose()
+        with suppress(asyncio.CancelledError):
+            await precompute_task
     await engine.dispose()
 
 app = FastAPI(title="My Awesome Project", lifespan=lifespan)
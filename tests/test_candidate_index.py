@@ -0,0 +1,52 @@
+from apps.meal_planner.index import CandidateIndex, ingredient_ids_from_mask, ingredient_mask
+
+BREAKFAST, DINNER = 1, 2
+
+
+def make_index() -> CandidateIndex:
+    # Рецепты 1, 2 — общедоступные, 3 — личный пользователя 10, 4 — личный пользователя 20
+    return CandidateIndex.from_snapshot({
+        "owners": {1: 99, 2: 99, 3: 10, 4: 20},
+        "public": {1, 2},
+        "by_user": {99: {1, 2}, 10: {3}, 20: {4}},
+        "meal_type_pools": {BREAKFAST: {1, 3, 4}, DINNER: {2, 3}},
+        "recipe_meal_types": {1: {BREAKFAST}, 2: {DINNER}, 3: {BREAKFAST, DINNER}, 4: {BREAKFAST}},
+        "ingredient_bits": {1: ingredient_mask([5]), 2: ingredient_mask([6, 7]), 3: ingredient_mask([7]), 4: 0},
+        "nutrition": {},
+    })
+
+
+def test_ingredient_mask_round_trip():
+    assert ingredient_mask([]) == 0
+    assert sorted(ingredient_ids_from_mask(ingredient_mask([0, 3, 64, 200]))) == [0, 3, 64, 200]
+
+
+def test_candidates_by_recipe_source():
+    index = make_index()
+    assert index.candidates(10, "both", []) == {BREAKFAST: {1, 3}, DINNER: {2, 3}}
+    assert index.candidates(10, "mine", []) == {BREAKFAST: {3}, DINNER: {3}}
+    assert index.candidates(10, "mealflow", []) == {BREAKFAST: {1}, DINNER: {2}}
+
+
+def test_candidates_hide_other_users_private_recipes():
+    index = make_index()
+    assert index.candidates(20, "both", []) == {BREAKFAST: {1, 4}, DINNER: {2}}
+    assert index.candidates(30, "mine", []) == {BREAKFAST: set(), DINNER: set()}
+
+
+def test_candidates_drop_recipes_with_excluded_ingredients():
+    index = make_index()
+    assert index.candidates(10, "both", [7]) == {BREAKFAST: {1}, DINNER: set()}
+    assert index.candidates(10, "both", [5, 8]) == {BREAKFAST: {3}, DINNER: {2, 3}}
+
+
+def test_candidates_ignore_unknown_excluded_ingredients():
+    index = make_index()
+    assert index.candidates(10, "both", [10 ** 9]) == index.candidates(10, "both", [])
+    assert index.candidates(10, "both", [7, 10 ** 9]) == {BREAKFAST: {1}, DINNER: set()}
+
+
+def test_candidates_follow_discard():
+    index = make_index()
+    index.discard(3)
+    assert index.candidates(10, "both", []) == {BREAKFAST: {1}, DINNER: {2}}
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from core.pagination import decode_cursor, encode_cursor, next_cursor
+
+
+@pytest.mark.parametrize("values", [
+    (42,),
+    (0.8125, 0.5, 17),
+    (datetime(2026, 10, 17, 12, 30, 5, 123456), 9),
+    ("строка с пробелами", None, -1),
+])
+def test_cursor_round_trip(values):
+    cursor = encode_cursor(*values)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, len(values)) == list(values)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", encode_cursor(1, 2), encode_cursor(1)[:-2], "eyJhIjoxfQ"])
+def test_decode_rejects_damaged_or_foreign_cursor(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 3)
+    assert error.value.status_code == 400
+
+
+def test_next_cursor_only_for_full_page():
+    rows = [{"id": 1}, {"id": 2}]
+    key = lambda row: row["id"]
+    assert next_cursor(rows, 3, key) is None
+    assert next_cursor(rows, 0, key) is None
+    assert decode_cursor(next_cursor(rows, 2, key), 1) == [2]
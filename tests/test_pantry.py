@@ -0,0 +1,57 @@
+from apps.meal_planner.index import CandidateIndex, ingredient_mask
+from apps.recipes.pantry import PantryIndex
+
+# recipe_id -> ингредиенты; рецепты 1..5 общедоступные, 6 — личный пользователя 10
+RECIPES = {
+    1: [1, 2],
+    2: [1, 2, 3, 4],
+    3: [1, 5],
+    4: [2, 3, 6],
+    5: [7],
+    6: [1, 2, 8],
+}
+
+
+def make_pantry() -> PantryIndex:
+    index = CandidateIndex.from_snapshot({
+        "owners": {recipe_id: 10 if recipe_id == 6 else 99 for recipe_id in RECIPES},
+        "public": {1, 2, 3, 4, 5},
+        "by_user": {99: {1, 2, 3, 4, 5}, 10: {6}},
+        "meal_type_pools": {},
+        "recipe_meal_types": {},
+        "ingredient_bits": {recipe_id: ingredient_mask(ids) for recipe_id, ids in RECIPES.items()},
+        "nutrition": {},
+    })
+    return PantryIndex(index)
+
+
+def test_search_orders_by_coverage_then_missing_then_id():
+    results = make_pantry().search(20, [1, 2, 3])
+    assert [r["recipe_id"] for r in results] == [1, 2, 4, 3]
+    assert [(r["matched"], r["total"]) for r in results] == [(2, 2), (3, 4), (2, 3), (1, 2)]
+    assert [r["coverage"] for r in results] == [1.0, 0.75, 0.667, 0.5]
+    assert results[1]["missing_ingredient_ids"] == [4]
+
+
+def test_search_skips_recipes_without_matches():
+    assert [r["recipe_id"] for r in make_pantry().search(20, [7])] == [5]
+    assert make_pantry().search(20, [42]) == []
+
+
+def test_search_includes_own_private_recipes():
+    assert 6 not in {r["recipe_id"] for r in make_pantry().search(20, [1, 2])}
+    results = make_pantry().search(10, [1, 2])
+    assert [r["recipe_id"] for r in results[:2]] == [1, 6]
+
+
+def test_search_filters_and_limit():
+    pantry = make_pantry()
+    assert [r["recipe_id"] for r in pantry.search(20, [1, 2, 3], min_coverage=0.7)] == [1, 2]
+    assert [r["recipe_id"] for r in pantry.search(20, [1, 2, 3], max_missing=0)] == [1]
+    assert [r["recipe_id"] for r in pantry.search(20, [1, 2, 3], limit=2)] == [1, 2]
+
+
+def test_search_ignores_unknown_and_huge_ids():
+    pantry = make_pantry()
+    assert pantry.search(20, [1, 2, 3, 10 ** 9]) == pantry.search(20, [1, 2, 3])
+    assert pantry.search(20, [10 ** 9]) == []
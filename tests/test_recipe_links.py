@@ -0,0 +1,42 @@
+from apps.auth import models as auth_models  # noqa: F401 — модель User нужна для связей Recipe
+from apps.recipes.crud import diff_links
+
+KEY, FIELDS = "ingredient_id", ("amount",)
+
+
+def link(row_id, ingredient_id, amount):
+    return {"id": row_id, "ingredient_id": ingredient_id, "amount": amount}
+
+
+def test_unchanged_links_produce_no_writes():
+    current = [link(1, 10, 100.0), link(2, 20, 5.0)]
+    desired = [{"ingredient_id": 20, "amount": 5.0}, {"ingredient_id": 10, "amount": 100.0}]
+    assert diff_links(current, desired, KEY, FIELDS) == ([], [], [])
+
+
+def test_changed_amount_updates_row_in_place():
+    current = [link(1, 10, 100.0), link(2, 20, 5.0)]
+    desired = [{"ingredient_id": 10, "amount": 150.0}, {"ingredient_id": 20, "amount": 5.0}]
+    assert diff_links(current, desired, KEY, FIELDS) == ([], [{"id": 1, "amount": 150.0}], [])
+
+
+def test_added_and_removed_links():
+    current = [link(1, 10, 100.0), link(2, 20, 5.0)]
+    desired = [{"ingredient_id": 10, "amount": 100.0}, {"ingredient_id": 30, "amount": 1.0}]
+    assert diff_links(current, desired, KEY, FIELDS) == ([{"ingredient_id": 30, "amount": 1.0}], [], [2])
+
+
+def test_duplicate_keys_are_matched_as_multiset():
+    # Один ингредиент дважды: совпадающая по amount строка сохраняется, лишняя удаляется
+    current = [link(1, 10, 100.0), link(2, 10, 50.0), link(3, 10, 25.0)]
+    desired = [{"ingredient_id": 10, "amount": 50.0}, {"ingredient_id": 10, "amount": 75.0}]
+    inserts, updates, delete_ids = diff_links(current, desired, KEY, FIELDS)
+    assert inserts == []
+    assert updates == [{"id": 1, "amount": 75.0}]
+    assert delete_ids == [3]
+
+
+def test_links_without_fields():
+    current = [{"id": 1, "tag_id": 1}, {"id": 2, "tag_id": 2}]
+    desired = [{"tag_id": 2}, {"tag_id": 3}]
+    assert diff_links(current, desired, "tag_id", ()) == ([{"tag_id": 3}], [], [1])
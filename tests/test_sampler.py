@@ -0,0 +1,63 @@
+import random
+from collections import Counter
+from datetime import date, timedelta
+
+import pytest
+
+from apps.meal_planner.sampler import FAVORITE_WEIGHT, RECENT_WEIGHT, AliasTable, PlanSampler, recipe_weights
+
+DATES = [date(2026, 10, 19) + timedelta(days=day) for day in range(14)]
+BREAKFAST, DINNER = 1, 2
+
+
+def test_alias_table_follows_weights():
+    table = AliasTable([1, 2, 3], [1.0, 2.0, 7.0])
+    rng = random.Random(42)
+    counts = Counter(table.draw(rng) for _ in range(100_000))
+    assert counts[1] / 100_000 == pytest.approx(0.1, abs=0.01)
+    assert counts[2] / 100_000 == pytest.approx(0.2, abs=0.01)
+    assert counts[3] / 100_000 == pytest.approx(0.7, abs=0.01)
+
+
+def test_alias_table_with_zero_weights_is_uniform():
+    table = AliasTable([1, 2], [0.0, 0.0])
+    rng = random.Random(1)
+    counts = Counter(table.draw(rng) for _ in range(10_000))
+    assert counts[1] / 10_000 == pytest.approx(0.5, abs=0.03)
+
+
+def test_alias_table_rejects_empty_pool():
+    with pytest.raises(ValueError):
+        AliasTable([], [])
+
+
+def test_recipe_weights():
+    weights = recipe_weights([1, 2], {2: 1, 3: 2})
+    assert weights == {1: FAVORITE_WEIGHT, 2: FAVORITE_WEIGHT * RECENT_WEIGHT, 3: RECENT_WEIGHT ** 2}
+
+
+def test_fill_does_not_repeat_within_window():
+    sampler = PlanSampler({BREAKFAST: [1, 2, 3, 4], DINNER: [3, 4, 5, 6]}, no_repeat_days=1, seed=5)
+    plan = sampler.fill(DATES)
+    for day, cells in plan.items():
+        # Внутри дня рецепты не повторяются, и ни один не стоит в соседний день
+        assert len(set(cells.values())) == len(cells)
+        neighbours = set(plan.get(day - timedelta(days=1), {}).values())
+        assert not neighbours & set(cells.values())
+
+
+def test_fill_respects_history_around_filled_days():
+    sampler = PlanSampler({BREAKFAST: [1, 2, 3]}, no_repeat_days=1, seed=0)
+    history = {DATES[0]: {BREAKFAST: 1}, DATES[2]: {BREAKFAST: 2}}
+    plan = sampler.fill([DATES[1]], history)
+    assert plan == {DATES[1]: {BREAKFAST: 3}}
+
+
+def test_fill_repeats_when_pool_is_too_small():
+    sampler = PlanSampler({BREAKFAST: [1]}, no_repeat_days=3, seed=0)
+    assert all(cells == {BREAKFAST: 1} for cells in sampler.fill(DATES[:3]).values())
+
+
+def test_draw_prefers_unblocked_recipes_even_with_low_weight():
+    sampler = PlanSampler({BREAKFAST: [1, 2]}, {1: 1000.0, 2: 0.001}, seed=0)
+    assert all(sampler.draw(BREAKFAST, {1}) == 2 for _ in range(50))
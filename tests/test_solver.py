@@ -0,0 +1,79 @@
+from datetime import date, timedelta
+
+from apps.meal_planner.solver import TOP_K, choose_plan, has_targets
+
+DATES = [date(2026, 10, 19) + timedelta(days=day) for day in range(5)]
+BREAKFAST, DINNER = 1, 2
+
+
+def nutrition_row(calories, proteins=10.0, fats=10.0, carbohydrates=10.0, total_time=30):
+    return calories, proteins, fats, carbohydrates, total_time
+
+
+def test_has_targets():
+    assert not has_targets(None)
+    assert not has_targets({"calories": None, "proteins": None})
+    assert has_targets({"calories": 2000})
+    assert has_targets(None, max_total_time=60)
+
+
+def test_without_targets_fills_every_cell_from_its_pool():
+    mt_recipes = {BREAKFAST: [1, 2, 3], DINNER: [4, 5, 6], 3: []}
+    plan = choose_plan(DATES, mt_recipes, seed=7)
+    assert list(plan) == DATES
+    for cells in plan.values():
+        assert set(cells) == {BREAKFAST, DINNER}
+        assert cells[BREAKFAST] in mt_recipes[BREAKFAST]
+        assert cells[DINNER] in mt_recipes[DINNER]
+
+
+def test_same_seed_gives_same_plan():
+    mt_recipes = {BREAKFAST: list(range(1, 20)), DINNER: list(range(20, 40))}
+    nutrition = {r: nutrition_row(r * 50) for r in range(1, 40)}
+    targets = {"calories": 2000}
+    assert choose_plan(DATES, mt_recipes, seed=3) == choose_plan(DATES, mt_recipes, seed=3)
+    assert (choose_plan(DATES, mt_recipes, nutrition, targets, seed=3)
+            == choose_plan(DATES, mt_recipes, nutrition, targets, seed=3))
+
+
+def test_calorie_target_keeps_picks_among_closest_recipes():
+    # Калорийность рецепта r — 100 * r; ближе всего к цели 1000 рецепты 8..12
+    recipe_ids = list(range(1, 21))
+    nutrition = {r: nutrition_row(100 * r) for r in recipe_ids}
+    plan = choose_plan(DATES, {BREAKFAST: recipe_ids}, nutrition, {"calories": 1000}, seed=1)
+    closest = set(sorted(recipe_ids, key=lambda r: abs(100 * r - 1000))[:TOP_K])
+    assert {cells[BREAKFAST] for cells in plan.values()} <= closest
+
+
+def test_time_limit_avoids_slow_recipes():
+    recipe_ids = list(range(1, 11))
+    # Рецепты 1..5 готовятся 20 минут, 6..10 — 200 минут
+    nutrition = {r: nutrition_row(500, total_time=20 if r <= 5 else 200) for r in recipe_ids}
+    plan = choose_plan(DATES, {BREAKFAST: recipe_ids}, nutrition, max_total_time=60, seed=2)
+    assert all(cells[BREAKFAST] <= 5 for cells in plan.values())
+
+
+def test_recipes_without_nutrition_are_skipped():
+    nutrition = {1: nutrition_row(500)}
+    plan = choose_plan(DATES, {BREAKFAST: [1, 2], DINNER: [3]}, nutrition, {"calories": 500}, seed=0)
+    assert all(cells == {BREAKFAST: 1} for cells in plan.values())
+
+
+def test_targets_respect_no_repeat_window_and_history():
+    recipe_ids = list(range(1, 21))
+    nutrition = {r: nutrition_row(100 * r) for r in recipe_ids}
+    history = {DATES[0] - timedelta(days=1): {BREAKFAST: 10}}
+    plan = choose_plan(DATES, {BREAKFAST: recipe_ids}, nutrition, {"calories": 1000},
+                       no_repeat_days=1, seed=4, history=history)
+    picks = [plan[day][BREAKFAST] for day in DATES]
+    assert picks[0] != 10
+    assert all(a != b for a, b in zip(picks, picks[1:]))
+
+
+def test_targets_penalize_recent_recipes():
+    # Все рецепты одинаково близки к цели, но 1..5 недавно стояли в плане
+    recipe_ids = list(range(1, 11))
+    nutrition = {r: nutrition_row(1000) for r in recipe_ids}
+    plan = choose_plan(DATES, {BREAKFAST: recipe_ids}, nutrition, {"calories": 1000},
+                       weights={r: 0.5 for r in range(1, 6)}, no_repeat_days=0, seed=0)
+    assert all(cells[BREAKFAST] > 5 for cells in plan.values())
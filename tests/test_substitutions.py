@@ -0,0 +1,69 @@
+import asyncio
+
+import numpy as np
+
+from apps.meal_planner.index import CandidateIndex
+from apps.meal_planner.substitutions import SubstitutionIndex, build_similarity
+
+BUTTER, OIL, FLOUR, SUGAR, EGG, SALT = 1, 2, 3, 4, 5, 6
+
+# Масло и растительное масло встречаются с мукой и сахаром, но не друг с другом
+RECIPES = {
+    1: [BUTTER, FLOUR, SUGAR],
+    2: [BUTTER, FLOUR],
+    3: [BUTTER, SUGAR],
+    4: [OIL, FLOUR, SUGAR],
+    5: [OIL, FLOUR],
+    6: [OIL, SUGAR],
+    7: [EGG, SALT],
+    8: [EGG, FLOUR, SALT],
+}
+
+
+def postings() -> dict:
+    result = {}
+    for recipe_id, ingredient_ids in RECIPES.items():
+        for ingredient_id in ingredient_ids:
+            result.setdefault(ingredient_id, []).append(recipe_id)
+    result[99] = []
+    return result
+
+
+def test_build_similarity_shapes_and_counts():
+    ingredient_ids, context, cooccurrence, counts = build_similarity(postings())
+    # Ингредиенты без рецептов отбрасываются, порядок строк — по возрастанию id
+    assert ingredient_ids.tolist() == [BUTTER, OIL, FLOUR, SUGAR, EGG, SALT]
+    assert counts.tolist() == [3, 3, 5, 4, 2, 2]
+    assert context.shape == cooccurrence.shape == (6, 6)
+
+
+def test_cooccurrence_is_symmetric_with_zero_diagonal():
+    ingredient_ids, _, cooccurrence, _ = build_similarity(postings())
+    dense = cooccurrence.toarray()
+    position = {int(i): p for p, i in enumerate(ingredient_ids)}
+    assert np.array_equal(dense, dense.T)
+    assert not dense.diagonal().any()
+    assert dense[position[BUTTER], position[FLOUR]] == 2
+    assert dense[position[FLOUR], position[SUGAR]] == 2
+    assert dense[position[BUTTER], position[OIL]] == 0
+
+
+def test_context_rows_are_unit_length_and_close_for_substitutes():
+    ingredient_ids, context, _, _ = build_similarity(postings())
+    position = {int(i): p for p, i in enumerate(ingredient_ids)}
+    norms = np.sqrt(np.asarray(context.multiply(context).sum(axis=1)).ravel())
+    assert np.allclose(norms[norms > 0], 1)
+    similarity = (context @ context.T).toarray()
+    assert similarity[position[BUTTER], position[OIL]] > similarity[position[BUTTER], position[EGG]]
+    assert similarity[position[BUTTER], position[OIL]] > similarity[position[BUTTER], position[FLOUR]]
+
+
+def test_suggest_prefers_ingredient_with_same_context():
+    index = CandidateIndex()
+    index._ingredient_recipes = {i: set(recipes) for i, recipes in postings().items()}
+    substitutions = SubstitutionIndex(index)
+    asyncio.run(substitutions.ensure_fresh())
+    suggestions = substitutions.suggest(BUTTER)
+    assert suggestions[0][0] == OIL
+    assert BUTTER not in {i for i, _ in suggestions}
+    assert OIL not in {i for i, _ in substitutions.suggest(BUTTER, exclude=[OIL])}